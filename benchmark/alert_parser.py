@@ -0,0 +1,83 @@
+"""
+Alert decoding throughput: the old fixed slice + code tuples vs AlertParser.
+
+Pass a corpus of recorded snippets (one per line) with --corpus, otherwise
+TradingView style snippets are synthesized, including codes shifted off the
+old [36:42] offset which the slice silently misses.
+
+    python -m benchmark.alert_parser --corpus snippets.txt --repeat 5
+"""
+import time
+import random
+import argparse
+from cloud_services.alert_parser import AlertParser
+
+CALL_CODES = ('CALL5-', 'CALL15', 'CALL30', 'CALL1H', 'CALL2H', 'CALL4H', 'C5----', 'C15---', 'C30---', 'C1H---', 'C2H---', 'C4H---')
+PUT_CODES = ('PUT5--', 'PUT15-', 'PUT30-', 'PUT1H-', 'PUT2H-', 'PUT4H-', 'P5----', 'P15---', 'P30---', 'P1H---', 'P2H---', 'P4H---')
+
+
+def legacy_side(snippet):
+    """
+    The decoding Gmail used before AlertParser.
+    """
+    signal_type = snippet[36:42].upper()
+    if signal_type in CALL_CODES:
+        return 'CALL'
+    elif signal_type in PUT_CODES:
+        return 'PUT'
+    return None
+
+
+def synthetic_corpus(size=100000, shifted=0.05, noise=0.1):
+    corpus = []
+    for _ in range(size):
+        roll = random.random()
+        if roll < noise:
+            corpus.append("Your weekly TradingView digest is ready, 3 new ideas from people you follow")
+            continue
+        code = random.choice(CALL_CODES + PUT_CODES)
+        ticker = random.choice(('SPY', 'QQQ', 'IWM'))
+        # "TradingView alert fired for SPY now " puts the code at [36:42]
+        prefix = f"TradingView alert fired for {ticker} now " if roll >= noise + shifted else f"TradingView alert fired for {ticker} at "
+        corpus.append(f"{prefix}{code} close {random.uniform(400, 600):.2f}")
+    return corpus
+
+
+def _time(func, corpus, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for snippet in corpus:
+            func(snippet)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def run(corpus, repeat=3):
+    parser = AlertParser()
+    legacy = _time(legacy_side, corpus, repeat)
+    side = _time(parser.side, corpus, repeat)
+    parse = _time(parser.parse, corpus, repeat)
+
+    missed = sum(1 for snippet in corpus if legacy_side(snippet) is None and parser.side(snippet) is not None)
+    print(f"{len(corpus)} snippets")
+    print(f"  slice + tuples        {len(corpus) / legacy:12,.0f} /s  {legacy / len(corpus) * 1e6:6.2f} us each")
+    print(f"  AlertParser.side      {len(corpus) / side:12,.0f} /s  {side / len(corpus) * 1e6:6.2f} us each")
+    print(f"  AlertParser.parse     {len(corpus) / parse:12,.0f} /s  {parse / len(corpus) * 1e6:6.2f} us each")
+    print(f"  codes the slice missed: {missed}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--corpus', help='recorded snippets, one per line')
+    parser.add_argument('--size', type=int, default=100000, help='synthetic corpus size')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    if args.corpus:
+        with open(args.corpus) as f:
+            corpus = [line.rstrip('\n') for line in f if line.strip()]
+    else:
+        corpus = synthetic_corpus(args.size)
+    run(corpus, args.repeat)
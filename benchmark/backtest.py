@@ -0,0 +1,153 @@
+"""
+Backtester throughput on a year of 1 minute candles.
+
+A synthetic SPY year (252 sessions x 390 candles), 0DTE chain snapshots for
+both sides every 15 minutes (Bachelier prices and deltas) and random alerts
+are generated, then the settings from setting/settings.txt are replayed.
+
+ReferenceBacktester walks every position forward one candle at a time, as a
+per-candle backtest loop would. It runs once on the same data and its trades
+must match the vectorized Backtester's trade for trade.
+
+    python -m benchmark.backtest --alerts-per-day 20 --repeat 3
+"""
+import math
+import time
+import random
+import argparse
+import numpy as np
+import pandas as pd
+from database.candle_store import CANDLE_DTYPE, EASTERN
+from strategy.backtest import Backtester, ChainSnapshots, load_settings, ALERT_DTYPE, CONTRACT_DTYPE
+
+erf = np.vectorize(math.erf)
+
+
+def synthetic_year(sessions=252, start='2024-01-02', price=470.0, seed=7):
+    rng = np.random.default_rng(seed)
+    days = pd.bdate_range(start, periods=sessions)
+    opens = np.array([int(pd.Timestamp(f"{day.date()} 09:30", tz=EASTERN).timestamp() * 1000) for day in days])
+    times = (opens[:, None] + np.arange(390) * 60000).ravel()
+    closes = price * np.exp(np.cumsum(rng.normal(0, 0.0006, len(times))))
+    candles = np.empty(len(times), dtype=CANDLE_DTYPE)
+    candles['datetime'] = times
+    candles['open'] = np.append(price, closes[:-1])
+    candles['close'] = closes
+    spread = np.abs(rng.normal(0, 0.0004, len(times))) * closes
+    candles['high'] = np.maximum(candles['open'], closes) + spread
+    candles['low'] = np.minimum(candles['open'], closes) - spread
+    candles['volume'] = rng.integers(1000, 50000, len(times))
+    return candles, days
+
+
+def synthetic_snapshots(candles, days, every=15, strikes=20, volatility=0.15):
+    tables = []
+    for day_number, day in enumerate(days):
+        expiration = np.datetime64(day.date(), 'D')
+        for minute in range(0, 390, every):
+            row = candles[day_number * 390 + minute]
+            underlying = row['open']
+            # Bachelier price and delta with the time left to the 16:00 close
+            scale = underlying * volatility * math.sqrt(max(390 - minute, 1) / (390 * 252))
+            for side in ('CALL', 'PUT'):
+                base = round(underlying)
+                strike = base + np.arange(strikes) if side == 'CALL' else base - np.arange(strikes)
+                distance = (underlying - strike) / scale if side == 'CALL' else (strike - underlying) / scale
+                probability = 0.5 * (1 + erf(distance / math.sqrt(2)))
+                value = (distance * probability + np.exp(-distance ** 2 / 2) / math.sqrt(2 * math.pi)) * scale
+                table = np.empty(strikes, dtype=CONTRACT_DTYPE)
+                table['time'] = row['datetime']
+                table['side'] = side
+                table['symbol'] = [f"SPY   {day:%y%m%d}{side[0]}{int(k * 1000):08d}" for k in strike]
+                table['bid'] = np.round(np.maximum(value - 0.01, 0.01), 2)
+                table['ask'] = np.round(value + 0.01, 2)
+                table['delta'] = probability if side == 'CALL' else -probability
+                table['oi'] = 1000
+                table['strike'] = strike
+                table['expiration'] = expiration
+                tables.append(table)
+    table = np.concatenate(tables)
+    return ChainSnapshots(table[np.lexsort((table['side'], table['time']))], max_age=900)
+
+
+class ReferenceBacktester(Backtester):
+    """
+    Backtester with the exit scan as a plain loop over the candles, one bar at a time.
+    """
+    def _scan(self, position, until, profit, loss):
+        stop = min(until, position['expiration'])
+        end = max(self._bars_before(stop), position['next'])
+        first = position['next']
+        position['next'] = end
+
+        if position['entry'] > 0:
+            scale = position['delta'] / position['entry'] * 100
+            for bar in range(first, end):
+                candle = self.candles[bar]
+                best, worst = (candle['high'], candle['low']) if scale > 0 else (candle['low'], candle['high'])
+                best_pct = (best - position['underlying']) * scale
+                worst_pct = max((worst - position['underlying']) * scale, -100.0)
+                open_pct = max((candle['open'] - position['underlying']) * scale, -100.0)
+                # Stop loss first when a bar reaches both
+                if worst_pct <= loss:
+                    pct = open_pct if open_pct <= loss else loss
+                    return int(candle['datetime']), position['entry'] * (1 + pct / 100), 'loss'
+                if best_pct >= profit:
+                    pct = open_pct if open_pct >= profit else profit
+                    return int(candle['datetime']), position['entry'] * (1 + pct / 100), 'profit'
+
+        if until >= position['expiration'] and end:
+            underlying = self.candles['close'][end - 1]
+            intrinsic = underlying - position['strike'] if position['side'] == 'CALL' else position['strike'] - underlying
+            return position['expiration'], max(0.0, intrinsic), 'expired'
+        return None
+
+
+def assert_same_trades(trades, reference):
+    assert len(trades) == len(reference), f"{len(trades)} trades, the reference loop made {len(reference)}"
+    for field in trades.dtype.names:
+        mismatch = np.flatnonzero(trades[field] != reference[field])
+        assert not len(mismatch), f"trade {mismatch[0]} differs in {field}: {trades[mismatch[0]]} vs {reference[mismatch[0]]}"
+
+
+def synthetic_alerts(candles, per_day=20, seed=7):
+    random.seed(seed)
+    picks = np.sort(np.array(random.sample(range(len(candles)), per_day * len(candles) // 390)))
+    alerts = np.empty(len(picks), dtype=ALERT_DTYPE)
+    alerts['time'] = candles['datetime'][picks] + 60000
+    alerts['side'] = [random.choice(('CALL', 'PUT')) for _ in picks]
+    alerts['code'] = [f"{side[0]}{random.choice((5, 15, 30))}" for side in alerts['side']]
+    return alerts
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sessions', type=int, default=252)
+    parser.add_argument('--alerts-per-day', type=int, default=20)
+    parser.add_argument('--settings', default='./setting/settings.txt')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    candles, days = synthetic_year(args.sessions)
+    snapshots = synthetic_snapshots(candles, days)
+    alerts = synthetic_alerts(candles, args.alerts_per_day)
+    print(f"{len(candles)} candles, {len(snapshots.table)} snapshot contracts, {len(alerts)} alerts "
+          f"(generated in {time.perf_counter() - start:.1f} s)")
+
+    settings = load_settings(args.settings)
+    samples = []
+    for attempt in range(args.repeat):
+        # A fresh Backtester so the snapshot indexes are rebuilt every time
+        backtester = Backtester(candles, ChainSnapshots(snapshots.table, snapshots.max_age))
+        start = time.perf_counter()
+        trades, counters = backtester.run(alerts, settings)
+        samples.append(time.perf_counter() - start)
+    print(f"  backtest  {min(samples):6.2f} s best of {args.repeat}, {len(alerts) / min(samples):,.0f} alerts/s")
+
+    start = time.perf_counter()
+    reference, _ = ReferenceBacktester(candles, ChainSnapshots(snapshots.table, snapshots.max_age)).run(alerts, settings)
+    elapsed = time.perf_counter() - start
+    assert_same_trades(trades, reference)
+    print(f"  reference {elapsed:6.2f} s per-candle loop, same {len(trades)} trades, {elapsed / min(samples):.1f}x the vectorized time")
+    print(f"  {Backtester.summary(trades, counters)}")
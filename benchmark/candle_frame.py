@@ -0,0 +1,95 @@
+"""
+Candle frame construction: the old per-row path vs the vectorized _create_candle_dataframe.
+
+The old path is what get_candle_history did: format every epoch as a string,
+json.dumps the payload for the log, then build the frame row by row. Pass a
+recorded price_history() response with --fixture, otherwise 200k 1 minute
+candles are synthesized.
+
+    python -m benchmark.candle_frame --candles 200000 --repeat 3
+"""
+import copy
+import json
+import time
+import random
+import argparse
+import statistics
+import pandas as pd
+from datetime import datetime, timedelta
+from database.data_manager import DataManager
+
+
+def per_row_dataframe(candles):
+    """
+    The frame builder DataManager used before, including its fixed 7 hour shift.
+    """
+    data = []
+    for ohlcv in candles['candles']:
+        datetime_value = ohlcv.get('datetime')
+        try:
+            datetime_parsed = pd.to_datetime(datetime_value, unit='ms')
+        except (ValueError, TypeError):
+            datetime_parsed = pd.to_datetime(datetime_value)
+        data.append({
+            'Datetime': datetime_parsed - timedelta(hours=7),
+            'Open': ohlcv.get('open'),
+            'High': ohlcv.get('high'),
+            'Low': ohlcv.get('low'),
+            'Close': ohlcv.get('close'),
+            'Volume': ohlcv.get('volume')
+        })
+    return pd.DataFrame(data)
+
+
+def legacy_path(candles):
+    for candle in candles['candles']:
+        candle['datetime'] = datetime.fromtimestamp(candle['datetime'] / 1000.0).strftime('%Y-%m-%d %H:%M:%S')
+    json.dumps(candles, indent=4)
+    return per_row_dataframe(candles)
+
+
+def synthetic_history(count=200000, start='2024-01-02 09:30'):
+    epoch = int(pd.Timestamp(start, tz='America/New_York').timestamp() * 1000)
+    price = 470.0
+    candles = []
+    for i in range(count):
+        close = price + random.gauss(0, 0.05)
+        candles.append({'open': price, 'high': max(price, close) + 0.02, 'low': min(price, close) - 0.02,
+                        'close': close, 'volume': random.randint(1000, 50000), 'datetime': epoch + i * 60000})
+        price = close
+    return {'candles': candles, 'symbol': 'SPY', 'empty': False}
+
+
+def _time(func, history, repeat):
+    samples = []
+    for _ in range(repeat):
+        # The legacy path rewrites the candles in place
+        payload = copy.deepcopy(history)
+        start = time.perf_counter()
+        func(payload)
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples)
+
+
+def run(history, repeat=3):
+    legacy = _time(legacy_path, history, repeat)
+    vectorized = _time(DataManager._create_candle_dataframe, history, repeat)
+    frame = DataManager._create_candle_dataframe(history)
+    print(f"{len(history['candles'])} candles, {frame['Datetime'].iloc[0]} to {frame['Datetime'].iloc[-1]}")
+    print(f"  strings + json log + per row frame  {legacy * 1000:9.1f} ms")
+    print(f"  vectorized frame                    {vectorized * 1000:9.1f} ms  ({legacy / vectorized:5.1f}x)")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--fixture', help='recorded price_history() json')
+    parser.add_argument('--candles', type=int, default=200000, help='synthetic candle count')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    if args.fixture:
+        with open(args.fixture) as f:
+            history = json.load(f)
+    else:
+        history = synthetic_history(args.candles)
+    run(history, args.repeat)
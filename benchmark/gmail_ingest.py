@@ -0,0 +1,61 @@
+"""
+Email-to-event latency: 1 s inbox polling vs push notifications with history deltas.
+
+Both modes run against the in-memory StubGmailService, with --api-latency
+seconds added to every Gmail API call.
+
+    python -m benchmark.gmail_ingest --alerts 10 --api-latency 0.05
+"""
+import time
+import random
+import argparse
+import statistics
+from cloud_services.api import Gmail
+from cloud_services.gmail_stub import StubGmailService
+
+PREFIX = "TradingView alert fired for SPY now "
+CODES = ['CALL5-', 'PUT5--']
+
+
+class PrintLog:
+    def emit(self, message):
+        pass
+
+
+def _run_mode(mode, alerts, api_latency):
+    service = StubGmailService(latency=api_latency)
+    gmail = Gmail(log_signal=PrintLog(), service=service)
+    gmail.PUBSUB_TOPIC = None
+    gmail.set_checker(True)
+
+    if mode == 'push':
+        service.on_deliver = gmail.notify
+        gmail.check_email_push(fallback_interval=30)
+    else:
+        gmail.check_email_automatic()
+    time.sleep(0.2)
+
+    for i in range(alerts):
+        gmail.reset_position()
+        event = gmail.get_call_event() if i % 2 == 0 else gmail.get_put_event()
+        time.sleep(random.uniform(0, 1))
+        service.deliver(PREFIX + CODES[i % 2])
+        event.wait(10)
+
+    gmail.set_checker(False)
+    return list(gmail.signal_latencies), service.calls
+
+
+def run(alerts=10, api_latency=0.05):
+    for mode in ('poll', 'push'):
+        latencies, calls = _run_mode(mode, alerts, api_latency)
+        print(f"{mode:>5}: median {statistics.median(latencies) * 1000:7.1f} ms  max {max(latencies) * 1000:7.1f} ms  "
+              f"email to event over {len(latencies)} alerts, {calls} API calls")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--alerts', type=int, default=10)
+    parser.add_argument('--api-latency', type=float, default=0.05, help='seconds added to every stub API call')
+    args = parser.parse_args()
+    run(args.alerts, args.api_latency)
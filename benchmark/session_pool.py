@@ -0,0 +1,127 @@
+"""
+Signal-to-fill round trip latency: one connection per call vs the pooled SchwabSession.
+
+Runs a local stub HTTPS server with a throwaway self-signed certificate and replays
+the REST calls made by a sell -> buy flip against it.
+
+    python -m benchmark.session_pool --rounds 50 --rtt 20
+"""
+import os
+import ssl
+import json
+import time
+import argparse
+import tempfile
+import threading
+import subprocess
+import statistics
+import requests
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from schwab.session import SchwabSession
+
+# (method, path) for every call made by Client.handleCallEvent/handlePutEvent on a flip
+FLIP_CALLS = [
+    ('GET', '/trader/v1/accounts/accountNumbers'),
+    ('GET', '/trader/v1/accounts/HASH'),
+    ('GET', '/trader/v1/accounts/accountNumbers'),
+    ('GET', '/trader/v1/accounts/HASH'),
+    ('POST', '/trader/v1/accounts/HASH/orders'),
+    ('GET', '/marketdata/v1/chains'),
+    ('GET', '/trader/v1/accounts/accountNumbers'),
+    ('POST', '/trader/v1/accounts/HASH/orders'),
+]
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+    body = json.dumps([{'accountNumber': '0', 'hashValue': 'HASH'}]).encode()
+
+    def _reply(self):
+        length = int(self.headers.get('Content-Length', 0))
+        if length:
+            self.rfile.read(length)
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(self.body)))
+        self.end_headers()
+        self.wfile.write(self.body)
+
+    do_GET = _reply
+    do_POST = _reply
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, context, rtt):
+        super().__init__(address, StubHandler)
+        self.context = context
+        self.rtt = rtt
+
+    def get_request(self):
+        sock, address = super().get_request()
+        # A new connection costs the TCP handshake plus the TLS handshake round trips
+        time.sleep(2 * self.rtt)
+        return self.context.wrap_socket(sock, server_side=True), address
+
+
+def _self_signed_context(directory):
+    cert = os.path.join(directory, 'cert.pem')
+    key = os.path.join(directory, 'key.pem')
+    subprocess.run(['openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes', '-days', '1',
+                    '-subj', '/CN=127.0.0.1', '-addext', 'subjectAltName=IP:127.0.0.1',
+                    '-keyout', key, '-out', cert],
+                   check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.load_cert_chain(cert, key)
+    return context, cert
+
+
+def _flip(send, base_url):
+    start = time.perf_counter()
+    for method, path in FLIP_CALLS:
+        send(method, f'{base_url}{path}').json()
+    return time.perf_counter() - start
+
+
+def run(rounds=50, rtt=0.0):
+    with tempfile.TemporaryDirectory() as directory:
+        context, cert = _self_signed_context(directory)
+        server = StubServer(('127.0.0.1', 0), context, rtt)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        base_url = f'https://127.0.0.1:{server.server_address[1]}'
+
+        def unpooled(method, url):
+            return requests.request(method, url, headers={'Authorization': 'Bearer token'}, verify=cert)
+
+        session = SchwabSession(token_provider=lambda: 'token')
+
+        def pooled(method, url):
+            return session.request(method, url, verify=cert)
+
+        results = {}
+        for name, send in (('per-call connection', unpooled), ('pooled session', pooled)):
+            send('GET', base_url + FLIP_CALLS[0][1])  # warm up
+            results[name] = [_flip(send, base_url) for _ in range(rounds)]
+
+        server.shutdown()
+        session.close()
+
+    for name, samples in results.items():
+        print(f"{name:>20}: median {statistics.median(samples) * 1000:8.2f} ms  "
+              f"p95 {sorted(samples)[int(len(samples) * 0.95) - 1] * 1000:8.2f} ms per flip ({len(FLIP_CALLS)} calls)")
+    saved = statistics.median(results['per-call connection']) - statistics.median(results['pooled session'])
+    print(f"{'saved':>20}: {saved * 1000:8.2f} ms per signal-to-fill round trip")
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rounds', type=int, default=50, help='number of simulated flips per mode')
+    parser.add_argument('--rtt', type=float, default=0.0, help='simulated network round trip in ms')
+    args = parser.parse_args()
+    run(args.rounds, args.rtt / 1000)
@@ -0,0 +1,164 @@
+"""
+GUI launch: staged startup vs loading everything before the window.
+
+Every run is a fresh interpreter (offscreen Qt) that shows the window and
+presses Start right after the first paint. Schwab and Gmail are replaced by stubs that sleep
+--api-latency in their constructors (the .env, key and OAuth token loads),
+the ledger goes to a temporary file.
+
+    staged  the window paints first, modules and subsystems load on the startup threads
+    eager   interface.client is imported before the window and Start builds every
+            subsystem in turn on the UI thread, as the GUI did before the startup stages
+
+Reported per mode, median over --runs: process start to first paint, to
+trading ready (signal bus running) and the longest the UI thread did not
+handle events.
+
+    python -m benchmark.startup --runs 5 --api-latency 0.3
+"""
+import time
+STARTED = time.perf_counter()
+
+import os
+import sys
+import json
+import argparse
+import tempfile
+import statistics
+import subprocess
+
+
+def _patch(latency):
+    import interface.client
+    from PyQt5.QtCore import QObject, pyqtSignal
+    from cloud_services.api import Gmail
+    from cloud_services.gmail_stub import StubGmailService
+    from database.ledger import Ledger
+    from strategy.high_open_interest import OpenInterestLevels
+
+    class StubResponse:
+        ok = True
+        status_code = 200
+
+        def json(self):
+            call = {'putCall': 'CALL', 'symbol': 'SPY   241030C00580000', 'strikePrice': 580.0, 'openInterest': 1}
+            put = {'putCall': 'PUT', 'symbol': 'SPY   241030P00570000', 'strikePrice': 570.0, 'openInterest': 1}
+            return {'callExpDateMap': {'2024-10-30:0': {'580.0': [call]}}, 'putExpDateMap': {'2024-10-30:0': {'570.0': [put]}}}
+
+    class StubSchwab(QObject):
+        request_input_signal = pyqtSignal(str)
+
+        def __init__(self, log_signal=None):
+            super().__init__()
+            time.sleep(latency)
+            self.stream = None
+
+        def update_tokens_automatic(self):
+            pass
+
+        def account_hash(self):
+            return 'ACCOUNT'
+
+        def get_chains(self, *args, **kwargs):
+            return StubResponse()
+
+    class StubGmail(Gmail):
+        def __init__(self, log_signal=None):
+            time.sleep(latency)
+            super().__init__(log_signal=log_signal, service=StubGmailService())
+            self.PUBSUB_TOPIC = None
+
+    ledger_path = os.path.join(tempfile.mkdtemp(), 'ledger.db')
+    interface.client.Schwab = StubSchwab
+    interface.client.Gmail = StubGmail
+    interface.client.Ledger = lambda: Ledger(path=ledger_path)
+    # The stub levels are not appended to the high_oi history
+    interface.client.OpenInterestLevels = lambda *args, **kwargs: OpenInterestLevels(*args, persist=False, **kwargs)
+
+
+def child(mode, latency, timeout):
+    from PyQt5.QtWidgets import QApplication
+    from PyQt5.QtCore import QTimer
+
+    if mode == 'eager':
+        _patch(latency)
+    from interface.gui import ClientGUI
+
+    app = QApplication(sys.argv)
+    gui = ClientGUI(started=STARTED)
+    # load_settings() reads an absolute path, fill the fields from the repo settings instead
+    with open('./setting/settings.txt') as f:
+        settings = json.load(f)
+    for name in ('max_position_size', 'max_profit_percentage', 'max_loss_percentage', 'max_contract_price', 'least_delta'):
+        getattr(gui, name).setText(str(settings[name]))
+    gui.load_settings = lambda: None
+    if mode == 'staged':
+        load_modules = gui._load_modules
+
+        def patched_load():
+            load_modules()
+            _patch(latency)
+        gui._load_modules = patched_load
+    else:
+        import interface.client
+        gui.client_class = interface.client.Client
+        gui.startup.mark('modules')
+
+        # Stages run one after another on the calling (UI) thread, like the old Client constructor
+        def inline_stage(name, func, after=()):
+            func()
+            gui.startup.mark(name)
+        gui.startup.stage = inline_stage
+
+    # Longest gap between ticks of a 5 ms timer is the longest the UI was unresponsive
+    state = {'last': time.perf_counter(), 'stall': 0.0}
+
+    def tick():
+        now = time.perf_counter()
+        state['stall'] = max(state['stall'], now - state['last'])
+        state['last'] = now
+        if gui.startup.is_ready('trading') or now - STARTED > timeout:
+            app.quit()
+
+    # Start is pressed as soon as the window is on screen
+    gui.startup.when('first_paint', lambda: QTimer.singleShot(0, gui.start_bot))
+    timer = QTimer()
+    timer.timeout.connect(tick)
+    timer.start(5)
+    gui.show()
+    app.exec_()
+
+    stats = gui.startup.stats()
+    print(json.dumps({'first_paint': stats.get('first_paint'), 'trading': stats.get('trading'), 'stall': state['stall']}))
+    sys.stdout.flush()
+    os._exit(0)
+
+
+def run(runs=5, latency=0.3, timeout=30):
+    env = dict(os.environ, QT_QPA_PLATFORM='offscreen')
+    for mode in ('eager', 'staged'):
+        samples = []
+        for _ in range(runs):
+            output = subprocess.run([sys.executable, '-m', 'benchmark.startup', '--child', mode, '--api-latency', str(latency),
+                                     '--timeout', str(timeout)], env=env, capture_output=True, text=True, check=True).stdout
+            samples.append(json.loads(output.strip().splitlines()[-1]))
+        if any(sample['trading'] is None for sample in samples):
+            print(f"{mode:>6}: trading not ready within {timeout} s")
+            continue
+        print(f"{mode:>6}: first paint {statistics.median(s['first_paint'] for s in samples):5.2f} s  "
+              f"trading {statistics.median(s['trading'] for s in samples):5.2f} s  "
+              f"longest UI stall {statistics.median(s['stall'] for s in samples) * 1000:6.0f} ms")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--api-latency', type=float, default=0.3, help='seconds the Schwab and Gmail stubs take to construct')
+    parser.add_argument('--timeout', type=float, default=30)
+    parser.add_argument('--child', choices=('staged', 'eager'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.child, args.api_latency, args.timeout)
+    else:
+        run(args.runs, args.api_latency, args.timeout)
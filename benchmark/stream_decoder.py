@@ -0,0 +1,91 @@
+"""
+Stream message decoding throughput: json.loads to raw dicts vs StreamDecoder records.
+
+Pass a recorded capture (recorder directory/files or the old JSON-lines dump)
+with --capture, otherwise LEVELONE_OPTIONS and CHART_EQUITY messages are
+synthesized. StreamDecoder uses orjson when it is installed.
+
+    python -m benchmark.stream_decoder --capture data/stream/2024-10-30 --repeat 5
+"""
+import json
+import time
+import random
+import argparse
+from schwab import decoder
+from schwab.replay import StreamReplay
+from schwab.decoder import StreamDecoder
+from schwab.bars import BarAggregator
+from interface.position_monitor import PositionMonitor
+
+
+def synthetic_capture(size=50000, contracts=200):
+    symbols = [f"SPY   241030{'CP'[i % 2]}{(560 + i // 2) * 1000:08d}" for i in range(contracts)]
+    messages = []
+    for i in range(size):
+        if i % 100 == 0:
+            content = [{"seq": i, "key": "SPY", "1": 580.1, "2": 580.5, "3": 579.9, "4": 580.2, "5": 12345.0,
+                        "6": i, "7": 1730295000000 + i * 600, "8": 20026}]
+            service = "CHART_EQUITY"
+        else:
+            # A handful of changed fields per contract, as LEVELONE_OPTIONS sends deltas
+            content = [{"key": symbol, "2": round(random.uniform(0.5, 2), 2), "3": round(random.uniform(0.5, 2), 2),
+                        "8": random.randint(0, 5000), "28": round(random.uniform(-1, 1), 3), "29": 0.01,
+                        "37": round(random.uniform(0.5, 2), 3), "38": 1730295000000 + i}
+                       for symbol in random.sample(symbols, 3)]
+            service = "LEVELONE_OPTIONS"
+        messages.append(json.dumps({"data": [{"service": service, "timestamp": 1730295000000 + i, "command": "SUBS",
+                                              "content": content}]}))
+    return messages
+
+
+def recorded_capture(paths):
+    # Rebuild one websocket message per recorded data item
+    return [json.dumps({"data": [item]}) for _, item in StreamReplay(None, paths)._records()]
+
+
+def _time(func, messages, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for message in messages:
+            func(message)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def run(messages, repeat=3):
+    def raw(message):
+        for item in json.loads(message).get("data", []):
+            item.get("content", [])
+
+    def records(stream_decoder):
+        def decode(message):
+            for item in stream_decoder.loads(message).get("data", []):
+                stream_decoder.decode(item.get("service"), item.get("content", []))
+        return decode
+
+    everything = StreamDecoder()
+    # The fields the live handlers register
+    kept = StreamDecoder()
+    kept.keep("CHART_EQUITY", BarAggregator.FIELDS)
+    kept.keep("LEVELONE_OPTIONS", PositionMonitor.FIELDS)
+    kept.keep("LEVELONE_OPTIONS", ("bid", "ask", "delta"))
+
+    baseline = _time(raw, messages, repeat)
+    print(f"{len(messages)} messages, orjson {'installed' if decoder.orjson is not None else 'not installed'}")
+    print(f"  json.loads, raw dicts        {len(messages) / baseline:12,.0f} msg/s")
+    for name, stream_decoder in (("records, all fields", everything), ("records, handler fields", kept)):
+        elapsed = _time(records(stream_decoder), messages, repeat)
+        print(f"  {name:<28} {len(messages) / elapsed:12,.0f} msg/s  ({baseline / elapsed:4.2f}x)")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--capture', action='append', default=[], help='recorder files/directories or JSON-lines dumps, repeatable')
+    parser.add_argument('--size', type=int, default=50000, help='synthetic message count')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    messages = recorded_capture(args.capture) if args.capture else synthetic_capture(args.size)
+    run(messages, args.repeat)
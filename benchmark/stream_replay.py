@@ -0,0 +1,117 @@
+"""
+Offline load test of the stream handlers through StreamReplay.
+
+Recorded data (or a synthesized session) is replayed into a Stream with a
+PositionMonitor on one option, the check_position exit logic, and a
+CHART_EQUITY momentum indicator feeding the signal bus, whose handler picks a
+contract from a ContractIndex, the signal-to-order decision without the order.
+
+    python -m benchmark.stream_replay data/stream/2024-10-30 --symbol "SPY   241030C00580000" --speed 100
+"""
+import json
+import time
+import random
+import argparse
+import tempfile
+import statistics
+from schwab.stream import Stream
+from schwab.replay import StreamReplay
+from schwab.recorder import StreamRecorder
+from interface.position_monitor import PositionMonitor
+from interface.signal_bus import SignalBus, StreamSource
+from strategy.contract_index import ContractIndex
+from database.data_manager import DataManager
+from benchmark.chain_normalizer import synthetic_chain
+
+SYMBOL = "SPY   241030C00580000"
+
+
+def synthetic_session(directory, minutes=60, quotes_per_second=10, symbol=SYMBOL):
+    """
+    Record a random walk session: option quotes at quotes_per_second and one 1 minute SPY bar per minute.
+    """
+    recorder = StreamRecorder(directory=directory, queue_size=0, report_interval=0)
+    recorder.start()
+    start = int(time.time() * 1000)
+    underlying, mark = 580.0, 1.00
+    step = 1000 // quotes_per_second
+    for t in range(0, minutes * 60000, step):
+        mark = max(mark + random.gauss(0, 0.005), 0.01)
+        data = [{"service": "LEVELONE_OPTIONS", "timestamp": start + t, "command": "SUBS",
+                 "content": [{"key": symbol, "2": round(mark - 0.01, 2), "3": round(mark + 0.01, 2), "37": round(mark, 3)}]}]
+        if t % 60000 == 0:
+            close = underlying + random.gauss(0, 0.3)
+            data.append({"service": "CHART_EQUITY", "timestamp": start + t, "command": "SUBS",
+                         "content": [{"key": "SPY", "1": underlying, "2": max(underlying, close) + 0.1,
+                                      "3": min(underlying, close) - 0.1, "4": close, "5": 1000.0, "7": start + t}]})
+            underlying = close
+        recorder.record(json.dumps({"data": data}))
+    recorder.stop()
+
+
+class Momentum:
+    """
+    CALL when a 1 minute close is above the previous one by threshold, PUT when below.
+    """
+    def __init__(self, threshold=0.2):
+        self.threshold = threshold
+        self.last = None
+
+    def __call__(self, content, timestamp):
+        for bar in content:
+            close = bar.close
+            if close is None:
+                continue
+            side = None
+            if self.last is not None and close - self.last > self.threshold:
+                side = 'CALL'
+            elif self.last is not None and self.last - close > self.threshold:
+                side = 'PUT'
+            self.last = close
+            return side
+
+
+def run(paths, symbol, speed=None, average_price=1.0, profit=30.0, loss=30.0):
+    stream = Stream(None)
+    monitor = PositionMonitor(stream, symbol, average_price, lambda: profit, lambda: -loss)
+    monitor.start()
+
+    index = ContractIndex(DataManager.normalize_chain(synthetic_chain(), ContractIndex.COLUMNS))
+    decisions = []
+
+    def decide(signal):
+        index.first(signal.side, 0.15, 0.65)
+        decisions.append(time.perf_counter() - signal.received)
+
+    bus = SignalBus()
+    bus.add_source(StreamSource(stream, Momentum(), fields=("close",)))
+    bus.start(decide)
+
+    replay = StreamReplay(stream, paths, speed=speed)
+    stats = replay.run()
+    time.sleep(0.1)
+
+    print(f"replayed {stats['items']} messages, {stats['ticks']} ticks in {stats['seconds']} s: "
+          f"{stats['ticks_per_second']:,} ticks/s, max lag {stats['max_lag_ms']} ms")
+    print(f"  position monitor: {monitor.ticks} quotes, triggered={monitor.triggered}, last P&L {monitor.profit_percentage}")
+    if decisions:
+        print(f"  signals: {len(decisions)}, signal to contract median {statistics.median(decisions) * 1000:.3f} ms, "
+              f"max {max(decisions) * 1000:.3f} ms")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('paths', nargs='*', help='recorder files, JSON-lines dumps or directories, synthesized when empty')
+    parser.add_argument('--symbol', default=SYMBOL, help='option the position monitor watches')
+    parser.add_argument('--speed', type=float, default=None, help='1 real time, 10/100 scaled, omit for as fast as possible')
+    parser.add_argument('--minutes', type=int, default=60, help='length of the synthesized session')
+    parser.add_argument('--profit', type=float, default=1000.0, help='take profit percent, high so the monitor sees every tick')
+    parser.add_argument('--loss', type=float, default=1000.0)
+    args = parser.parse_args()
+
+    paths = args.paths
+    if not paths:
+        directory = tempfile.mkdtemp(prefix='stream_replay_')
+        synthetic_session(directory, args.minutes, symbol=args.symbol)
+        paths = [directory]
+    run(paths, args.symbol, args.speed, profit=args.profit, loss=args.loss)
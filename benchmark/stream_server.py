@@ -0,0 +1,172 @@
+"""
+PositionMonitor exits over a real websocket, against a local streamer stand-in.
+
+A websockets.serve server on localhost answers the ADMIN LOGIN, acks every
+request and, for each option subscribed on LEVELONE_OPTIONS, sends a quote
+frame every --interval seconds walking the mark one --step at a time away
+from --average-price, plus a heartbeat notify. A Stream connects to it as it
+would to Schwab and a PositionMonitor bought at --average-price must finish
+on the take profit while the mark climbs and on the stop loss while it falls,
+through the same subscribe, decode and handler path as live quotes.
+
+Reported per exit: quote ticks until it fired, the P&L it fired at and the
+time from sending the frame that crossed the threshold to the monitor
+finishing.
+
+    python -m benchmark.stream_server --profit 30 --loss 30
+"""
+import json
+import time
+import types
+import asyncio
+import argparse
+import tempfile
+import threading
+import websockets
+from schwab.stream import Stream
+from schwab.recorder import StreamRecorder
+from interface.position_monitor import PositionMonitor
+
+SYMBOL = "SPY   241030C00580000"
+
+
+class StreamerStandIn:
+    """
+    Just enough of the Schwab streamer for a Stream: LOGIN, request acks, LEVELONE_OPTIONS quotes and heartbeats.
+
+    The mark of every subscribed option starts at start_mark and moves step per
+    frame, sent[symbol] keeps (perf_counter, mark) of every frame sent.
+    """
+    def __init__(self, start_mark=1.0, step=0.01, interval=0.01, heartbeat_interval=1.0):
+        self.start_mark = start_mark
+        self.step = step
+        self.interval = interval
+        self.heartbeat_interval = heartbeat_interval
+        self.sent = {}
+        self.requests = []
+        self.port = None
+        self._loop = None
+        self._ready = threading.Event()
+        self._stop = None
+
+
+    def start(self):
+        threading.Thread(target=lambda: asyncio.run(self._serve()), daemon=True).start()
+        self._ready.wait()
+        return f"ws://127.0.0.1:{self.port}"
+
+
+    def stop(self):
+        self._loop.call_soon_threadsafe(self._stop.set)
+
+
+    async def _serve(self):
+        self._loop = asyncio.get_running_loop()
+        self._stop = asyncio.Event()
+        async with websockets.serve(self._connection, "127.0.0.1", 0) as server:
+            self.port = server.sockets[0].getsockname()[1]
+            self._ready.set()
+            await self._stop.wait()
+
+
+    async def _connection(self, websocket):
+        feeds = {}
+        heartbeat = asyncio.create_task(self._heartbeat(websocket))
+        try:
+            async for message in websocket:
+                for request in json.loads(message).get("requests", []):
+                    self.requests.append(request)
+                    service, command = request.get("service"), request.get("command")
+                    await websocket.send(json.dumps({"response": [{
+                        "service": service, "command": command, "requestid": str(request.get("requestid")),
+                        "SchwabClientCorrelId": request.get("SchwabClientCorrelId"),
+                        "timestamp": int(time.time() * 1000),
+                        "content": {"code": 0, "msg": f"{command} command succeeded"}}]}))
+
+                    if service != "LEVELONE_OPTIONS":
+                        continue
+                    keys = [key for key in request.get("parameters", {}).get("keys", "").split(",") if key]
+                    if command == "UNSUBS":
+                        for key in keys:
+                            if key in feeds:
+                                feeds.pop(key).cancel()
+                    elif command in ("SUBS", "ADD"):
+                        for key in keys:
+                            if key not in feeds:
+                                feeds[key] = asyncio.create_task(self._quotes(websocket, key))
+        except websockets.exceptions.ConnectionClosed:
+            pass
+        finally:
+            heartbeat.cancel()
+            for feed in feeds.values():
+                feed.cancel()
+
+
+    async def _quotes(self, websocket, symbol):
+        mark = self.start_mark
+        sent = self.sent.setdefault(symbol, [])
+        while mark > 0:
+            mark = round(mark + self.step, 4)
+            frame = {"data": [{"service": "LEVELONE_OPTIONS", "timestamp": int(time.time() * 1000), "command": "SUBS",
+                               "content": [{"key": symbol, "2": round(mark - 0.01, 4), "3": round(mark + 0.01, 4), "37": mark}]}]}
+            sent.append((time.perf_counter(), mark))
+            await websocket.send(json.dumps(frame))
+            await asyncio.sleep(self.interval)
+
+
+    async def _heartbeat(self, websocket):
+        while True:
+            await asyncio.sleep(self.heartbeat_interval)
+            await websocket.send(json.dumps({"notify": [{"heartbeat": str(int(time.time() * 1000))}]}))
+
+
+def exit_on(direction, average_price, profit, loss, step, interval, timeout):
+    """
+    :param direction: 1 the mark climbs to the take profit, -1 it falls to the stop loss
+    :return: the finished monitor and seconds from the crossing frame to the exit
+    """
+    server = StreamerStandIn(start_mark=average_price, step=direction * step, interval=interval)
+    url = server.start()
+
+    stream = Stream(types.SimpleNamespace(accessToken="local"), streamer_info={"streamerSocketUrl": url})
+    # Keep the recording out of ./data/stream
+    stream.recorder = StreamRecorder(directory=tempfile.mkdtemp(prefix='stream_server_'), report_interval=0)
+    stream.start()
+
+    monitor = PositionMonitor(stream, SYMBOL, average_price, lambda: profit, lambda: -loss)
+    monitor.start()
+    finished = monitor.wait(timeout)
+    done = time.perf_counter()
+    monitor.stop()
+    stream.stop()
+    server.stop()
+
+    assert finished, f"no exit within {timeout} s, last P&L {monitor.profit_percentage}"
+    assert monitor.triggered
+    if direction > 0:
+        assert monitor.profit_percentage >= profit, monitor.profit_percentage
+    else:
+        assert monitor.profit_percentage <= -loss, monitor.profit_percentage
+
+    # First frame past the threshold, by the monitor's own P&L arithmetic
+    def crosses(mark):
+        percentage = ((mark - average_price) / average_price) * 100
+        return percentage >= profit or percentage <= -loss
+    crossed = next(sent_at for sent_at, mark in server.sent[SYMBOL] if crosses(mark))
+    return monitor, done - crossed
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--average-price', type=float, default=1.0)
+    parser.add_argument('--profit', type=float, default=30.0, help='take profit percent')
+    parser.add_argument('--loss', type=float, default=30.0, help='stop loss percent')
+    parser.add_argument('--step', type=float, default=0.01, help='mark change per quote frame')
+    parser.add_argument('--interval', type=float, default=0.01, help='seconds between quote frames')
+    parser.add_argument('--timeout', type=float, default=30.0)
+    args = parser.parse_args()
+
+    for name, direction in (('take profit', 1), ('stop loss', -1)):
+        monitor, latency = exit_on(direction, args.average_price, args.profit, args.loss, args.step, args.interval, args.timeout)
+        print(f"{name:>11}: fired after {monitor.ticks} ticks at {monitor.profit_percentage:+.1f}% P&L, "
+              f"{latency * 1000:.2f} ms from the crossing frame")
@@ -0,0 +1,88 @@
+import re
+from interface.signal_bus import Signal
+
+
+class AlertParser:
+    """
+    Turns alert text into Signal objects with one precompiled regex.
+
+    The grammar is a template with {anchor}, {side}, {timeframe}, {ticker} and
+    {price} placeholders plus the alias tables behind them, e.g. "C15---" and
+    "CALL15" both read as side CALL, timeframe 15. The code is found wherever it
+    sits after the anchor (the word "alert" by default, so ordinary mail is not
+    read as a signal) instead of at a fixed offset, and aliases map back to
+    their canonical values through plain dict lookups. One letter aliases only
+    match as written, "p5" or "c-15" in a sentence is no code.
+    """
+    DEFAULT_GRAMMAR = {
+        'template': r"{anchor}.*?(?:\b{ticker}\b.*?)?\b(?P<code>{side}{timeframe}-*)(?![A-Za-z0-9])(?:.*?{price})?",
+        'anchor': r"(?i:\balert\b)",
+        'sides': {'CALL': ['CALL', 'C'], 'PUT': ['PUT', 'P']},
+        'timeframes': {'5': ['5'], '15': ['15'], '30': ['30'], '1H': ['1H'], '2H': ['2H'], '4H': ['4H']},
+        'ticker': r"[A-Z]{1,5}",
+        'price': r"(?<![\w.])\d+\.\d+"
+    }
+
+    def __init__(self, grammar=None):
+        """
+        :param grammar: overrides for DEFAULT_GRAMMAR, e.g. the "alert_grammar" entry of settings.txt
+        :type grammar: dict
+        """
+        self.grammar = dict(self.DEFAULT_GRAMMAR, **(grammar or {}))
+        self.sides = self._lookup(self.grammar['sides'])
+        self.timeframes = self._lookup(self.grammar['timeframes'])
+
+        placeholders = {
+            'anchor': f"(?:{self.grammar['anchor']})" if self.grammar['anchor'] else "",
+            'side': f"(?P<side>{self._alternation(self.sides)})",
+            'timeframe': f"(?P<timeframe>{self._alternation(self.timeframes)})",
+            'ticker': f"(?P<ticker>{self.grammar['ticker']})",
+            'price': f"(?P<price>{self.grammar['price']})"
+        }
+        self.pattern = re.compile(self.grammar['template'].format(**placeholders), re.DOTALL)
+        # Side only needs the code, so the default template skips its ticker/price scans there
+        self.code_pattern = self.pattern
+        if self.grammar['template'] == self.DEFAULT_GRAMMAR['template']:
+            self.code_pattern = re.compile(r"{anchor}.*?\b{side}{timeframe}-*(?![A-Za-z0-9])".format(**placeholders), re.DOTALL)
+
+
+    @staticmethod
+    def _lookup(table):
+        # {"CALL": ["CALL", "C"]} -> {"CALL": "CALL", "C": "CALL"}, keyed upper case
+        return {alias.upper(): canonical for canonical, aliases in table.items() for alias in aliases}
+
+
+    @staticmethod
+    def _alternation(lookup):
+        # Longest alias first so "CALL" is never read as "C" followed by garbage, one letter aliases are case sensitive
+        return '|'.join(f"(?i:{re.escape(alias)})" if len(alias) > 1 else re.escape(alias)
+                        for alias in sorted(lookup, key=len, reverse=True))
+
+
+    def parse(self, text, source='gmail', alert_id=None, timestamp=None):
+        """
+        :param text: alert text, e.g. the Gmail snippet
+        :type text: str
+        :return: the decoded signal, None if the text holds no alert code
+        :rtype: interface.signal_bus.Signal
+        """
+        match = self.pattern.search(text)
+        if match is None:
+            return None
+
+        groups = match.groupdict()
+        code = groups.get('code') or text[min(match.start('side'), match.start('timeframe')):max(match.end('side'), match.end('timeframe'))]
+        signal = Signal(self.sides[groups['side'].upper()], source, alert_id, timestamp, code.upper())
+        signal.timeframe = self.timeframes[groups['timeframe'].upper()]
+        signal.ticker = groups.get('ticker')
+        signal.price = float(groups['price']) if groups.get('price') else None
+        return signal
+
+
+    def side(self, text):
+        """
+        :return: "CALL"|"PUT"|None
+        :rtype: str
+        """
+        match = self.code_pattern.search(text)
+        return self.sides[match.group('side').upper()] if match is not None else None
@@ -1,33 +1,56 @@
+import json
 import time
+import base64
 import os.path
 import threading
 import pandas as pd
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from pathlib import Path
 from dotenv import load_dotenv
 from googleapiclient.discovery import build
+from googleapiclient.errors import HttpError
 from google.oauth2 import service_account
 from google.oauth2.credentials import Credentials
 from google.auth.transport.requests import Request
 from google_auth_oauthlib.flow import InstalledAppFlow
+from cloud_services.alert_parser import AlertParser
 
 
 class Gmail:
-    def __init__(self, log_signal=None):
+    def __init__(self, log_signal=None, service=None):
         self._load_env()
         self.creds = None
         self.creds_performance = None
         self.current_position = None
+        self._position_lock = threading.Lock()
         self.CALLEVENT = threading.Event()
         self.PUTEVENT = threading.Event()
+        self.NOTIFYEVENT = threading.Event()
         self.log_signal = log_signal
         self.check = None
-        self._initialize()
+        self.service = service
+        self.history_id = None
+        self.push_server = None
+        self.watched_at = None
+        # Set to end the running checker thread, every checker gets its own
+        self.checker_stop = threading.Event()
+        self.signal_latencies = deque(maxlen=500)
+        self.alert_parser = AlertParser()
+        # callable(signal), set by the signal bus in place of the CALL/PUT events
+        self.signal_sink = None
+
+        # An injected service (e.g. the local stub) needs no credentials
+        if service is None:
+            self._initialize()
 
 
     def _load_env(self):
         load_dotenv(dotenv_path=Path('./cloud_services/app_info/.env'))
         self.CLIENT_ID = os.getenv("clientId")
         self.CLIENT_SECRET = os.getenv("clientSecret")
+        self.PUBSUB_TOPIC = os.getenv("pubsubTopic")
+        self.PUSH_PORT = int(os.getenv("pushPort") or 8085)
         self.SCOPES = ['https://www.googleapis.com/auth/gmail.modify']
         self.SERVICES = ['https://www.googleapis.com/auth/drive', 'https://www.googleapis.com/auth/spreadsheets']
 
@@ -85,47 +108,242 @@ class Gmail:
                 self._refresh_token(credentials_path)
 
 
+    def _get_service(self):
+        # Build the API client once, the discovery document is not fetched on every check
+        if self.service is None:
+            self.service = build("gmail", "v1", credentials=self.creds)
+        return self.service
+
+
     def _check_inbox(self):
-        service = build("gmail", "v1", credentials=self.creds)
+        service = self._get_service()
         results = service.users().messages().list(userId="me", labelIds=["INBOX"], q="is:unread").execute()
         signals = results.get("messages", [])
 
         if not signals:
             return
 
-        for signal in signals[:1]:
-            message = service.users().messages().get(userId="me", id=signal["id"]).execute()
-            service.users().messages().modify(userId="me", id=signal["id"], body={"removeLabelIds": ["UNREAD"]}).execute()
-            
-            signal_type = message['snippet'][36:42].upper()
-            
-            if signal_type in ('CALL5-', 'CALL15', 'CALL30', 'CALL1H', 'CALL2H', 'CALL4H', 'C5----', 'C15---', 'C30---', 'C1H---', 'C2H---', 'C4H---'):
-                if self.current_position != 'CALL' and not self.CALLEVENT.is_set():
-                    self.CALLEVENT.set()
-                    self.PUTEVENT.clear()
-                    self.log_signal.emit(f"CALL signal received: {signal_type}")
-            elif signal_type in ('PUT5--', 'PUT15-', 'PUT30-', 'PUT1H-', 'PUT2H-', 'PUT4H-', 'P5----', 'P15---', 'P30---', 'P1H---', 'P2H---', 'P4H---'):
-                if self.current_position != 'PUT' and not self.PUTEVENT.is_set():
-                    self.PUTEVENT.set()
-                    self.CALLEVENT.clear()
-                    self.log_signal.emit(f"PUT signal received: {signal_type}")
+        # Drain the whole burst in one batch instead of one message per poll
+        self._process_batch([signal["id"] for signal in signals])
+
+
+    def _check_history(self):
+        """
+        Fetch only the messages added to the inbox since the last seen history id.
+        """
+        service = self._get_service()
+        if self.history_id is None:
+            self.history_id = service.users().getProfile(userId="me").execute()["historyId"]
+            return
+
+        message_ids = []
+        page_token = None
+        try:
+            while True:
+                results = service.users().history().list(userId="me", startHistoryId=self.history_id, labelId="INBOX",
+                                                         historyTypes=["messageAdded"], pageToken=page_token).execute()
+                for record in results.get("history", []):
+                    for added in record.get("messagesAdded", []):
+                        if "UNREAD" in added["message"].get("labelIds", ["UNREAD"]):
+                            message_ids.append(added["message"]["id"])
+                self.history_id = results.get("historyId", self.history_id)
+                page_token = results.get("nextPageToken")
+                if not page_token:
+                    break
+        except HttpError as e:
+            # The start history id expired, resync and fall back to one full inbox check
+            if e.resp.status != 404:
+                raise
+            self.history_id = None
+            self._check_inbox()
+            return
+
+        if message_ids:
+            self._process_batch(message_ids)
+
+
+    def _process_batch(self, message_ids):
+        """
+        Fetch messages in one batch request, fire only the latest effective signal and mark the fetched ones read.
+        """
+        service = self._get_service()
+        messages = []
+        fetched = []
+
+        def collect(request_id, response, exception):
+            if exception is None:
+                messages.append(response)
+                fetched.append(request_id)
+            else:
+                self.log_signal.emit(f"Error fetching message {request_id}: {exception}")
+
+        # Gmail accepts at most 100 calls per batch request
+        for start in range(0, len(message_ids), 100):
+            batch = service.new_batch_http_request(callback=collect)
+            for message_id in message_ids[start:start + 100]:
+                batch.add(service.users().messages().get(userId="me", id=message_id, format="minimal"), request_id=message_id)
+            batch.execute()
+
+        # Decode oldest first so the newest CALL/PUT wins and older ones in the burst never fire late
+        latest = None
+        for message in sorted(messages, key=lambda m: int(m.get("internalDate", 0))):
+            if self._signal_side(message) is not None:
+                latest = message
+        if latest is not None:
+            if len(messages) > 1:
+                self.log_signal.emit(f"Collapsed {len(messages)} alerts to the latest signal")
+            self._process_message(latest)
+
+        # A message that failed to load stays unread for the next poll, batchModify takes at most 1000 ids
+        for start in range(0, len(fetched), 1000):
+            service.users().messages().batchModify(userId="me", body={"ids": fetched[start:start + 1000], "removeLabelIds": ["UNREAD"]}).execute()
+
+
+    def _signal_side(self, message):
+        return self.alert_parser.side(message['snippet'])
+
+
+    def _process_message(self, message):
+        timestamp = int(message["internalDate"]) / 1000 if "internalDate" in message else None
+        signal = self.alert_parser.parse(message['snippet'], 'gmail', message.get("id"), timestamp)
+        if signal is None:
+            return
+        side = signal.side
+
+        if self.signal_sink is not None:
+            # The bus dedupes and dispatches, only drop signals for the side already held
+            if self.current_position != side:
+                self._record_latency(message)
+                self.log_signal.emit(f"{side} signal received: {signal.code}")
+                self.signal_sink(signal)
+        elif side == 'CALL':
+            if self.current_position != 'CALL' and not self.CALLEVENT.is_set():
+                self.CALLEVENT.set()
+                self.PUTEVENT.clear()
+                self._record_latency(message)
+                self.log_signal.emit(f"CALL signal received: {signal.code}")
+        elif side == 'PUT':
+            if self.current_position != 'PUT' and not self.PUTEVENT.is_set():
+                self.PUTEVENT.set()
+                self.CALLEVENT.clear()
+                self._record_latency(message)
+                self.log_signal.emit(f"PUT signal received: {signal.code}")
+
+
+    def _record_latency(self, message):
+        # internalDate is when Gmail received the email, in epoch milliseconds
+        if "internalDate" in message:
+            latency = time.time() - int(message["internalDate"]) / 1000
+            self.signal_latencies.append(latency)
+            self.log_signal.emit(f"Email to event latency: {latency * 1000:.0f} ms")
+
+
+    def watch(self):
+        """
+        Ask Gmail to publish inbox changes to the configured Pub/Sub topic, the watch lasts 7 days.
+        """
+        response = self._get_service().users().watch(userId="me", body={
+            "topicName": self.PUBSUB_TOPIC, "labelIds": ["INBOX"], "labelFilterAction": "include"}).execute()
+        self.watched_at = time.time()
+        if self.history_id is None:
+            self.history_id = response.get("historyId")
+        return response
+
+
+    def notify(self, history_id=None):
+        """
+        Wake the push checker, called for every Pub/Sub push notification.
+        """
+        self.NOTIFYEVENT.set()
+
+
+    def start_push_listener(self, port=None):
+        """
+        Local endpoint for the Pub/Sub push subscription.
+        """
+        gmail = self
+
+        class PushHandler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                try:
+                    envelope = json.loads(self.rfile.read(length))
+                    data = json.loads(base64.b64decode(envelope["message"]["data"]))
+                    gmail.notify(data.get("historyId"))
+                except (ValueError, KeyError):
+                    pass
+                # Pub/Sub only needs a 2xx to stop redelivering
+                self.send_response(204)
+                self.end_headers()
+
+            def log_message(self, format, *args):
+                pass
+
+        self.push_server = ThreadingHTTPServer(("0.0.0.0", port or self.PUSH_PORT), PushHandler)
+        threading.Thread(target=self.push_server.serve_forever, daemon=True).start()
+        return self.push_server
+
+
+    def _new_checker(self):
+        # A restart must not leave the previous checker running next to the new one
+        self.checker_stop.set()
+        self.NOTIFYEVENT.set()
+        self.checker_stop = threading.Event()
+        self.NOTIFYEVENT.clear()
+        return self.checker_stop
+
+
+    def check_email_push(self, fallback_interval=30, watch_renewal=86400):
+        """
+        Push ingestion: fetch history deltas whenever a notification arrives, with a slow safety poll.
+        The watch expires after 7 days, it is renewed every watch_renewal seconds.
+        """
+        if self.PUBSUB_TOPIC and self.push_server is None:
+            self.watch()
+            self.start_push_listener()
+        stop = self._new_checker()
+
+        def checker():
+            while self.check and not stop.is_set():
+                try:
+                    if self.PUBSUB_TOPIC and time.time() - (self.watched_at or 0) > watch_renewal:
+                        self.watch()
+                    self._check_history()
+                except Exception as e:
+                    self.log_signal.emit(f"Error checking inbox history: {e}")
+                self.NOTIFYEVENT.wait(fallback_interval)
+                self.NOTIFYEVENT.clear()
+        threading.Thread(target=checker, daemon=True).start()
 
 
     def check_email_automatic(self):    
+        if self.PUBSUB_TOPIC:
+            self.check_email_push()
+            return
+        stop = self._new_checker()
+
         def checker():
-            while self.check:
+            while self.check and not stop.is_set():
                 try:
                     self._check_inbox()
                 except Exception as e:
                     self.log_signal.emit(f"Error checking inbox: {e}")
-                time.sleep(1)
+                stop.wait(1)
         threading.Thread(target=checker, daemon=True).start()
         
 
-    def reset_position(self):
-        self.set_current_position(None)
-        self.CALLEVENT.clear()
-        self.PUTEVENT.clear()
+    def reset_position(self, side=None):
+        """
+        :param side: only reset while this is still the current position, None resets any
+        :type side: str
+        """
+        # The opposite side's flip may already have set its own position, that one stays
+        with self._position_lock:
+            if side is not None and self.current_position != side:
+                return
+            self.current_position = None
+            self.CALLEVENT.clear()
+            self.PUTEVENT.clear()
 
 
     def wait(self):
@@ -134,11 +352,16 @@ class Gmail:
     
 
     def set_current_position(self, pos):
-        self.current_position = pos
+        with self._position_lock:
+            self.current_position = pos
 
 
     def set_checker(self, check):
         self.check = check
+        if not check:
+            # End the checker, waking a push checker blocked on the next notification
+            self.checker_stop.set()
+            self.NOTIFYEVENT.set()
  
    
     def get_call_event(self):
@@ -0,0 +1,153 @@
+import time
+import threading
+
+
+class _Request:
+    def __init__(self, func, raw=None):
+        self.func = func
+        self.raw = raw
+
+    def execute(self):
+        return self.func()
+
+
+class StubGmailService:
+    """
+    In-memory stand-in for the Gmail API client returned by build("gmail", "v1", ...).
+
+    Supports the calls Gmail makes (messages list/get/modify/batchModify, batch
+    requests, history list, getProfile, watch) so ingestion can be exercised
+    and timed without Google.
+    deliver() drops a new unread message in the inbox and, if set, calls
+    on_deliver(history_id) the way a Pub/Sub push would.
+    """
+    def __init__(self, latency=0.0, on_deliver=None):
+        self.latency = latency
+        self.on_deliver = on_deliver
+        self.mailbox = {}
+        self.changes = []
+        self.history_id = 1
+        self.calls = 0
+        self._next_id = 1
+        self._lock = threading.Lock()
+
+
+    def _call(self, func):
+        def run():
+            self.calls += 1
+            time.sleep(self.latency)
+            with self._lock:
+                return func()
+        return _Request(run, func)
+
+
+    def deliver(self, snippet, internal_date=None):
+        with self._lock:
+            message_id = f"{self._next_id:016x}"
+            self._next_id += 1
+            self.history_id += 1
+            self.mailbox[message_id] = {
+                "id": message_id,
+                "snippet": snippet,
+                "labelIds": ["INBOX", "UNREAD"],
+                "internalDate": str(int((internal_date or time.time()) * 1000))
+            }
+            self.changes.append((self.history_id, message_id))
+            history_id = self.history_id
+        if self.on_deliver is not None:
+            self.on_deliver(str(history_id))
+        return message_id
+
+
+    # Resource accessors, users() returns the service itself
+    def users(self):
+        return self
+
+    def messages(self):
+        return self
+
+    def history(self):
+        return _History(self)
+
+
+    def getProfile(self, userId):
+        return self._call(lambda: {"historyId": str(self.history_id)})
+
+
+    def watch(self, userId, body):
+        return self._call(lambda: {"historyId": str(self.history_id), "expiration": str(int((time.time() + 7 * 86400) * 1000))})
+
+
+    def list(self, userId, labelIds=None, q=None):
+        def run():
+            unread = [{"id": m["id"]} for m in self.mailbox.values() if "UNREAD" in m["labelIds"]]
+            # Gmail lists newest first
+            return {"messages": unread[::-1]} if unread else {}
+        return self._call(run)
+
+
+    def get(self, userId, id, format=None):
+        return self._call(lambda: dict(self.mailbox[id], labelIds=list(self.mailbox[id]["labelIds"])))
+
+
+    def batchModify(self, userId, body):
+        def run():
+            for message_id in body["ids"]:
+                message = self.mailbox[message_id]
+                message["labelIds"] = [label for label in message["labelIds"] if label not in body.get("removeLabelIds", [])]
+            return {}
+        return self._call(run)
+
+
+    def new_batch_http_request(self, callback=None):
+        return _Batch(self, callback)
+
+
+    def modify(self, userId, id, body):
+        def run():
+            message = self.mailbox[id]
+            message["labelIds"] = [label for label in message["labelIds"] if label not in body.get("removeLabelIds", [])]
+            return {"id": id}
+        return self._call(run)
+
+
+class _Batch:
+    """
+    Runs every added request for the cost of a single API call, like a Gmail batch request.
+    """
+    def __init__(self, service, callback):
+        self.service = service
+        self.callback = callback
+        self.requests = []
+
+    def add(self, request, request_id=None):
+        self.requests.append((request_id or str(len(self.requests)), request))
+
+    def execute(self):
+        def run():
+            results = []
+            for request_id, request in self.requests:
+                try:
+                    results.append((request_id, request.raw(), None))
+                except Exception as e:
+                    results.append((request_id, None, e))
+            return results
+        for request_id, response, exception in self.service._call(run).execute():
+            if self.callback is not None:
+                self.callback(request_id, response, exception)
+
+
+class _History:
+    def __init__(self, service):
+        self.service = service
+
+    def list(self, userId, startHistoryId, labelId=None, historyTypes=None, pageToken=None):
+        service = self.service
+
+        def run():
+            start = int(startHistoryId)
+            records = [{"id": str(history_id), "messagesAdded": [{"message": {
+                "id": message_id, "labelIds": list(service.mailbox[message_id]["labelIds"])}}]}
+                for history_id, message_id in service.changes if history_id > start]
+            return {"history": records, "historyId": str(service.history_id)}
+        return service._call(run)
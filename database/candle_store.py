@@ -0,0 +1,168 @@
+import os
+import numpy as np
+import pandas as pd
+from zoneinfo import ZoneInfo
+
+EASTERN = ZoneInfo("America/New_York")
+# One row per candle, datetime in epoch milliseconds like price_history returns it
+CANDLE_DTYPE = np.dtype([('datetime', '<i8'), ('open', '<f8'), ('high', '<f8'), ('low', '<f8'), ('close', '<f8'), ('volume', '<f8')])
+
+
+def frequency_key(frequencyType, frequency):
+    """
+    price_history frequency -> partition directory name, e.g. ("minute", 1) -> "1m", ("daily", 1) -> "1d".
+    """
+    units = {'minute': 'm', 'daily': 'd', 'weekly': 'w', 'monthly': 'mo'}
+    if frequencyType not in units:
+        raise ValueError(f"Unsupported frequency type: {frequencyType}")
+    return f"{int(frequency)}{units[frequencyType]}"
+
+
+class CandleStore:
+    """
+    Candles partitioned as <root>/<SYMBOL>/<frequency>/<YYYY-MM-DD>.npy.
+
+    Each partition is a NumPy structured array (CANDLE_DTYPE) sorted by
+    datetime, one file per ET trading date, prices kept as float64. A range
+    query only opens the partitions whose date is in range, memory-maps them
+    and binary searches the time column at both ends, so a single day comes
+    back as a zero-copy view of the file.
+    """
+    def __init__(self, root='./database/candle_store'):
+        self.root = root
+
+
+    @staticmethod
+    def to_array(candles):
+        """
+        :param candles: price_history() json, its "candles" list, or a DataFrame with datetime/open/high/low/close/volume
+        :return: sorted structured array, duplicate datetimes keep the last candle
+        :rtype: numpy.ndarray
+        """
+        if isinstance(candles, dict):
+            candles = candles.get('candles', [])
+        if isinstance(candles, pd.DataFrame):
+            frame = candles.rename(columns=str.lower)
+            array = np.empty(len(frame), dtype=CANDLE_DTYPE)
+            for name in CANDLE_DTYPE.names:
+                array[name] = frame[name].to_numpy()
+        else:
+            array = np.empty(len(candles), dtype=CANDLE_DTYPE)
+            for name in CANDLE_DTYPE.names:
+                array[name] = np.fromiter((candle.get(name, 0) for candle in candles), dtype=CANDLE_DTYPE[name], count=len(candles))
+        return CandleStore._dedupe(array)
+
+
+    @staticmethod
+    def _dedupe(array):
+        # Stable sort, then keep the last row of every datetime so newer data wins
+        array = array[np.argsort(array['datetime'], kind='stable')]
+        if len(array) > 1:
+            keep = np.append(array['datetime'][1:] != array['datetime'][:-1], True)
+            array = array[keep]
+        return array
+
+
+    @staticmethod
+    def _dates(times):
+        # ET calendar date of every epoch millisecond as datetime64[D]
+        return pd.to_datetime(times, unit='ms', utc=True).tz_convert(EASTERN).tz_localize(None).to_numpy().astype('datetime64[D]')
+
+
+    def _directory(self, symbol, frequency):
+        return os.path.join(self.root, symbol.upper(), frequency)
+
+
+    def write(self, symbol, frequency, candles):
+        """
+        Merge candles into their date partitions, rewriting only the partitions touched.
+        :param frequency: frequency_key(), e.g. "1m"
+        :type frequency: str
+        :return: number of partitions written
+        :rtype: int
+        """
+        array = candles if isinstance(candles, np.ndarray) else self.to_array(candles)
+        if not len(array):
+            return 0
+        directory = self._directory(symbol, frequency)
+        os.makedirs(directory, exist_ok=True)
+
+        dates = self._dates(array['datetime'])
+        # Sorted by datetime, so each date is one contiguous run
+        boundaries = np.flatnonzero(dates[1:] != dates[:-1]) + 1
+        for chunk, date in zip(np.split(array, boundaries), dates[np.concatenate(([0], boundaries))]):
+            path = os.path.join(directory, f"{date}.npy")
+            if os.path.exists(path):
+                chunk = self._dedupe(np.concatenate((np.load(path), chunk)))
+            # Write then rename so readers never map a half written file
+            temporary = f"{path}.tmp.npy"
+            np.save(temporary, chunk)
+            os.replace(temporary, path)
+        return len(boundaries) + 1
+
+
+    def dates(self, symbol, frequency):
+        """
+        :return: stored partition dates, sorted ("YYYY-MM-DD")
+        :rtype: list
+        """
+        directory = self._directory(symbol, frequency)
+        if not os.path.isdir(directory):
+            return []
+        return sorted(name[:-4] for name in os.listdir(directory) if name.endswith('.npy') and '.tmp' not in name)
+
+
+    @staticmethod
+    def _date(value):
+        if isinstance(value, str):
+            return value[:10]
+        return pd.Timestamp(value).strftime('%Y-%m-%d')
+
+
+    @staticmethod
+    def _epoch(value, end=False):
+        # Dates alone cover the whole (ET) day, an end date includes its last candle
+        if isinstance(value, str) and len(value) <= 10:
+            stamp = pd.Timestamp(value, tz=EASTERN)
+            return int((stamp + pd.Timedelta(days=1)).timestamp() * 1000) - 1 if end else int(stamp.timestamp() * 1000)
+        stamp = pd.Timestamp(value)
+        if stamp.tzinfo is None:
+            stamp = stamp.tz_localize(EASTERN)
+        return int(stamp.timestamp() * 1000)
+
+
+    def query(self, symbol, frequency, start=None, end=None):
+        """
+        SPY 1m 2024-01-05..2024-08-12 is query("SPY", "1m", "2024-01-05", "2024-08-12").
+        :param start: first date or datetime (naive values are ET), unbounded if None
+        :param end: last date or datetime, inclusive, unbounded if None
+        :return: structured array sorted by datetime, a memory-mapped view when a single partition is hit
+        :rtype: numpy.ndarray
+        """
+        dates = self.dates(symbol, frequency)
+        first = self._date(start) if start is not None else None
+        last = self._date(end) if end is not None else None
+        dates = [date for date in dates if (first is None or date >= first) and (last is None or date <= last)]
+        if not dates:
+            return np.empty(0, dtype=CANDLE_DTYPE)
+
+        directory = self._directory(symbol, frequency)
+        parts = [np.load(os.path.join(directory, f"{date}.npy"), mmap_mode='r') for date in dates]
+        # Only the edge partitions can hold rows outside the range
+        if start is not None:
+            parts[0] = parts[0][np.searchsorted(parts[0]['datetime'], self._epoch(start), side='left'):]
+        if end is not None:
+            parts[-1] = parts[-1][:np.searchsorted(parts[-1]['datetime'], self._epoch(end, end=True), side='right')]
+        return parts[0] if len(parts) == 1 else np.concatenate(parts)
+
+
+    def frame(self, symbol, frequency, start=None, end=None):
+        """
+        query() as a DataFrame indexed by ET datetime.
+        :rtype: pandas.DataFrame
+        """
+        array = self.query(symbol, frequency, start, end)
+        frame = pd.DataFrame({name: array[name] for name in CANDLE_DTYPE.names[1:]},
+                             index=pd.to_datetime(array['datetime'], unit='ms', utc=True).tz_convert(EASTERN))
+        frame.index.name = 'datetime'
+        return frame
@@ -1,24 +1,82 @@
 import os
+import numpy as np
 import pandas as pd
-from datetime import datetime, timedelta
+from datetime import datetime
+from database.candle_store import CandleStore
+
+
+def local_timezone():
+    """
+    :return: the machine's zone name, from TZ or the zone /etc/localtime links to,
+             else its current fixed UTC offset
+    """
+    name = os.environ.get('TZ', '').lstrip(':')
+    if name:
+        return name
+    path = os.path.realpath('/etc/localtime')
+    if 'zoneinfo' + os.sep in path:
+        return path.split('zoneinfo' + os.sep, 1)[1]
+    return datetime.now().astimezone().tzinfo
+
 
 class DataManager:
     PUT_OI_CSV_PATH = "./database/high_oi/puts_oi.csv"
     CALL_OI_CSV_PATH = "./database/high_oi/calls_oi.csv"
     OPTION_CSV_PATH = './database/option_chains/option_chain.csv'
     CANDLE_CSV_PATH = './database/candle_history'
+    CANDLE_STORE_PATH = './database/candle_store'
+    EXCHANGE_TIMEZONE = 'America/New_York'
+    # Exported and charted candles are shown in the zone of the machine running the robot
+    LOCAL_TIMEZONE = local_timezone()
     ORDER_CSV_PATH = './database/option_chains/orders.csv'
 
+    # Column -> (contract key, dtype, fill value) for normalized option chains
+    CHAIN_COLUMNS = {
+        'Put/Call': ('putCall', object, None),
+        'Symbol': ('symbol', object, None),
+        'Description': ('description', object, None),
+        'Bid': ('bid', np.float64, np.nan),
+        'Ask': ('ask', np.float64, np.nan),
+        'Volume': ('totalVolume', np.int64, 0),
+        'Delta': ('delta', np.float64, np.nan),
+        'OI': ('openInterest', np.int64, 0),
+        'Expiration': (None, 'datetime64[D]', None),
+        'Strike': ('strikePrice', np.float64, np.nan),
+        'ITM': ('inTheMoney', np.bool_, False)
+    }
+
 
     @staticmethod
-    def store_data(data_type, df, file_name):
+    def store_data(data_type, df, file_name, overwrite=False):
         csv_path = DataManager._get_csv_path(data_type, file_name)
-        file_exists = os.path.isfile(csv_path)
+        os.makedirs(os.path.dirname(csv_path), exist_ok=True)
+        file_exists = os.path.isfile(csv_path) and not overwrite
         mode = 'a' if file_exists else 'w'
         header = not file_exists
 
         with open(csv_path, mode) as f:
-            df.to_csv(f, header=header, index=False, float_format='%.2f', sep='\t')
+            df.to_csv(f, header=header, index=False, sep='\t')
+
+
+    @staticmethod
+    def store_candles(symbol, frequency, candles):
+        """
+        Merge price_history() candles into the candle store at full precision.
+        :param frequency: candle_store.frequency_key(), e.g. "1m"
+        :type frequency: str
+        :return: number of date partitions written
+        :rtype: int
+        """
+        return CandleStore(DataManager.CANDLE_STORE_PATH).write(symbol, frequency, candles)
+
+
+    @staticmethod
+    def load_candles(symbol, frequency, start=None, end=None):
+        """
+        Candles for a date range as a DataFrame indexed by ET datetime, only the partitions in range are read.
+        :rtype: pandas.DataFrame
+        """
+        return CandleStore(DataManager.CANDLE_STORE_PATH).frame(symbol, frequency, start, end)
 
 
     @staticmethod
@@ -37,71 +95,88 @@ class DataManager:
 
     @staticmethod
     def _create_candle_dataframe(candles):
-        data = []
-        for ohlcv in candles['candles']:
-            datetime_value = ohlcv.get('datetime')
-            try:
-                # Try to parse datetime as milliseconds since epoch
-                datetime_parsed = pd.to_datetime(datetime_value, unit='ms')
-            except (ValueError, TypeError):
-                # If the above fails, treat it as a standard string format
-                datetime_parsed = pd.to_datetime(datetime_value)
-            # Adjust for timezone difference
-            datetime_adjusted = datetime_parsed - timedelta(hours=7)
-
-            candle_data = {
-                'Datetime': datetime_adjusted,
-                'Open': ohlcv.get('open'),
-                'High': ohlcv.get('high'),
-                'Low': ohlcv.get('low'),
-                'Close': ohlcv.get('close'),
-                'Volume': ohlcv.get('volume')
-            }
-            data.append(candle_data)
-        return pd.DataFrame(data)
+        """
+        :param candles: price_history() json or a CandleStore.query() array, datetimes in epoch milliseconds
+        :type candles: dict
+        :return: one row per candle, Datetime in LOCAL_TIMEZONE
+        :rtype: pandas.DataFrame
+        """
+        if isinstance(candles, np.ndarray):
+            # Stored candles already come one field per column
+            df = pd.DataFrame({column.title(): candles[column].astype(np.float64) for column in ('open', 'high', 'low', 'close')})
+            df['Volume'] = candles['volume'].astype(np.int64)
+            df.insert(0, 'Datetime', pd.to_datetime(pd.Series(candles['datetime']), unit='ms', utc=True).dt.tz_convert(DataManager.LOCAL_TIMEZONE))
+            return df
+
+        rows = candles['candles']
+        count = len(rows)
+        df = pd.DataFrame({column.title(): np.fromiter((row.get(column, np.nan) for row in rows), dtype=np.float64, count=count)
+                           for column in ('open', 'high', 'low', 'close')})
+        df['Volume'] = np.fromiter((row.get('volume', 0) for row in rows), dtype=np.int64, count=count)
+
+        if count and isinstance(rows[0].get('datetime'), str):
+            # Formatted timestamps are exchange time
+            datetimes = pd.to_datetime(pd.Series([row['datetime'] for row in rows])).dt.tz_localize(DataManager.EXCHANGE_TIMEZONE)
+        else:
+            datetimes = pd.to_datetime(pd.Series(np.fromiter((row.get('datetime') for row in rows), dtype=np.int64, count=count)), unit='ms', utc=True)
+
+        df.insert(0, 'Datetime', datetimes.dt.tz_convert(DataManager.LOCAL_TIMEZONE))
+        return df
 
 
     @staticmethod
     def _create_option_dataframe(options):
-        data = []
-        exp_date_map = options.get('callExpDateMap') or options.get('putExpDateMap')
-        for exp_date, strikes in exp_date_map.items():
-            for strike, options_list in strikes.items():
-                for option in options_list:
-                    option_data = {
-                        'Put/Call': option.get('putCall'),
-                        'Symbol': option.get('symbol'),
-                        'Description': option.get('description'),
-                        'Bid': option.get('bid'),
-                        'Ask': option.get('ask'),
-                        'Volume': option.get('totalVolume'),
-                        'Delta': option.get('delta'),
-                        'OI': option.get('openInterest'),
-                        'Expiration': exp_date,
-                        'Strike': strike,
-                        'ITM': option.get('inTheMoney')
-                    }
-                    data.append(option_data)
-        return pd.DataFrame(data)
+        return pd.DataFrame(DataManager.normalize_chain(options))
+
+
+    @staticmethod
+    def normalize_chain(options, columns=None):
+        """
+        Flatten both sides of an option chain response into typed NumPy columns in one pass.
+        :param options: get_chains() json
+        :type options: dict
+        :param columns: names from CHAIN_COLUMNS to extract, all of them by default
+        :type columns: list
+        :return: column name -> array, one row per contract (calls first, then puts)
+        :rtype: dict
+        """
+        columns = columns or list(DataManager.CHAIN_COLUMNS)
+        contracts = []
+        expirations = []
+        for exp_date_map in (options.get('callExpDateMap'), options.get('putExpDateMap')):
+            for exp_date, strikes in (exp_date_map or {}).items():
+                start = len(contracts)
+                for options_list in strikes.values():
+                    contracts.extend(options_list)
+                # Keys look like "2024-10-30:0", expiry date then days to expiration
+                expirations.extend([exp_date.split(':')[0]] * (len(contracts) - start))
+
+        count = len(contracts)
+        data = {}
+        for column in columns:
+            key, dtype, fill = DataManager.CHAIN_COLUMNS[column]
+            if key is None:
+                data[column] = np.array(expirations, dtype=dtype)
+            else:
+                # A JSON null reads as missing, e.g. "delta": null on a contract without greeks
+                values = (contract.get(key) for contract in contracts)
+                data[column] = np.fromiter((fill if value is None else value for value in values), dtype=dtype, count=count)
+        return data
 
 
     @staticmethod
     def _create_high_oi_dataframe(data):
-        now = datetime.now().strftime("%m/%d/%Y")
-        df = pd.DataFrame({
-            'Datetime': [now],
-            'Level1': [str(data[0]).ljust(10)],
-            'OpenInterest1': [str(data[1]).ljust(10)],
-            'Level2': [str(data[2]).ljust(10)],
-            'OpenInterest2': [str(data[3]).ljust(10)],
-            'Level3': [str(data[4]).ljust(10)],
-            'OpenInterest3': [str(data[5]).ljust(10)],            
-            'Level4': [str(data[6]).ljust(10)],
-            'OpenInterest4': [str(data[7]).ljust(10)],
-            'Level5': [str(data[8]).ljust(10)],
-            'OpenInterest5': [str(data[9]).ljust(10)]
-        })
-        return df
+        """
+        :param data: [strike1, oi1, ..., strike5, oi5], highest open interest first
+        :type data: list
+        :return: one timestamped row, missing levels left empty
+        :rtype: pandas.DataFrame
+        """
+        row = {'Datetime': datetime.now().strftime("%Y-%m-%d %H:%M:%S")}
+        for level in range(5):
+            row[f'Level{level + 1}'] = data[2 * level] if 2 * level < len(data) else np.nan
+            row[f'OpenInterest{level + 1}'] = data[2 * level + 1] if 2 * level + 1 < len(data) else np.nan
+        return pd.DataFrame([row])
 
 
     @staticmethod
@@ -132,9 +207,8 @@ class DataManager:
 
 
     @staticmethod
-    # Needs work
-    def load_data(data_type):
-        csv_path = DataManager._get_csv_path(data_type)
+    def load_data(data_type, file_name=None):
+        csv_path = DataManager._get_csv_path(data_type, file_name)
         if os.path.exists(csv_path):
             return pd.read_csv(csv_path, sep='\t')
         return pd.DataFrame()
\ No newline at end of file
@@ -0,0 +1,279 @@
+"""
+Chunked, resumable price_history downloads into the candle store.
+
+    python -m database.history_downloader SPY --start 2024-01-05 --end 2024-08-12 --file spy_1m.tsv
+
+The CLI reuses the saved Schwab tokens, run the GUI once first if they have expired.
+"""
+import os
+import json
+import time
+import argparse
+import threading
+import pandas as pd
+from pandas.tseries.holiday import (AbstractHolidayCalendar, Holiday, GoodFriday, USMartinLutherKingJr, USPresidentsDay,
+                                    USMemorialDay, USLaborDay, USThanksgivingDay, nearest_workday, sunday_to_monday)
+from pandas.tseries.offsets import CustomBusinessDay
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from database.candle_store import CandleStore, EASTERN, frequency_key
+from database.data_manager import DataManager
+
+# Calendar days one price_history call covers per frequency type
+WINDOW_DAYS = {'minute': 10, 'daily': 365, 'weekly': 3650, 'monthly': 3650}
+# End of the extended hours session, a day fetched before then is incomplete
+SESSION_END = pd.Timedelta(hours=20)
+
+
+class ExchangeCalendar(AbstractHolidayCalendar):
+    """
+    NYSE full day holidays. One-off closures (e.g. days of mourning) are not listed, those dates are just refetched.
+    """
+    rules = [
+        Holiday('New Years Day', month=1, day=1, observance=sunday_to_monday),
+        USMartinLutherKingJr,
+        USPresidentsDay,
+        GoodFriday,
+        USMemorialDay,
+        Holiday('Juneteenth', month=6, day=19, start_date='2022-01-01', observance=nearest_workday),
+        Holiday('Independence Day', month=7, day=4, observance=nearest_workday),
+        USLaborDay,
+        USThanksgivingDay,
+        Holiday('Christmas', month=12, day=25, observance=nearest_workday)
+    ]
+
+
+TRADING_DAY = CustomBusinessDay(calendar=ExchangeCalendar())
+
+
+class RateLimiter:
+    """
+    Token bucket shared by the download workers, rate requests per second with bursts up to burst.
+    """
+    def __init__(self, rate=2.0, burst=4):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class HistoryDownloader:
+    """
+    Splits a date range into API sized windows and fetches them concurrently.
+
+    Every finished window is merged into the CandleStore and recorded in a
+    checkpoint file next to the candle_history exports once its last session
+    has closed, so a rerun only asks for the windows that are missing. Windows
+    whose trading days are all stored already are skipped as well, unless one
+    of those days was stored while its session was still running. Once every window is in, the whole range is
+    exported as one deduplicated file under candle_history.
+    """
+    def __init__(self, schwab, store=None, max_workers=4, rate=2.0, retries=3, progress=None,
+                 checkpoint_directory=os.path.join(DataManager.CANDLE_CSV_PATH, '.checkpoints')):
+        self.schwab = schwab
+        self.store = store or CandleStore(DataManager.CANDLE_STORE_PATH)
+        self.max_workers = max_workers
+        self.limiter = RateLimiter(rate)
+        self.retries = retries
+        self.progress = progress
+        self.checkpoint_directory = checkpoint_directory
+
+
+    @staticmethod
+    def windows(start, end, frequencyType):
+        """
+        :param start: first date, "YYYY-MM-DD"
+        :param end: last date, inclusive
+        :return: (first date, last date) of every window, inclusive, as "YYYY-MM-DD"
+        :rtype: list
+        """
+        step = WINDOW_DAYS.get(frequencyType)
+        if step is None:
+            raise ValueError(f"Unsupported frequency type: {frequencyType}")
+        first, last = pd.Timestamp(start), pd.Timestamp(end)
+        windows = []
+        while first <= last:
+            window_end = min(first + pd.Timedelta(days=step - 1), last)
+            windows.append((first.strftime('%Y-%m-%d'), window_end.strftime('%Y-%m-%d')))
+            first = window_end + pd.Timedelta(days=1)
+        return windows
+
+
+    def _checkpoint_path(self, symbol, frequency):
+        return os.path.join(self.checkpoint_directory, f"{symbol.upper()}_{frequency}.json")
+
+
+    def _load_checkpoint(self, symbol, frequency):
+        """
+        :return: finished windows and the dates stored before their session ended
+        :rtype: tuple
+        """
+        path = self._checkpoint_path(symbol, frequency)
+        if not os.path.exists(path):
+            return set(), set()
+        with open(path) as f:
+            checkpoint = json.load(f)
+        # Older checkpoints are a plain list of windows
+        if isinstance(checkpoint, list):
+            checkpoint = {'windows': checkpoint}
+        return {tuple(window) for window in checkpoint['windows']}, set(checkpoint.get('partial', []))
+
+
+    def _save_checkpoint(self, symbol, frequency, done, partial):
+        os.makedirs(self.checkpoint_directory, exist_ok=True)
+        path = self._checkpoint_path(symbol, frequency)
+        temporary = f"{path}.tmp"
+        with open(temporary, 'w') as f:
+            json.dump({'windows': sorted(done), 'partial': sorted(partial)}, f)
+        os.replace(temporary, path)
+
+
+    @staticmethod
+    def _complete(window, now):
+        # Every session in the window is over, nothing can be added to it any more
+        return now >= pd.Timestamp(window[1], tz=EASTERN) + SESSION_END
+
+
+    @staticmethod
+    def trading_days(first, last):
+        """
+        :return: exchange trading days from first to last, inclusive, as "YYYY-MM-DD"
+        :rtype: list
+        """
+        return list(pd.date_range(first, last, freq=TRADING_DAY).strftime('%Y-%m-%d'))
+
+
+    def _stored(self, window, stored_dates, partial, now):
+        # Every trading day needs a partition written after its session ended
+        if not self._complete(window, now):
+            return False
+        return all(date in stored_dates and date not in partial for date in self.trading_days(*window))
+
+
+    def _fetch(self, symbol, periodType, period, frequencyType, frequency, window):
+        """
+        :return: the window's candles, retried with backoff on errors and 429s
+        :rtype: list
+        """
+        # Whole ET days, the end date includes its last candle
+        start = pd.Timestamp(window[0], tz=EASTERN).to_pydatetime()
+        end = (pd.Timestamp(window[1], tz=EASTERN) + pd.Timedelta(days=1, milliseconds=-1)).to_pydatetime()
+        for attempt in range(self.retries + 1):
+            self.limiter.acquire()
+            try:
+                response = self.schwab.price_history(symbol, periodType, period, frequencyType, frequency, start, end, True, False)
+                if response.ok:
+                    return response.json().get('candles', [])
+                error = f"HTTP {response.status_code}"
+            except Exception as e:
+                error = repr(e)
+            if attempt < self.retries:
+                time.sleep(2 ** attempt)
+        raise RuntimeError(f"{symbol} {window[0]}..{window[1]}: {error}")
+
+
+    def download(self, symbol, periodType, period, frequencyType, frequency, start, end, file_name=None):
+        """
+        :param start: first date, "YYYY-MM-DD"
+        :param end: last date, inclusive
+        :param file_name: export the merged range to candle_history/file_name when given
+        :return: windows, skipped, fetched, failed, candles
+        :rtype: dict
+        """
+        frequency_name = frequency_key(frequencyType, frequency)
+        windows = self.windows(start, end, frequencyType)
+        done, partial = self._load_checkpoint(symbol, frequency_name)
+        stored_dates = set(self.store.dates(symbol, frequency_name))
+        now = pd.Timestamp.now(tz=EASTERN)
+        today = now.strftime('%Y-%m-%d')
+        pending = [window for window in windows if window not in done and not self._stored(window, stored_dates, partial, now)]
+
+        summary = {'windows': len(windows), 'skipped': len(windows) - len(pending), 'fetched': 0, 'failed': [], 'candles': 0}
+        self._report(summary['skipped'], len(windows), None)
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = {executor.submit(self._fetch, symbol, periodType, period, frequencyType, frequency, window): window
+                       for window in pending}
+            for future in as_completed(futures):
+                window = futures[future]
+                try:
+                    candles = future.result()
+                except RuntimeError as e:
+                    summary['failed'].append(str(e))
+                else:
+                    # Store and checkpoint writes all happen on this thread
+                    self.store.write(symbol, frequency_name, candles)
+                    if self._complete(window, now):
+                        done.add(window)
+                        partial.difference_update(self.trading_days(*window))
+                    elif window[0] <= today and self.trading_days(today, today):
+                        # Today's partition is incomplete until a fetch after the close replaces it
+                        partial.add(today)
+                    self._save_checkpoint(symbol, frequency_name, done, partial)
+                    summary['fetched'] += 1
+                    summary['candles'] += len(candles)
+                self._report(summary['skipped'] + summary['fetched'] + len(summary['failed']), len(windows), window)
+
+        if file_name:
+            self.export(symbol, frequency_name, start, end, file_name)
+        return summary
+
+
+    def _report(self, completed, total, window):
+        if self.progress is not None:
+            self.progress(completed, total, window)
+
+
+    def export(self, symbol, frequency, start, end, file_name):
+        """
+        Write the stored range as one tab separated file, replacing any earlier export.
+        :return: rows written
+        :rtype: int
+        """
+        df = DataManager.create_dataframe('candles', self.store.query(symbol, frequency, start, end))
+        DataManager.store_data('candles', df, file_name, overwrite=True)
+        return len(df)
+
+
+class _PrintLog:
+    # Stands in for the Qt log signal outside the GUI
+    @staticmethod
+    def emit(message):
+        print(message)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('symbol')
+    parser.add_argument('--start', required=True, help='first date, YYYY-MM-DD')
+    parser.add_argument('--end', required=True, help='last date, YYYY-MM-DD')
+    parser.add_argument('--period-type', default='day')
+    parser.add_argument('--period', type=int, default=None)
+    parser.add_argument('--frequency-type', default='minute')
+    parser.add_argument('--frequency', type=int, default=1)
+    parser.add_argument('--file', help='export file name under database/candle_history')
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--rate', type=float, default=2.0, help='requests per second')
+    args = parser.parse_args()
+
+    from schwab.api import Schwab
+
+    def progress(completed, total, window):
+        print(f"\r{completed}/{total} windows", end='' if completed < total else '\n', flush=True)
+
+    downloader = HistoryDownloader(Schwab(log_signal=_PrintLog()), max_workers=args.workers, rate=args.rate, progress=progress)
+    summary = downloader.download(args.symbol, args.period_type, args.period, args.frequency_type, args.frequency,
+                                  args.start, args.end, args.file)
+    print(json.dumps(summary, indent=4))
@@ -0,0 +1,255 @@
+import time
+import queue
+import sqlite3
+import threading
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS signals (
+    id INTEGER PRIMARY KEY,
+    received_at REAL NOT NULL,
+    alert_time REAL,
+    source TEXT,
+    alert_id TEXT,
+    side TEXT,
+    code TEXT,
+    timeframe TEXT,
+    ticker TEXT,
+    price REAL,
+    action TEXT
+);
+CREATE INDEX IF NOT EXISTS signals_received_at ON signals (received_at);
+CREATE INDEX IF NOT EXISTS signals_alert_id ON signals (alert_id);
+
+CREATE TABLE IF NOT EXISTS orders (
+    id INTEGER PRIMARY KEY,
+    created_at REAL NOT NULL,
+    alert_id TEXT,
+    instruction TEXT,
+    symbol TEXT,
+    quantity INTEGER,
+    price REAL,
+    status TEXT
+);
+CREATE INDEX IF NOT EXISTS orders_created_at ON orders (created_at);
+CREATE INDEX IF NOT EXISTS orders_alert_id ON orders (alert_id);
+
+CREATE TABLE IF NOT EXISTS fills (
+    id INTEGER PRIMARY KEY,
+    filled_at REAL NOT NULL,
+    alert_id TEXT,
+    instruction TEXT,
+    symbol TEXT,
+    quantity INTEGER,
+    price REAL
+);
+CREATE INDEX IF NOT EXISTS fills_filled_at ON fills (filled_at);
+CREATE INDEX IF NOT EXISTS fills_symbol ON fills (symbol, filled_at);
+
+CREATE TABLE IF NOT EXISTS positions (
+    id INTEGER PRIMARY KEY,
+    symbol TEXT NOT NULL,
+    side TEXT,
+    alert_id TEXT,
+    code TEXT,
+    quantity INTEGER,
+    entry_price REAL,
+    opened_at REAL NOT NULL,
+    exit_price REAL,
+    closed_at REAL,
+    pnl REAL
+);
+CREATE INDEX IF NOT EXISTS positions_open ON positions (symbol, closed_at);
+CREATE INDEX IF NOT EXISTS positions_closed_at ON positions (closed_at);
+CREATE INDEX IF NOT EXISTS positions_code ON positions (code);
+"""
+
+
+class Ledger:
+    """
+    SQLite (WAL) record of signals, orders, fills and positions.
+
+    The record_* calls only put a statement on a queue, one writer thread
+    drains it and commits up to batch_size statements per transaction, so the
+    trading threads never wait on the disk. Reads open their own connection,
+    WAL lets them run while the writer commits.
+    """
+    CONTRACT_MULTIPLIER = 100
+
+    def __init__(self, path='./database/ledger.db', batch_size=200, flush_interval=0.25):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue = queue.Queue()
+        self.written = 0
+        self.batches = 0
+        self.errors = 0
+        self._thread = None
+
+        connection = self._connect()
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.executescript(SCHEMA)
+        connection.close()
+
+
+    def _connect(self):
+        connection = sqlite3.connect(self.path, timeout=10)
+        connection.execute("PRAGMA synchronous=NORMAL")
+        return connection
+
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="ledger", daemon=True)
+            self._thread.start()
+
+
+    def stop(self):
+        """
+        Write everything queued and stop the writer.
+        """
+        if self._thread is not None and self._thread.is_alive():
+            self.queue.put(None)
+            self._thread.join(10)
+
+
+    def flush(self, timeout=5):
+        """
+        Block until every statement queued so far is committed.
+        """
+        if self._thread is None or not self._thread.is_alive():
+            return False
+        done = threading.Event()
+        self.queue.put(done)
+        return done.wait(timeout)
+
+
+    def _run(self):
+        connection = self._connect()
+        running = True
+        while running:
+            try:
+                batch = [self.queue.get(timeout=self.flush_interval)]
+            except queue.Empty:
+                continue
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            events = []
+            try:
+                with connection:
+                    for item in batch:
+                        if item is None:
+                            running = False
+                        elif isinstance(item, threading.Event):
+                            events.append(item)
+                        else:
+                            connection.execute(*item)
+                            self.written += 1
+                self.batches += 1
+            except sqlite3.Error as e:
+                # The whole batch rolled back, it is dropped rather than retried forever
+                self.errors += 1
+                print(f"Ledger write failed: {e}")
+            for event in events:
+                event.set()
+        connection.close()
+
+
+    def _write(self, sql, params):
+        self.queue.put((sql, params))
+
+
+    def record_signal(self, signal, action=None):
+        """
+        :param signal: interface.signal_bus.Signal
+        :param action: what was done with it, e.g. "FLIP" or "IGNORED"
+        :type action: str
+        """
+        self._write("INSERT INTO signals (received_at, alert_time, source, alert_id, side, code, timeframe, ticker, price, action) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (time.time(), signal.timestamp, signal.source, signal.alert_id, signal.side, signal.code,
+                     signal.timeframe, signal.ticker, signal.price, action))
+
+
+    def record_order(self, order, alert_id=None, status='SUBMITTED'):
+        """
+        :param order: order as posted to Schwab (see Client.create_order)
+        :type order: dict
+        """
+        leg = order["orderLegCollection"][0]
+        self._write("INSERT INTO orders (created_at, alert_id, instruction, symbol, quantity, price, status) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (time.time(), alert_id, leg["instruction"], leg["instrument"]["symbol"], leg["quantity"], order.get("price"), status))
+
+
+    def record_fill(self, symbol, instruction, quantity, price, alert_id=None):
+        self._write("INSERT INTO fills (filled_at, alert_id, instruction, symbol, quantity, price) VALUES (?, ?, ?, ?, ?, ?)",
+                    (time.time(), alert_id, instruction, symbol, quantity, price))
+
+
+    def open_position(self, symbol, side, quantity, price, alert_id=None, code=None):
+        self._write("INSERT INTO positions (symbol, side, alert_id, code, quantity, entry_price, opened_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (symbol, side, alert_id, code, quantity, price, time.time()))
+
+
+    def close_position(self, symbol, price):
+        """
+        Close the open position in symbol at price (per share, the fill price, never the position's
+        market value), P&L in dollars.
+        """
+        self._write("UPDATE positions SET exit_price = ?, closed_at = ?, pnl = (? - entry_price) * quantity * ? "
+                    "WHERE symbol = ? AND closed_at IS NULL",
+                    (price, time.time(), price, self.CONTRACT_MULTIPLIER, symbol))
+
+
+    def _query(self, sql, params=()):
+        connection = self._connect()
+        try:
+            connection.row_factory = sqlite3.Row
+            return [dict(row) for row in connection.execute(sql, params)]
+        finally:
+            connection.close()
+
+
+    def open_positions(self):
+        """
+        :rtype: list
+        """
+        return self._query("SELECT * FROM positions WHERE closed_at IS NULL ORDER BY opened_at")
+
+
+    def daily_pnl(self, days=30):
+        """
+        :return: date, trades, wins, pnl per local trading day, most recent first
+        :rtype: list
+        """
+        return self._query("SELECT date(closed_at, 'unixepoch', 'localtime') AS date, COUNT(*) AS trades, "
+                           "SUM(pnl > 0) AS wins, ROUND(SUM(pnl), 2) AS pnl FROM positions "
+                           "WHERE closed_at >= ? GROUP BY date ORDER BY date DESC",
+                           (time.time() - days * 86400,))
+
+
+    def alert_stats(self, since=None):
+        """
+        :param since: epoch seconds, all history if None
+        :return: per alert code signals received, trades, wins, win rate, total and average P&L
+        :rtype: list
+        """
+        since = since or 0
+        return self._query("SELECT s.code, s.signals, s.ignored, COALESCE(p.trades, 0) AS trades, COALESCE(p.wins, 0) AS wins, "
+                           "ROUND(1.0 * p.wins / p.trades, 3) AS win_rate, ROUND(p.pnl, 2) AS pnl, ROUND(p.pnl / p.trades, 2) AS average_pnl "
+                           "FROM (SELECT code, COUNT(*) AS signals, SUM(action = 'IGNORED') AS ignored FROM signals "
+                           "      WHERE received_at >= ? GROUP BY code) AS s "
+                           "LEFT JOIN (SELECT code, COUNT(*) AS trades, SUM(pnl > 0) AS wins, SUM(pnl) AS pnl FROM positions "
+                           "           WHERE closed_at IS NOT NULL AND opened_at >= ? GROUP BY code) AS p ON p.code = s.code "
+                           "ORDER BY pnl DESC",
+                           (since, since))
+
+
+    def stats(self):
+        """
+        :rtype: dict
+        """
+        return {'written': self.written, 'batches': self.batches, 'queued': self.queue.qsize(), 'errors': self.errors}
@@ -1,14 +1,23 @@
 from crypt import methods
 import json
-import threading
 import time
-from datetime import datetime
+import threading
 from setting.dates  import dates
 from PyQt5.QtCore import QThread, pyqtSignal
 from cloud_services.api import Gmail
+from cloud_services.alert_parser import AlertParser
 from database.data_manager import DataManager
+from database.history_downloader import HistoryDownloader
+from database.ledger import Ledger
 from schwab.api import Schwab
+from schwab.cache import ChainCache
 from strategy import high_open_interest
+from strategy.high_open_interest import OpenInterestLevels
+from strategy.contract_index import ContractIndex
+from interface.position_monitor import PositionMonitor
+from interface.execution import ExecutionEngine
+from interface.signal_bus import SignalBus, GmailSource, WebhookSource, FileSource
+from interface.startup import Startup
 
 
 class Client(QThread):
@@ -16,14 +25,24 @@ class Client(QThread):
     log_dict_signal = pyqtSignal(dict)
     position_update_signal = pyqtSignal(str, float, float, float, str)
     trade_update_signal = pyqtSignal(str, str, float, float, float, str)
+    candle_progress_signal = pyqtSignal(int, int)
+    stopped_signal = pyqtSignal(str)
 
-    def __init__(self, parent=None):
+    def __init__(self, parent=None, startup=None):
         super().__init__(parent)
-        self.call_strikes, self.put_strikes = high_open_interest.retrieveData()
-        self.schwab = Schwab(log_signal=self.log_signal)
-        self.schwab.request_input_signal.connect(parent.request_user_input)
-        self.gmail = Gmail(log_signal=self.log_signal)
-        self.database = DataManager()
+        # Subsystems are built by the startup stages below, off the UI thread
+        self.startup = startup if startup is not None else Startup()
+        self.schwab = None
+        self.gmail = None
+        self.database = None
+        self.ledger = None
+        self.execution = None
+        self.signal_bus = None
+        self.chain_cache = None
+        self.oi_levels = None
+        self.pending_entry = None
+        self.signal_sources = {}
+        self.contract_rank_mode = 'closest_delta'
         self.settings = {}
         self.schedule_auto_start = None
         self.max_position_size = None
@@ -32,99 +51,199 @@ class Client(QThread):
         self.max_contract_price = None
         self.least_delta = None
         self.strategies = None
+        self.position_monitor = None
+        self.reconcile_interval = 15
         self.today, self.tomorrow = dates()
+        self.initialize()
+
+
+    def initialize(self, failed_only=False):
+        """
+        Start the subsystem stages, Schwab, Gmail and the database load side by side.
+        :param failed_only: only stage again the ones that failed, the stages after a failed one failed with it
+        :type failed_only: bool
+        :return: names of the stages started
+        :rtype: list
+        """
+        stages = [('database', self._init_database, ()),
+                  ('schwab', self._init_schwab, ()),
+                  ('gmail', self._init_gmail, ()),
+                  ('signals', self._init_signals, ('gmail',)),
+                  ('engine', self._init_engine, ('database', 'schwab', 'signals'))]
+        started = []
+        for name, func, after in stages:
+            if failed_only and name not in self.startup.errors:
+                continue
+            self.startup.stage(name, func, after=after)
+            started.append(name)
+        return started
+
+
+    def _init_database(self):
+        self.database = DataManager()
+        self.ledger = Ledger()
+
+
+    def _init_schwab(self):
+        # .env parse, key and token checks
+        self.schwab = Schwab(log_signal=self.log_signal)
+        if self.parent() is not None:
+            self.schwab.request_input_signal.connect(self.parent().request_user_input)
+
+
+    def _init_gmail(self):
+        # OAuth token and service account load
+        self.gmail = Gmail(log_signal=self.log_signal)
+
+
+    def _init_signals(self):
+        self.signal_bus = SignalBus(log_signal=self.log_signal)
+        self.signal_bus.add_source(GmailSource(self.gmail))
+
+
+    def _init_engine(self):
+        self.execution = ExecutionEngine(self)
+        self.chain_cache = ChainCache(self._load_chain, lambda options: ContractIndex(self.database.normalize_chain(options, ContractIndex.COLUMNS)),
+                                      log_signal=self.log_signal)
+        # Levels load in the background once run() starts, nothing here waits on the network
+        self.oi_levels = OpenInterestLevels(self._load_open_interest, on_update=self._log_open_interest, log_signal=self.log_signal)
 
 
     def run(self):
         """
         """
+        # Wait for the startup stages, a stop request gives up waiting
+        while not self.startup.wait('engine', timeout=0.5):
+            if 'engine' in self.startup.errors:
+                self.log_signal.emit(f"Robot cannot start, startup failed: {self.startup.errors}")
+                self.stopped_signal.emit("Startup failed")
+                return
+            if self.isInterruptionRequested():
+                return
+
+        self.gmail.set_checker(True)
+        self.gmail.check_email_automatic()
+
         self.log_signal.emit("Robot Connecting To API's...")
         self.schwab.update_tokens_automatic()
         self.log_signal.emit("All APIs Authenticated!")
 
-        # Make a Database in sql and authenticate the account here
-        self.database.create_dataframe('high_oi', self.call_strikes)
-        self.database.create_dataframe('high_oi', self.put_strikes)
+        # Load the account hash once so trade actions never request it, a failure is retried on the first trade
+        if self.schwab.account_hash() is None:
+            self.log_signal.emit("Account hash unavailable, trades fail until it loads")
+
+        # Keep both option chains warm so a signal never waits on get_chains
+        self.chain_cache.start()
+
+        # Orders, fills, positions and signals are written to the ledger in the background
+        self.ledger.start()
+
+        # Highest open interest levels, every change is appended to the high_oi history
+        self.oi_levels.start()
 
         self.log_signal.emit("Start Scrapping For Alerts...")
 
-        threading.Thread(target=self.handleCallEvent, daemon=True).start()
-        threading.Thread(target=self.handlePutEvent, daemon=True).start()  
-              
+        # Gmail, webhook and file signals all go through one consumer
+        self.signal_bus.start(self.handle_signal)
+        self.startup.mark('trading')
+        self.log_signal.emit(f"Trading ready, startup stages (s): {self.startup.stats()}")
+
         # Check for open positions
         # self.check_position(self.position_type())
 
 
-    def handlePutEvent(self):
+    def stop_trading(self):
         """
+        Stop taking signals and refreshing the chains and open interest levels, run() starts them again.
         """
-        while True:
-            self.gmail.get_put_event().wait()
-            
-            open_position = self.gmail.get_current_position()
-            self.log_signal.emit(f"Current position: {open_position}")
+        if self.gmail is not None:
+            self.gmail.set_checker(False)
+        for subsystem in (self.signal_bus, self.chain_cache, self.oi_levels):
+            if subsystem is not None:
+                subsystem.stop()
 
-            if open_position != 'PUT':
-                self.sell_position(self.position_type())
-                put_contract = self.best_contract('PUT')
 
-                if put_contract is not None:
-                    self.buy_position(put_contract, 'PUT')
-                    self.gmail.set_current_position('PUT')
-                    self.log_signal.emit("Checking contracts market value...")
-                    self.check_position('PUT')
-                    
-                self.gmail.reset_position()
-            else:
-                self.log_signal.emit("Ignoring PUT signal due to existing PUT position")
-            self.gmail.get_put_event().clear()
-
-
-    def handleCallEvent(self):
+    def handle_signal(self, signal):
         """
+        Runs on the bus worker of the signal's side, so only one flip per side is in flight.
+        :param signal: accepted signal from the bus
+        :type signal: interface.signal_bus.Signal
         """
-        while True:
-            self.gmail.get_call_event().wait()
-            
-            open_position = self.gmail.get_current_position()
-            self.log_signal.emit(f"Current position: {open_position}")
+        side = signal.side
+        open_position = self.gmail.get_current_position()
+        self.log_signal.emit(f"{side} signal from {signal.source}, current position: {open_position}")
 
-            if open_position != 'CALL':
-                self.sell_position(self.position_type())
-                call_contract = self.best_contract('CALL')
+        if open_position != side:
+            self.ledger.record_signal(signal, 'FLIP')
+            if self.position_monitor is not None:
+                self.position_monitor.stop()
+            # Close the open position and open the new one concurrently
+            contract = self.execution.flip(side, signal_time=signal.received, signal=signal)
+            self.log_signal.emit(f"Signal bus stats: {self.signal_bus.stats()}")
 
-                if call_contract is not None:
-                    self.buy_position(call_contract, 'CALL')
-                    self.gmail.set_current_position('CALL')
+            if contract is not None:
+                self.gmail.set_current_position(side)
+                self.log_signal.emit("Checking contracts market value...")
+                self.check_position(side)
 
-                    self.log_signal.emit("Checking contracts market value...")
-                    self.check_position('CALL')
-                    
-                self.gmail.reset_position()
-            else:
-                self.log_signal.emit("Ignoring CALL signal due to existing CALL position")
-            self.gmail.get_call_event().clear()
+            # Only forget this side's position, never one the other side's flip has taken since
+            self.gmail.reset_position(side)
+        else:
+            self.ledger.record_signal(signal, 'IGNORED')
+            self.log_signal.emit(f"Ignoring {side} signal due to existing {side} position")
 
 
     def best_contract(self, type):
         """
         """
         self.log_signal.emit(f"Searching for best {type} contract...")
-        
+        return self.select_contract(type, self.fetch_chain(type))
+
+
+    def fetch_chain(self, type):
+        """
+        """
+        # Contract index from the pre-warmed cache
+        contract_index = self.chain_cache.get(type)
+        self.log_signal.emit(f"Option chain cache: {self.chain_cache.stats()}")
+        return contract_index
+
+
+    def _load_chain(self, type):
+        """
+        """
         # Request the option chain
-        options = self.schwab.get_chains('SPY', type, '7', 'TRUE', '', '', '', 'OTM', self.today, self.today).json()
-        # Create a dataframe of the options
-        strike_price_df = self.database.create_dataframe('options', options)
+        response = self.schwab.get_chains('SPY', type, '7', 'TRUE', '', '', '', 'OTM', self.today, self.today)
+        if not response.ok:
+            raise ConnectionError(f"Error {response.status_code}: Unable to load {type} option chain")
+        return response.json()
 
-        if type == 'PUT':
-            filtered_delta_result = strike_price_df.loc[strike_price_df['Delta'] <= -abs(self.get_least_delta())]
-        elif type == 'CALL':
-            filtered_delta_result = strike_price_df.loc[strike_price_df['Delta'] >= self.get_least_delta()]
 
-        filtered_ask_result = filtered_delta_result.loc[filtered_delta_result['Ask'] <= self.get_max_contract_price()]
+    def _load_open_interest(self):
+        """
+        """
+        # Both sides of the tracked expiration, every strike
+        expiration = high_open_interest.expiration()
+        response = self.schwab.get_chains(high_open_interest.SYMBOL, 'ALL', includeUnderlyingQuotes='TRUE', range='ALL',
+                                          fromDate=expiration, toDate=expiration)
+        if not response.ok:
+            raise ConnectionError(f"Error {response.status_code}: Unable to load the {expiration} open interest")
+        return response.json()
 
-        if not filtered_ask_result.empty:
-            contract = filtered_ask_result.iloc[0]
+
+    def _log_open_interest(self, calls, puts):
+        """
+        """
+        self.log_signal.emit(f"Open interest levels, calls: {calls}, puts: {puts}")
+
+
+    def select_contract(self, type, contract_index):
+        """
+        """
+        # Binary search for the first contract with |delta| >= least delta and ask <= max contract price
+        contract = contract_index.first(type, self.get_least_delta(), self.get_max_contract_price(), mode=self.contract_rank_mode)
+
+        if contract is not None:
             buy_order = self.create_order(contract.get('Ask'), contract.get('Symbol'), 'BUY')
             return buy_order
         else:
@@ -132,13 +251,19 @@ class Client(QThread):
             return None
 
 
-    def buy_position(self, order, type):
+    def buy_position(self, order, type, hash=None, signal=None):
         """
+        :param signal: the signal the order answers, tagged on the ledger entries
+        :type signal: interface.signal_bus.Signal
         """
         self.log_signal.emit(f"Buying {type} position...")
         
-        # Request Hash value
-        hash = self.schwab.account_numbers().json()[0].get('hashValue')
+        # Cached account hash
+        if hash is None:
+            hash = self.schwab.account_hash()
+        if hash is None:
+            self.log_signal.emit(f"Cannot buy {type} position: account hash unavailable")
+            return
         
         # Lets create the buy order with the best contract
         symbol = order["orderLegCollection"][0]["instrument"]["symbol"]
@@ -150,79 +275,137 @@ class Client(QThread):
             # Post Buy Order
             self.schwab.post_orders(order, accountNumber=hash).json()
         except json.decoder.JSONDecodeError:
-            # Update database
-            self.database.create_dataframe('order', order)
+            # Update database, the fill is recorded once the position shows up
+            self.ledger.record_order(order, signal.alert_id if signal is not None else None)
+            self.pending_entry = (symbol, type, signal)
             # Update trades table
             self.trade_update_signal.emit("BOUGHT", symbol, price, self.get_max_position_size(), 0.0, "Alert")
         
 
     def check_position(self, type):
         """
+        Follow the open position on the option quote stream and sell it as soon as
+        the profit or loss threshold is crossed. REST is only polled every
+        reconcile_interval seconds to confirm the position still exists.
         """
         if type is None:
             return
         
-        # Request Hash value
-        hash = self.schwab.account_numbers().json()[0].get('hashValue')
-            
-        inPosition = True
-        while inPosition:
-            time.sleep(1)
-            # Request open positions from account 
-            open_position = self.schwab.account_number(hash, "positions").json()
-            try:
-                # Symbol of open position
-                symbol = open_position["securitiesAccount"]["positions"][0]["instrument"]["symbol"]
+        # Cached account hash
+        hash = self.schwab.account_hash()
+        if hash is None:
+            self.log_signal.emit(f"Cannot check {type} position: account hash unavailable")
+            return
 
-                # Average price of initial buy
-                price = open_position["securitiesAccount"]["positions"][0]["averagePrice"]
-                
-                # Current Market Value of contract
-                market_value = open_position["securitiesAccount"]["positions"][0]["marketValue"] / 100
+        position = self._open_position(hash)
+        if position is None:
+            self.log_signal.emit(f"No open positions found!")
+            return
+        self._record_entry(position)
 
-                # Contract profit and loss percentage
-                price_change = market_value - price
-                profit_percentage = (price_change / price) * 100
-                
-                # Update positions table
-                self.position_update_signal.emit(symbol, round(market_value, 2), self.get_max_position_size(), round(profit_percentage, 2), "Alert")
-                
-                """
-                TODO: Remove % logic and use the market value to determine
-                """
-                if profit_percentage >= self.get_max_profit_percentage() or profit_percentage <= self.get_max_loss_percentage():
-                    self.sell_position(type)
-                    inPosition = False
-                    break   
-            except KeyError as e:
+        if not self.schwab.stream.active:
+            self.schwab.stream.start()
+
+        monitor = PositionMonitor(self.schwab.stream, position["instrument"]["symbol"], position["averagePrice"],
+                                  self.get_max_profit_percentage, self.get_max_loss_percentage,
+                                  on_update=self._emit_position_update)
+        self.position_monitor = monitor
+        monitor.start()
+
+        # Slow reconciliation, exits are driven by the quote stream
+        while not monitor.wait(self.reconcile_interval):
+            position = self._open_position(hash)
+            if position is None:
                 self.log_signal.emit(f"No open positions found!")
-                inPosition = False
-                break
-    
+                monitor.stop()
+                return
+
+            monitor.average_price = position["averagePrice"]
+
+            # Fall back to the REST market value if the stream went quiet
+            if monitor.is_stale(self.reconcile_interval):
+                monitor.update_price(position["marketValue"] / (position.get("longQuantity") or 1) / 100)
+
+        monitor.stop()
+        if monitor.triggered:
+            self.sell_position(type)
+            self.log_signal.emit(f"Account cache: {self.schwab.account_cache.stats()}")
+
+
+    def _record_entry(self, position):
+        """
+        First sight of a bought position, record its fill at the average price.
+        """
+        if self.pending_entry is None or self.pending_entry[0] != position["instrument"]["symbol"]:
+            return
+        symbol, type, signal = self.pending_entry
+        self.pending_entry = None
+        quantity = position.get("longQuantity") or self.get_max_position_size()
+        alert_id = signal.alert_id if signal is not None else None
+        self.ledger.record_fill(symbol, 'BUY_TO_OPEN', quantity, position["averagePrice"], alert_id)
+        self.ledger.open_position(symbol, type, quantity, position["averagePrice"], alert_id, signal.code if signal is not None else None)
+
+
+    def _open_position(self, hash):
+        """
+        """
+        # Request open positions from account
+        open_position = self.schwab.account_number(hash, "positions").json()
+        try:
+            return open_position["securitiesAccount"]["positions"][0]
+        except (KeyError, IndexError):
+            return None
+
+
+    def _emit_position_update(self, symbol, market_value, profit_percentage):
+        """
+        """
+        # Update positions table
+        self.position_update_signal.emit(symbol, round(market_value, 2), self.get_max_position_size(), round(profit_percentage, 2), "Alert")
+
     # TODO: Fix this logic becasue it sells when it doenst need
     def sell_position(self, type):
         """
         """
         if type is None:
             return
-        
-        self.log_signal.emit(f"Selling {type} position...")
 
-        # Request hash value
-        hash = self.schwab.account_numbers().json()[0].get('hashValue')
+        # Cached account hash
+        hash = self.schwab.account_hash()
+        if hash is None:
+            self.log_signal.emit(f"Cannot sell {type} position: account hash unavailable")
+            return
         
         # Request all open positions
-        order = self.schwab.account_number(hash, "positions").json()
+        self.close_position(self.fetch_positions(hash), type, hash)
+
+
+    def fetch_positions(self, hash):
+        """
+        """
+        return self.schwab.account_number(hash, "positions").json()
+
+
+    def close_position(self, order, type, hash):
+        """
+        """
+        self.log_signal.emit(f"Selling {type} position...")
 
         try:
-            # Market value of the first order
-            market_value = order["securitiesAccount"]["positions"][0]["marketValue"] / 100
+            # The held position on this side, never just the first one listed
+            position = self._held_position(order, type)
+            if position is None:
+                self.log_signal.emit(f"No {type} position to sell")
+                return
+
+            # Market value per contract, marketValue is price x quantity x 100
+            market_value = position["marketValue"] / (100 * (position.get("longQuantity") or 1))
             
             # Average price of initial buy
-            price = order["securitiesAccount"]["positions"][0]["averagePrice"]
+            price = position["averagePrice"]
             
             # Order Symbol
-            symbol = order["securitiesAccount"]["positions"][0]["instrument"]["symbol"]
+            symbol = position["instrument"]["symbol"]
             
             # Contract profit and loss percentage
             price_change = market_value - price
@@ -232,17 +415,74 @@ class Client(QThread):
             sell_order = self.create_order(round(market_value, 2), symbol, 'SELL')
             
             # Post Sell Order
-            self.schwab.post_orders(sell_order, accountNumber=hash).json()
+            response = self.schwab.post_orders(sell_order, accountNumber=hash)
+            response.json()
         except json.decoder.JSONDecodeError:
-            # Update database
-            # self.database.create_dataframe('order', order)
-            
+            # Update database, the fill and P&L follow once Schwab reports the order executed
+            self.ledger.record_order(sell_order)
+            self._confirm_exit(response, sell_order, hash)
+
             # TODO: figure out how to keep track of the quantity and what alert
             self.trade_update_signal.emit("SOLD", symbol, round(market_value, 2), self.get_max_position_size(), round(profit_percentage, 2), "Alert")
         except KeyError as e:
             self.log_signal.emit(f"No positions found..{e}")
 
 
+    def _confirm_exit(self, response, sell_order, hash, timeout=120, interval=1):
+        """
+        Record the fill and close the ledger position at the executed price, in the background.
+        :param response: post_orders response, its Location header ends in the order id
+        """
+        symbol = sell_order["orderLegCollection"][0]["instrument"]["symbol"]
+        location = response.headers.get("Location")
+
+        def confirm():
+            if not location:
+                # No order number is returned for an order that filled immediately, at its limit price
+                self._record_exit(symbol, sell_order["orderLegCollection"][0]["quantity"], sell_order["price"])
+                return
+            order_id = location.rstrip("/").rsplit("/", 1)[-1]
+            deadline = time.time() + timeout
+            while time.time() < deadline:
+                try:
+                    executed = self.schwab.get_order_id(order_id, hash).json()
+                except (json.decoder.JSONDecodeError, OSError) as e:
+                    self.log_signal.emit(f"Order {order_id} status unavailable: {e}")
+                    executed = {}
+                status = executed.get("status")
+                if status == "FILLED":
+                    legs = [leg for activity in executed.get("orderActivityCollection", []) for leg in activity.get("executionLegs", [])]
+                    quantity = sum(leg["quantity"] for leg in legs) or executed.get("filledQuantity")
+                    price = sum(leg["quantity"] * leg["price"] for leg in legs) / quantity if legs else executed.get("price")
+                    self._record_exit(symbol, quantity, price)
+                    return
+                if status in ("CANCELED", "REJECTED", "EXPIRED", "REPLACED"):
+                    self.log_signal.emit(f"Sell order {order_id} for {symbol} {status.lower()}, position left open in the ledger")
+                    return
+                time.sleep(interval)
+            self.log_signal.emit(f"Sell order {order_id} for {symbol} not filled after {timeout} s, position left open in the ledger")
+        threading.Thread(target=confirm, daemon=True).start()
+
+
+    def _record_exit(self, symbol, quantity, price):
+        self.ledger.record_fill(symbol, 'SELL_TO_CLOSE', quantity, round(price, 2))
+        self.ledger.close_position(symbol, round(price, 2))
+
+
+    def _held_position(self, order, type):
+        """
+        :param order: positions response (see fetch_positions)
+        :param type: held side ("CALL"|"PUT")
+        :return: the open long option on that side, None if there is none
+        :rtype: dict
+        """
+        for position in order["securitiesAccount"]["positions"]:
+            # OCC symbol, the side letter follows the 6 character root and the date
+            if position["instrument"]["symbol"][12:13] == type[0] and position.get("longQuantity", 1) > 0:
+                return position
+        return None
+
+
     def create_order(self, price, symbol, type, var='OPEN'):
         """
         """
@@ -270,11 +510,15 @@ class Client(QThread):
         return order
     
 
-    def position_type(self):
+    def position_type(self, order=None):
         """
         """
-        hash = self.schwab.account_numbers().json()[0].get('hashValue')
-        order = self.schwab.account_number(hash, "positions").json()
+        if order is None:
+            hash = self.schwab.account_hash()
+            if hash is None:
+                self.log_signal.emit(f"Cannot read positions: account hash unavailable")
+                return None
+            order = self.fetch_positions(hash)
         type = None
         try:
             # Symbol of open position
@@ -311,32 +555,38 @@ class Client(QThread):
         Returns:
             None
         """
-        # response = self.schwab.price_history('SPY', 'day', 10, 'minute', 1, datetime.strptime('2024-01-05', "%Y-%m-%d"), datetime.strptime('2024-08-12', "%Y-%m-%d"), True, True)
-        response = self.schwab.price_history(ticker, periodType, period, frequencyType, frequency, datetime.strptime(startDate, "%Y-%m-%d"), datetime.strptime(endDate, "%Y-%m-%d"), True, True)
-
-        if response.ok:
-            data = response.json()
-            temp = data
-            self.convert_epoch_to_datetime(temp["candles"])
-            self.log_signal.emit(json.dumps(temp, indent=4))
-            df = self.database.create_dataframe('candles', data)
-            self.database.store_data('candles', df, fileName)
+        # Chunked windows under a rate limit, resumes from the checkpoint of an earlier run
+        def download():
+            if not self.startup.wait('schwab'):
+                self.log_signal.emit("Price History Request failed: Schwab is not available")
+                return
+            downloader = HistoryDownloader(self.schwab, progress=self._candle_progress)
+            try:
+                summary = downloader.download(ticker, periodType, period, frequencyType, frequency, startDate, endDate, fileName)
+            except Exception as e:
+                self.log_signal.emit(f"Price History Request failed: {e}")
+                return
+            self.log_signal.emit(f"{ticker}: {summary['fetched']} windows fetched, {summary['skipped']} already stored, "
+                                 f"{summary['candles']} candles")
+            for failure in summary['failed']:
+                self.log_signal.emit(f"Price History window failed, rerun to retry: {failure}")
             self.log_signal.emit("Price History Request: Complete")
 
+        threading.Thread(target=download, daemon=True).start()
 
-    def convert_epoch_to_datetime(self, candles):
-        """
-        """
-        for candle in candles:
-            epoch = candle["datetime"]
-            dt = datetime.fromtimestamp(epoch / 1000.0)
-            candle["datetime"] = dt.strftime('%Y-%m-%d %H:%M:%S')
+
+    def _candle_progress(self, completed, total, window):
+        self.candle_progress_signal.emit(completed, total)
 
 
     def set_settings(self, settings):
         """
         """
         self.settings = settings
+        if not self.startup.is_ready('engine'):
+            # Applied once the subsystems they configure exist
+            self.startup.when('engine', lambda: self.set_settings(settings))
+            return
         self.log_signal.emit(f"Settings updated: {settings}")
 
         if 'auto_start' in settings and settings['auto_start']:
@@ -378,6 +628,37 @@ class Client(QThread):
                 else:
                     raise ValueError("delta must be between 0 and 100")
 
+            if 'chain_refresh_interval' in settings:
+                self.chain_cache.refresh_interval = float(settings['chain_refresh_interval'])
+
+            if 'chain_max_age' in settings:
+                self.chain_cache.max_age = float(settings['chain_max_age'])
+
+            if 'chain_snapshot_directory' in settings:
+                self.chain_cache.snapshot_directory = settings['chain_snapshot_directory'] or None
+
+            if settings.get('chain_stream_patching') and self.chain_cache.stream is None:
+                self.chain_cache.attach_stream(self.schwab.stream)
+                if not self.schwab.stream.active:
+                    self.schwab.stream.start()
+
+            if settings.get('webhook_port') and 'webhook' not in self.signal_sources:
+                self.signal_sources['webhook'] = WebhookSource(int(settings['webhook_port']))
+                self.signal_bus.add_source(self.signal_sources['webhook'])
+
+            if settings.get('signal_file') and 'file' not in self.signal_sources:
+                self.signal_sources['file'] = FileSource(settings['signal_file'])
+                self.signal_bus.add_source(self.signal_sources['file'])
+
+            if 'contract_rank_mode' in settings:
+                if settings['contract_rank_mode'] in ContractIndex.RANK_MODES:
+                    self.contract_rank_mode = settings['contract_rank_mode']
+                else:
+                    raise ValueError(f"Contract rank mode must be one of {ContractIndex.RANK_MODES}")
+
+            if 'alert_grammar' in settings:
+                self.gmail.alert_parser = AlertParser(settings['alert_grammar'])
+
             if 'strategies' in settings:
                 self.set_strategies(settings['strategies'])
                 # Implement strategy selection logic here
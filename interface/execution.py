@@ -0,0 +1,87 @@
+import time
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+
+class ExecutionEngine:
+    """
+    Runs a signal flip (close the open position, open the new one) as concurrent stages.
+
+    The account hash and option chain are requested at the same time instead of
+    one after another, the open positions as soon as the hash is known. The
+    buy waits for that positions snapshot, so the close can never see (and sell)
+    the contract the flip just bought; after that both orders go out at once. The blocking Schwab calls run on a small thread pool
+    driven by an asyncio loop, and every flip records when each stage finished,
+    in milliseconds after the signal.
+    """
+    def __init__(self, client, max_workers=4):
+        self.client = client
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="execution")
+        self.last_timings = {}
+
+
+    def flip(self, type, signal_time=None, signal=None):
+        """
+        Blocking entry point for the trade threads.
+        :param type: side to open ("CALL"|"PUT")
+        :type type: str
+        :param signal_time: time.perf_counter() when the signal arrived, defaults to now
+        :type signal_time: float
+        :param signal: the signal behind the flip, passed on to buy_position for the ledger
+        :type signal: interface.signal_bus.Signal
+        :return: the posted buy order, or None if no contract met the conditions
+        :rtype: dict
+        """
+        return asyncio.run(self._flip(type, signal_time if signal_time is not None else time.perf_counter(), signal))
+
+
+    async def _flip(self, type, signal_time, signal=None):
+        loop = asyncio.get_running_loop()
+        timings = {}
+
+        def mark(name):
+            timings[name] = round((time.perf_counter() - signal_time) * 1000, 2)
+
+        async def stage(name, func, *args):
+            result = await loop.run_in_executor(self.executor, func, *args)
+            mark(name)
+            return result
+
+        self.client.log_signal.emit(f"Searching for best {type} contract...")
+
+        # Fan out every request that does not depend on another one
+        hash_task = asyncio.ensure_future(stage('hash', self.client.schwab.account_hash))
+        chain_task = asyncio.ensure_future(stage('chain', self.client.fetch_chain, type))
+
+        # Without the account hash nothing can be posted, the flip fails before any order
+        hash = await hash_task
+        if hash is None:
+            chain_task.cancel()
+            self.client.log_signal.emit(f"{type} flip aborted: account hash unavailable")
+            self.last_timings = timings
+            return None
+        positions_task = asyncio.ensure_future(stage('positions', self.client.fetch_positions, hash))
+
+        async def close():
+            positions = await positions_task
+            held = self.client.position_type(positions)
+            if held is not None:
+                await stage('close_submitted', self.client.close_position, positions, held, hash)
+
+        async def open():
+            chain = await chain_task
+            order = self.client.select_contract(type, chain)
+            mark('contract_selected')
+            if order is None:
+                return None
+            # Snapshot first, a buy posted earlier could show up in it as the position to close
+            await positions_task
+            await stage('open_submitted', self.client.buy_position, order, type, hash, signal)
+            return order
+
+        _, order = await asyncio.gather(close(), open())
+        mark('total')
+
+        self.last_timings = timings
+        self.client.log_signal.emit(f"{type} flip stage timings (ms after signal): {timings}")
+        return order
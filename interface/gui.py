@@ -2,14 +2,29 @@ import json
 import time
 import threading
 from datetime import datetime
-from PyQt5.QtWidgets import QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, QPushButton, QLabel, QTextEdit, QTabWidget, QLineEdit, QGridLayout, QCheckBox, QTableWidget, QTableWidgetItem, QHeaderView
+from PyQt5.QtWidgets import QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, QPushButton, QLabel, QTextEdit, QTabWidget, QLineEdit, QGridLayout, QCheckBox, QTableWidget, QTableWidgetItem, QHeaderView, QProgressBar
 from PyQt5.QtGui import QIntValidator
-from interface.client import Client
+from PyQt5.QtCore import pyqtSignal
+from interface.startup import Startup
 
 
 class ClientGUI(QMainWindow):
-    def __init__(self):
+    start_requested = pyqtSignal()
+    # settings.txt only, passed to the client as they are
+    EXTRA_SETTINGS = ('chain_refresh_interval', 'chain_max_age', 'chain_stream_patching', 'chain_snapshot_directory',
+                      'webhook_port', 'signal_file', 'contract_rank_mode', 'alert_grammar')
+
+    def __init__(self, started=None):
         super().__init__()
+        # Everything past the window loads in stages after the first paint
+        self.startup = Startup(started)
+        self.startup.ready_signal.connect(self.update_readiness)
+        self.startup.failed_signal.connect(self.startup_failed)
+        self.start_requested.connect(self.start_deferred)
+        self.client_class = None
+        self.start_pending = False
+        self.painted = False
+        self.extra_settings = {}
         self.setWindowTitle("Trading Bot GUI")
         self.setGeometry(100, 100, 800, 600)
 
@@ -46,6 +61,13 @@ class ClientGUI(QMainWindow):
         status_layout.addWidget(self.status_label)
         main_layout.addLayout(status_layout)
 
+        # Subsystem readiness
+        readiness_layout = QHBoxLayout()
+        readiness_layout.addWidget(QLabel("Startup:"))
+        self.readiness_label = QLabel("Loading...")
+        readiness_layout.addWidget(self.readiness_label)
+        main_layout.addLayout(readiness_layout)
+
         # Start/Stop button
         self.start_stop_button = QPushButton("Start Bot")
         self.start_stop_button.clicked.connect(self.toggle_bot)
@@ -132,6 +154,11 @@ class ClientGUI(QMainWindow):
         request_button.clicked.connect(self.request_candle_history)
         candles_layout.addWidget(request_button, 9, 0, 1, 2)
 
+        # Download Progress, one step per date window
+        self.candle_progress = QProgressBar()
+        self.candle_progress.setFormat("%v/%m windows")
+        candles_layout.addWidget(self.candle_progress, 10, 0, 1, 2)
+
         self.tabs.addTab(candles_tab, "Ticker History")
 
 
@@ -280,6 +307,11 @@ class ClientGUI(QMainWindow):
             self.client.get_candle_history(self.ticker.text(), self.period_type.text(), int(self.period.text()), self.frequency_type.text(), int(self.frequency.text()), self.start_date.text(), self.end_date.text(), self.file_name.text())
 
 
+    def update_candle_progress(self, completed, total):
+        self.candle_progress.setMaximum(total)
+        self.candle_progress.setValue(completed)
+
+
     def toggle_bot(self):
         if self.status_label.text() == "Stopped":
             self.start_bot()
@@ -304,6 +336,8 @@ class ClientGUI(QMainWindow):
             strategies = settings.get('strategies', [])
             for strategy, checkbox in self.strategy_checkboxes.items():
                 checkbox.setChecked(strategy in strategies or 'ALL' in strategies)
+
+            self.extra_settings = {name: settings[name] for name in self.EXTRA_SETTINGS if name in settings}
             
             self.log("Settings loaded successfully from settings.txt")
         except FileNotFoundError:
@@ -314,7 +348,11 @@ class ClientGUI(QMainWindow):
             self.log(f"An error occurred while loading settings: {str(e)}")
 
 
-    def save_settings(self):
+    def current_settings(self):
+        """
+        :return: the settings fields, plus the settings.txt keys that have no field
+        :rtype: dict
+        """
         settings = {
             'auto_start': self.auto_start_toggle.isChecked(),
             'auto_start_time': self.auto_start_time.text(),
@@ -326,6 +364,12 @@ class ClientGUI(QMainWindow):
             'least_delta': float(self.least_delta.text()),
             'strategies': [strategy for strategy, checkbox in self.strategy_checkboxes.items() if checkbox.isChecked()]
         }
+        settings.update(self.extra_settings)
+        return settings
+
+
+    def save_settings(self):
+        settings = self.current_settings()
 
         try:
             with open('/Users/josuecastellanos/Documents/Automated_Trading_System/setting/settings.txt', 'w') as f:
@@ -359,56 +403,116 @@ class ClientGUI(QMainWindow):
             self.client.set_settings(settings)
 
 
+    def paintEvent(self, event):
+        super().paintEvent(event)
+        if not self.painted:
+            self.painted = True
+            self.startup.mark('first_paint')
+            # The client pulls in pandas, numpy and the Google and Schwab clients, load them off the UI thread
+            self.startup.stage('modules', self._load_modules)
+
+
+    def _load_modules(self):
+        from interface.client import Client
+        self.client_class = Client
+
+
+    def update_readiness(self, name, seconds):
+        self.readiness_label.setText(" | ".join(f"{stage} {elapsed:.2f}s" for stage, elapsed in self.startup.stats().items()))
+        if name != 'first_paint':
+            self.log(f"{name} ready after {seconds:.2f} s")
+
+
+    def startup_failed(self, name, error):
+        self.log(f"ERROR: {name} failed to start: {error}")
+        if name == 'modules' and self.start_pending:
+            # The queued start will never run, give the button back
+            self.start_pending = False
+            self.status_label.setText("Stopped")
+            self.start_stop_button.setText("Start Robot")
+
+
+    def start_deferred(self):
+        # Stop pressed while the modules were still loading cancels the start
+        if self.start_pending:
+            self.start_bot()
+
+
     def start_bot(self):
+        if self.client is None and not self.startup.is_ready('modules'):
+            # Started again by start_requested once the modules are in
+            if not self.start_pending:
+                if 'modules' in self.startup.errors:
+                    self.log("Retrying the module load")
+                    self.startup.stage('modules', self._load_modules)
+                self.start_pending = True
+                self.status_label.setText("Starting")
+                self.start_stop_button.setText("Stop Robot")
+                self.log("Robot starts once its modules are loaded")
+                self.startup.when('modules', self.start_requested.emit)
+            return
+        self.start_pending = False
+
         if self.client is None:
             self.load_settings()  # Load settings before starting the bot
             self.status_label.setText("Running")
             self.start_stop_button.setText("Stop Robot")
             self.log("Robot started")
             
-            self.client = Client(self)
+            # Subsystems load in the background, run() waits for them
+            self.client = self.client_class(self, self.startup)
             self.client.log_dict_signal.connect(self.log)
             self.client.log_signal.connect(self.log)
             self.client.position_update_signal.connect(self.update_positions)
             self.client.trade_update_signal.connect(self.update_trades)
-            self.client.gmail.set_checker(True)
-            self.client.gmail.check_email_automatic()
-
-            current_settings = {
-                'auto_start': self.auto_start_toggle.isChecked(),
-                'auto_start_time': self.auto_start_time.text(),
-                'auto_end_time': self.auto_end_time.text(),
-                'max_position_size': int(self.max_position_size.text()),
-                'max_profit_percentage': float(self.max_profit_percentage.text()),
-                'max_loss_percentage': float(self.max_loss_percentage.text()),
-                'max_contract_price': float(self.max_contract_price.text()),
-                'least_delta': float(self.least_delta.text()),
-                'strategies': [strategy for strategy, checkbox in self.strategy_checkboxes.items() if checkbox.isChecked()]
-            }
-            self.client.set_settings(current_settings)
+            self.client.candle_progress_signal.connect(self.update_candle_progress)
+            self.client.stopped_signal.connect(self.robot_stopped)
+
+            self.client.set_settings(self.current_settings())
         
         else: 
             self.status_label.setText("Running")
             self.start_stop_button.setText("Stop Robot")
             self.log("Robot started")
-            self.client.gmail.set_checker(True)
-            self.client.gmail.check_email_automatic()
+
+            # A subsystem that failed to load (and everything after it) gets another try
+            restaged = self.client.initialize(failed_only=True)
+            if restaged:
+                self.log(f"Retrying startup stages: {', '.join(restaged)}")
+                self.client.set_settings(self.current_settings())
 
         self.client.start()
 
 
-    def stop_bot(self):
-        # TODO: Stop Gmail from reading messages as well, FIXED 
-        self.client.gmail.set_checker(False)
+    def robot_stopped(self, reason):
+        # run() gave up on its own, e.g. a startup stage failed
+        self.status_label.setText("Stopped")
+        self.start_stop_button.setText("Start Robot")
+        self.log(f"Robot stopped: {reason}")
+
 
+    def stop_bot(self):
+        self.start_pending = False
         self.status_label.setText("Stopped")
         self.start_stop_button.setText("Start Robot")
         self.log("Robot stopped")
-        
-        if self.client and self.client.isRunning():
+        if self.client is None:
+            return
+
+        if self.client.isRunning():
             self.client.requestInterruption()
             self.client.wait()
 
+        # TODO: Stop Gmail from reading messages as well, FIXED 
+        # No new signals, flips or chain refreshes until the next start
+        self.client.stop_trading()
+
+        # Commit what the ledger still has queued, then show today's result
+        if self.client.ledger is not None:
+            self.client.ledger.flush()
+            for day in self.client.ledger.daily_pnl(days=1):
+                self.log(f"P&L {day['date']}: {day['pnl']} over {day['trades']} trades, {day['wins']} winners")
+
 
     def log(self, message):
         timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
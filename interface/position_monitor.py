@@ -0,0 +1,105 @@
+import time
+import threading
+from schwab.stream import LEVELONE_OPTIONS_FIELDS
+
+
+class PositionMonitor:
+    """
+    Watches an open option position on the LEVELONE_OPTIONS stream.
+
+    P&L is recomputed on every quote tick against the position's average price,
+    and the monitor finishes the moment the take-profit or stop-loss threshold is
+    crossed. The thread waiting on wait() then closes the position, so the
+    streamer loop itself never blocks on REST calls.
+    """
+    SERVICE = "LEVELONE_OPTIONS"
+    FIELDS = ("bid", "ask", "last", "mark")
+
+    def __init__(self, stream, symbol, average_price, get_profit_target, get_loss_limit, on_update=None):
+        self.stream = stream
+        self.symbol = symbol
+        self.average_price = average_price
+        self.get_profit_target = get_profit_target
+        self.get_loss_limit = get_loss_limit
+        self.on_update = on_update
+        self.quote = {}
+        self.market_value = None
+        self.profit_percentage = None
+        self.last_tick = None
+        self.ticks = 0
+        self.triggered = False
+        self.done = threading.Event()
+
+
+    def start(self):
+        self.stream.add_handler(self.SERVICE, self.on_quote, self.FIELDS)
+        self.stream.subscribe(self.SERVICE, [self.symbol], LEVELONE_OPTIONS_FIELDS, owner=self)
+
+
+    def stop(self):
+        self.stream.remove_handler(self.SERVICE, self.on_quote)
+        self.stream.unsubscribe(self.SERVICE, [self.symbol], owner=self)
+        self.done.set()
+
+
+    def wait(self, timeout=None):
+        """
+        Block until the threshold is crossed or the monitor is stopped.
+        :return: True if the monitor finished, False on timeout
+        :rtype: bool
+        """
+        return self.done.wait(timeout)
+
+
+    def on_quote(self, content, timestamp=None):
+        """
+        Stream handler, LEVELONE_OPTIONS only sends the fields that changed so quotes are merged.
+        """
+        for quote in content:
+            if quote.key != self.symbol:
+                continue
+            for field in self.FIELDS:
+                value = getattr(quote, field)
+                if value is not None:
+                    self.quote[field] = value
+            self.last_tick = time.monotonic()
+            self.ticks += 1
+
+            mark = self._mark()
+            if mark is not None:
+                self.update_price(mark)
+
+
+    def update_price(self, market_value):
+        """
+        Recompute P&L for a new contract price and finish if a threshold is crossed.
+        """
+        if self.done.is_set() or not self.average_price:
+            return
+        self.market_value = market_value
+        self.profit_percentage = ((market_value - self.average_price) / self.average_price) * 100
+
+        if self.on_update is not None:
+            self.on_update(self.symbol, market_value, self.profit_percentage)
+
+        if self.profit_percentage >= self.get_profit_target() or self.profit_percentage <= self.get_loss_limit():
+            self.triggered = True
+            self.done.set()
+
+
+    def is_stale(self, max_age):
+        """
+        :return: True if no quote arrived in the last max_age seconds
+        :rtype: bool
+        """
+        return self.last_tick is None or time.monotonic() - self.last_tick > max_age
+
+
+    def _mark(self):
+        mark = self.quote.get("mark")
+        if mark:
+            return mark
+        bid, ask = self.quote.get("bid"), self.quote.get("ask")
+        if bid and ask:
+            return (bid + ask) / 2
+        return self.quote.get("last")
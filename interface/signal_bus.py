@@ -0,0 +1,397 @@
+import os
+import json
+import time
+import asyncio
+import threading
+import statistics
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class Signal:
+    """
+    One trade signal, whatever source it came from.
+    """
+    __slots__ = ('side', 'source', 'alert_id', 'timestamp', 'code', 'timeframe', 'ticker', 'price', 'received')
+
+    def __init__(self, side, source, alert_id=None, timestamp=None, code=None):
+        self.side = side
+        self.source = source
+        self.alert_id = alert_id
+        self.timestamp = timestamp if timestamp is not None else time.time()
+        self.code = code
+        self.timeframe = None
+        self.ticker = None
+        self.price = None
+        # time.perf_counter() when the signal entered the bus
+        self.received = None
+
+    def __repr__(self):
+        return f"Signal({self.side}, source={self.source}, alert_id={self.alert_id}, code={self.code})"
+
+
+class SignalBus:
+    """
+    Fan-in point for every signal source with a single asyncio consumer.
+
+    Sources call publish() from any thread. The consumer drops duplicates (same
+    alert id and timestamp), records how long each signal sat in the queue per
+    source, and hands the signal to the execution path on one worker per side,
+    so a long-running position on one side never holds up a flip to the other.
+    A signal that waited behind its side's worker is dropped when a newer one of
+    the same side came in meanwhile, or when it is older than max_age seconds.
+    Drops and handler errors go to log_signal when given.
+    """
+    def __init__(self, dedupe_size=1000, max_age=30, log_signal=None):
+        self.sources = []
+        self.log_signal = log_signal
+        self.handler = None
+        self.queue = None
+        self.seen = OrderedDict()
+        self.dedupe_size = dedupe_size
+        self.latencies = {}
+        self.duplicates = 0
+        self.max_age = max_age
+        self.latest = {}
+        self.superseded = 0
+        self.expired = 0
+        self.executors = {}
+        self._loop = None
+        self._thread = None
+        self._ready = threading.Event()
+
+
+    def add_source(self, source):
+        self.sources.append(source)
+        if self._loop is not None:
+            source.start(self)
+
+
+    def start(self, handler):
+        """
+        :param handler: callable(signal) run for every accepted signal
+        """
+        self.handler = handler
+        if self._thread is not None:
+            return
+
+        def run():
+            asyncio.run(self._consume())
+        self._thread = threading.Thread(target=run, daemon=True)
+        self._thread.start()
+        self._ready.wait()
+
+        for source in self.sources:
+            source.start(self)
+
+
+    def stop(self):
+        """
+        Stops the sources and the consumer, signals still waiting on a side worker are dropped.
+        start() runs the bus again.
+        """
+        for source in self.sources:
+            source.stop()
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self.queue.put_nowait, None)
+        if self._thread is not None:
+            self._thread.join()
+
+        # A flip already running finishes on its worker, nothing queued behind it does
+        for executor in self.executors.values():
+            executor.shutdown(wait=False, cancel_futures=True)
+        self.executors = {}
+        self.latest = {}
+        self._loop = None
+        self.queue = None
+        self._thread = None
+        self._ready.clear()
+
+
+    def publish(self, signal):
+        """
+        Thread-safe, called by the sources.
+        """
+        loop, queue = self._loop, self.queue
+        signal.received = time.perf_counter()
+        try:
+            loop.call_soon_threadsafe(queue.put_nowait, signal)
+        except (AttributeError, RuntimeError):
+            # Stopped meanwhile, no loop or a closed one
+            self.log(f"Dropped {signal}: signal bus stopped")
+
+
+    def log(self, message):
+        """
+        Thread-safe, also used by the sources.
+        """
+        if self.log_signal is not None:
+            self.log_signal.emit(message)
+        else:
+            print(message)
+
+
+    async def _consume(self):
+        self._loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue()
+        self._ready.set()
+
+        while True:
+            signal = await self.queue.get()
+            if signal is None:
+                break
+            self.latencies.setdefault(signal.source, deque(maxlen=500)).append(time.perf_counter() - signal.received)
+
+            if self._is_duplicate(signal):
+                self.duplicates += 1
+                continue
+
+            executor = self.executors.get(signal.side)
+            if executor is None:
+                executor = self.executors[signal.side] = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"signal-{signal.side}")
+            self.latest[signal.side] = signal
+            self._loop.run_in_executor(executor, self._dispatch, signal)
+
+
+    def _dispatch(self, signal):
+        # Queued behind a flip or a position still being held, only act on what is still current
+        if self.latest.get(signal.side) is not signal:
+            self.superseded += 1
+            self.log(f"Dropped {signal}: a newer {signal.side} signal is queued")
+            return
+        age = time.perf_counter() - signal.received
+        if self.max_age is not None and age > self.max_age:
+            self.expired += 1
+            self.log(f"Dropped {signal}: {age:.1f} s old")
+            return
+        try:
+            self.handler(signal)
+        except Exception as e:
+            self.log(f"Error handling {signal}: {e}")
+
+
+    def _is_duplicate(self, signal):
+        key = (signal.alert_id, signal.timestamp) if signal.alert_id is not None else (signal.source, signal.side, signal.timestamp)
+        if key in self.seen:
+            return True
+        self.seen[key] = None
+        if len(self.seen) > self.dedupe_size:
+            self.seen.popitem(last=False)
+        return False
+
+
+    def stats(self):
+        """
+        :return: per source queue latency in milliseconds and the number of dropped duplicates, superseded and expired signals
+        :rtype: dict
+        """
+        return {
+            'duplicates': self.duplicates,
+            'superseded': self.superseded,
+            'expired': self.expired,
+            'queue_latency_ms': {source: {'count': len(samples),
+                                          'median': round(statistics.median(samples) * 1000, 3),
+                                          'max': round(max(samples) * 1000, 3)}
+                                 for source, samples in self.latencies.items() if samples}
+        }
+
+
+def _payload_signal(text, source):
+    """
+    Signal from the JSON payload {"side": "CALL", "alert_id": "...", "timestamp": ..., "code": "..."}.
+    :raises ValueError: malformed JSON or an unsupported side
+    :raises KeyError: no side
+    """
+    payload = json.loads(text)
+    side = payload["side"]
+    if not isinstance(side, str) or side.upper() not in ('CALL', 'PUT'):
+        raise ValueError(f"Unsupported side: {side}")
+    return Signal(side.upper(), source, payload.get("alert_id"), payload.get("timestamp"), payload.get("code"))
+
+
+def _parser(source):
+    # Imported on first use, the parser module builds on Signal from this one
+    if source.parser is None:
+        from cloud_services.alert_parser import AlertParser
+        # Everything posted or written here is an alert, no anchor word needed
+        source.parser = AlertParser({'anchor': ''})
+    return source.parser
+
+
+class SignalSource:
+    name = 'source'
+
+    def start(self, bus):
+        self.bus = bus
+
+    def stop(self):
+        pass
+
+
+class GmailSource(SignalSource):
+    """
+    Publishes the alerts Gmail decodes instead of setting its CALL/PUT events.
+    """
+    name = 'gmail'
+
+    def __init__(self, gmail):
+        self.gmail = gmail
+
+    def start(self, bus):
+        super().start(bus)
+        self.gmail.signal_sink = self.on_alert
+
+    def stop(self):
+        self.gmail.signal_sink = None
+
+    def on_alert(self, signal):
+        self.bus.publish(signal)
+
+
+class WebhookSource(SignalSource):
+    """
+    Local HTTP listener, POST {"side": "CALL", "alert_id": "...", "timestamp": ..., "code": "..."}
+    or the raw alert text (e.g. a TradingView webhook message), which goes through the alert parser.
+    """
+    name = 'webhook'
+
+    def __init__(self, port=8086, host="127.0.0.1", parser=None):
+        self.address = (host, port)
+        self.parser = parser
+        self.server = None
+
+    def start(self, bus):
+        super().start(bus)
+        source = self
+
+        class WebhookHandler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                try:
+                    signal = source.parse(self.rfile.read(length))
+                except (ValueError, KeyError, TypeError) as e:
+                    self.send_response(400)
+                    self.end_headers()
+                    self.wfile.write(str(e).encode())
+                    return
+                source.bus.publish(signal)
+                self.send_response(202)
+                self.end_headers()
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(self.address, WebhookHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server = None
+
+    def parse(self, body):
+        text = body.decode() if isinstance(body, bytes) else body
+        if not text.lstrip().startswith('{'):
+            signal = _parser(self).parse(text, self.name)
+            if signal is None:
+                raise ValueError(f"No alert code in: {text[:80]}")
+            return signal
+
+        return _payload_signal(text, self.name)
+
+
+class FileSource(SignalSource):
+    """
+    Reads one signal per line from a regular file (tailed) or a FIFO.
+
+    A line is either the webhook JSON payload, just "CALL"/"PUT", or alert text for the alert parser.
+    A path that cannot be opened or read is retried every retry_interval seconds.
+    """
+    name = 'file'
+
+    def __init__(self, path, poll_interval=0.1, parser=None, retry_interval=5):
+        self.path = path
+        self.parser = parser
+        self.poll_interval = poll_interval
+        self.retry_interval = retry_interval
+        self.stopped = None
+
+    def start(self, bus):
+        super().start(bus)
+        # Every reader gets its own event, one still sleeping after a stop never reads next to a new one
+        self.stopped = threading.Event()
+        threading.Thread(target=self._read, args=(self.stopped,), daemon=True).start()
+
+    def stop(self):
+        if self.stopped is not None:
+            self.stopped.set()
+
+    def _read(self, stopped):
+        error = None
+        while not stopped.is_set():
+            try:
+                self._tail(stopped)
+            except OSError as e:
+                # Missing file, no permission or a read error, the source keeps trying and logs each new error once
+                if str(e) != error:
+                    error = str(e)
+                    self.bus.log(f"Cannot read signals from {self.path}: {e}, retrying every {self.retry_interval} s")
+                stopped.wait(self.retry_interval)
+
+    def _tail(self, stopped):
+        # Opening a FIFO blocks until a writer connects, so this runs on its own thread
+        with open(self.path, 'r') as f:
+            if os.path.isfile(self.path):
+                # Only lines appended after start are new signals
+                f.seek(0, os.SEEK_END)
+            while not stopped.is_set():
+                line = f.readline()
+                if not line:
+                    stopped.wait(self.poll_interval)
+                    continue
+                # A bad line is skipped, it must not end the reader
+                try:
+                    signal = self.parse(line.strip())
+                except (ValueError, KeyError, TypeError) as e:
+                    self.bus.log(f"Skipped signal line {line.strip()[:80]!r}: {e!r}")
+                    continue
+                if signal is not None:
+                    self.bus.publish(signal)
+
+    def parse(self, line):
+        if not line:
+            return None
+        if line.startswith('{'):
+            return _payload_signal(line, self.name)
+        if line.upper() in ('CALL', 'PUT'):
+            return Signal(line.upper(), self.name)
+        return _parser(self).parse(line, self.name)
+
+
+class StreamSource(SignalSource):
+    """
+    Turns Schwab stream messages into signals through an indicator.
+
+    indicator(records, timestamp) returns "CALL", "PUT" or None for each data message of the service,
+    fields limits the decoded record attributes to the ones the indicator reads.
+    """
+    name = 'stream'
+
+    def __init__(self, stream, indicator, service="CHART_EQUITY", fields=None):
+        self.stream = stream
+        self.indicator = indicator
+        self.service = service
+        self.fields = fields
+
+    def start(self, bus):
+        super().start(bus)
+        self.stream.add_handler(self.service, self.on_message, self.fields)
+
+    def stop(self):
+        self.stream.remove_handler(self.service, self.on_message)
+
+    def on_message(self, content, timestamp=None):
+        side = self.indicator(content, timestamp)
+        if side is not None:
+            self.bus.publish(Signal(side, self.name, timestamp=timestamp / 1000 if timestamp else None))
@@ -0,0 +1,123 @@
+import time
+import threading
+from PyQt5.QtCore import QObject, pyqtSignal
+
+
+class Startup(QObject):
+    """
+    Staged startup: every subsystem loads on its own thread once the stages it depends on are ready.
+
+    ready_signal(name, seconds) is emitted as each stage finishes, seconds
+    counted from started (process launch when given), failed_signal(name,
+    error) when one raises. Work that needs a stage is queued with when() and
+    runs as soon as it is ready, so nothing on the UI thread ever waits.
+    """
+    ready_signal = pyqtSignal(str, float)
+    failed_signal = pyqtSignal(str, str)
+
+    def __init__(self, started=None):
+        super().__init__()
+        self.started = started if started is not None else time.perf_counter()
+        self.times = {}
+        self.errors = {}
+        self.events = {}
+        self.callbacks = {}
+        self.lock = threading.Lock()
+
+
+    def _event(self, name):
+        with self.lock:
+            return self.events.setdefault(name, threading.Event())
+
+
+    def stage(self, name, func, after=()):
+        """
+        Run func() on a new thread once every stage in after is ready, a failed stage can be staged again.
+        :return: the stage thread
+        :rtype: threading.Thread
+        """
+        with self.lock:
+            if name in self.errors:
+                del self.errors[name]
+                del self.times[name]
+                self.events[name] = threading.Event()
+        self._event(name)
+
+        def run():
+            for dependency in after:
+                self._event(dependency).wait()
+                if dependency in self.errors:
+                    self._finish(name, error=f"{dependency} failed")
+                    return
+            try:
+                func()
+            # Schwab quits on bad keys, that fails the stage instead of leaving it hanging
+            except (Exception, SystemExit) as e:
+                self._finish(name, error=repr(e))
+            else:
+                self._finish(name)
+        thread = threading.Thread(target=run, name=f"startup-{name}", daemon=True)
+        thread.start()
+        return thread
+
+
+    def mark(self, name, error=None):
+        """
+        Report a stage that ran somewhere else, e.g. the first paint.
+        """
+        self._event(name)
+        self._finish(name, error)
+
+
+    def _finish(self, name, error=None):
+        elapsed = time.perf_counter() - self.started
+        with self.lock:
+            self.times[name] = elapsed
+            if error is not None:
+                self.errors[name] = error
+            callbacks = self.callbacks.pop(name, [])
+        if error is not None:
+            self.events[name].set()
+            self.failed_signal.emit(name, error)
+            return
+        # Queued work (e.g. deferred settings) is done before wait() lets anyone past
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                print(f"Startup callback for {name} failed: {e}")
+        self.events[name].set()
+        self.ready_signal.emit(name, elapsed)
+
+
+    def is_ready(self, name):
+        return name in self.times and name not in self.errors
+
+
+    def wait(self, name, timeout=None):
+        """
+        Block a worker thread until a stage finished.
+        :return: True if it is ready, False on timeout or failure
+        :rtype: bool
+        """
+        return self._event(name).wait(timeout) and name not in self.errors
+
+
+    def when(self, name, callback):
+        """
+        Run callback() once the stage is ready, right away (on the caller's thread) if it already is.
+        """
+        with self.lock:
+            if name not in self.times:
+                self.callbacks.setdefault(name, []).append(callback)
+                return
+        if name not in self.errors:
+            callback()
+
+
+    def stats(self):
+        """
+        :return: seconds from start to each finished stage
+        :rtype: dict
+        """
+        return {name: round(seconds, 3) for name, seconds in sorted(self.times.items(), key=lambda item: item[1])}
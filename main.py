@@ -1,12 +1,15 @@
+import time
+started = time.perf_counter()
+
 import sys
 from PyQt5.QtWidgets import QApplication
 from interface.gui import ClientGUI
 
 def main():
     app = QApplication(sys.argv)
-    gui = ClientGUI()
+    gui = ClientGUI(started=started)
     gui.show()
     sys.exit(app.exec_())
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
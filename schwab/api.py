@@ -2,10 +2,11 @@ import os
 import json
 import time
 import base64
-import requests
 import threading
 import webbrowser
 from .stream import Stream
+from .session import SchwabSession
+from .cache import AccountCache
 from pathlib import Path
 from datetime import datetime
 from dotenv import load_dotenv
@@ -52,6 +53,9 @@ class Schwab(QObject):
         self.accessTokenTimeout = 1800 # in seconds
         self.log_signal = log_signal
         self.callback_url = None
+        self.session = SchwabSession(token_provider=lambda: self.accessToken)
+        self.account_cache = AccountCache(self._load_accounts, self.ACCOUNT_NUMBER)
+        self.session.on_unauthorized(self.account_cache.invalidate)
         self.stream = Stream(self)
         self.token_refresh_thread = None
         self.timeout = 5
@@ -106,7 +110,7 @@ class Schwab(QObject):
         else:
             self.log_signal.emit("Invalid grant type")
             return None
-        return requests.post(self.POST, headers=headers, data=data).json()
+        return self.session.post(self.POST, headers=headers, data=data).json()
 
 
     def _access_token(self):
@@ -138,6 +142,7 @@ class Schwab(QObject):
             self.accessTokenDateTime = att
             self.refreshTokenDateTime = rtt
             self.idToken = td.get("id_token")
+            self.account_cache.invalidate()
 
         def write_token_file(newAccessTokenTime, newRefreshTokenTime, newTokenDict):
             self.log_signal.emit("Writing new values to Schwabs .env file")
@@ -220,6 +225,23 @@ class Schwab(QObject):
         threading.Thread(target=checker, daemon=True).start()
 
 
+    def _load_accounts(self):
+        response = self.account_numbers()
+        if response.ok:
+            return response.json()
+        self.log_signal.emit(f"Error {response.status_code}: Unable to load account numbers")
+        return None
+
+
+    def account_hash(self):
+        """
+        Encrypted account value for the configured account, served from the account cache after the first call.
+        :return: account hash
+        :rtype: str
+        """
+        return self.account_cache.account_hash()
+
+
     # Account methods
     def account_numbers(self):
         """
@@ -227,8 +249,7 @@ class Schwab(QObject):
         :return: All linked account numbers and hashes
         :rtype: request.Response
         """
-        return requests.get(f'{self.ACCOUNT_ENDPOINT}/accounts/accountNumbers', 
-                                                  headers={'Authorization': f'Bearer {self.accessToken}'})
+        return self.session.get(f'{self.ACCOUNT_ENDPOINT}/accounts/accountNumbers')
 
     def accounts(self, fields=None):
         """
@@ -238,8 +259,7 @@ class Schwab(QObject):
         :return: details for all linked accounts
         :rtype: request.Response
         """
-        return requests.get(f'{self.ACCOUNT_ENDPOINT}/accounts/', 
-                                                  headers={'Authorization': f'Bearer {self.accessToken}'}, 
+        return self.session.get(f'{self.ACCOUNT_ENDPOINT}/accounts/', 
                                                   params=self._params_parser({'fields': fields}))
 
     def account_number(self, accountNumber=None, fields=None):
@@ -252,8 +272,8 @@ class Schwab(QObject):
         :return: details for one linked account
         :rtype: request.Response
         """
-        return requests.get(f'{self.ACCOUNT_ENDPOINT}/accounts/{accountNumber}', 
-                                                  headers={'accept': 'application/json', 'Authorization': f'Bearer {self.accessToken}'}, 
+        return self.session.get(f'{self.ACCOUNT_ENDPOINT}/accounts/{accountNumber}', 
+                                                  headers={'accept': 'application/json'}, 
                                                   params=self._params_parser({'fields': fields}))
 
     # Order methods
@@ -273,8 +293,8 @@ class Schwab(QObject):
         :return: orders for one linked account hash
         :rtype: request.Response
         """
-        return requests.get(f'{self.ACCOUNT_ENDPOINT}/accounts/{accountNumber}/orders', 
-                                                  headers={"Accept": "application/json", 'Authorization': f'Bearer {self.accessToken}'}, 
+        return self.session.get(f'{self.ACCOUNT_ENDPOINT}/accounts/{accountNumber}/orders', 
+                                                  headers={"Accept": "application/json"}, 
                                                   params=self._params_parser({
                                                       'maxResults': maxResults, 
                                                       'fromEnteredTime': self._time_converter(fromEnteredTime, format="iso"), 
@@ -292,8 +312,8 @@ class Schwab(QObject):
         :return: order number in response header (if immediately filled then order number not returned)
         :rtype: request.Response
         """
-        return requests.post(f'{self.ACCOUNT_ENDPOINT}/accounts/{accountNumber}/orders', 
-                                                   headers={'Authorization': f'Bearer {self.accessToken}', 'Content-Type': 'application/json'}, 
+        return self.session.post(f'{self.ACCOUNT_ENDPOINT}/accounts/{accountNumber}/orders', 
+                                                   headers={'Content-Type': 'application/json'}, 
                                                    json=order, timeout = self.timeout)
 
 
@@ -307,8 +327,7 @@ class Schwab(QObject):
         :return: response code
         :rtype: request.Response
         """
-        return requests.get(f'{self.ACCOUNT_ENDPOINT}/accounts/{accountNumber}/orders/{orderId}', 
-                                                  headers={'Authorization': f'Bearer {self.accessToken}'}, 
+        return self.session.get(f'{self.ACCOUNT_ENDPOINT}/accounts/{accountNumber}/orders/{orderId}', 
                                                   params=self._params_parser({'orderId': orderId}))
 
     def get_order_id(self, orderId, accountNumber=None):
@@ -321,8 +340,8 @@ class Schwab(QObject):
         :return: order details
         :rtype: request.Response
         """
-        return requests.get(f'{self.ACCOUNT_ENDPOINT}/accounts/{accountNumber}/orders/{orderId}', 
-                                                  headers={"Accept": "application/json", 'Authorization': f'Bearer {self.accessToken}'})
+        return self.session.get(f'{self.ACCOUNT_ENDPOINT}/accounts/{accountNumber}/orders/{orderId}', 
+                                                  headers={"Accept": "application/json"})
 
     # Option methods
     def get_chains(self, symbol, contractType=None, strikeCount=None, includeUnderlyingQuotes=None, 
@@ -368,8 +387,8 @@ class Schwab(QObject):
         :return: list of option chains
         :rtype: request.Response
         """
-        return requests.get(f'{self.MARKET_ENDPOINT}/chains', 
-                                                  headers={"Accept": "application/json", 'Authorization': f'Bearer {self.accessToken}'}, 
+        return self.session.get(f'{self.MARKET_ENDPOINT}/chains', 
+                                                  headers={"Accept": "application/json"}, 
                                                   params=self._params_parser({
                                                       'symbol': symbol, 'contractType': contractType, 'strikeCount': strikeCount, 
                                                       'includeUnderlyingQuotes': includeUnderlyingQuotes, 'strategy': strategy, 
@@ -387,8 +406,7 @@ class Schwab(QObject):
         :return: option expiration chain
         :rtype: request.Response
         """
-        return requests.get(f'{self.MARKET_ENDPOINT}/expirationchain', 
-                                                  headers={'Authorization': f'Bearer {self.accessToken}'}, 
+        return self.session.get(f'{self.MARKET_ENDPOINT}/expirationchain', 
                                                   params=self._params_parser({'symbol': symbol}))
     
 
@@ -404,9 +422,8 @@ class Schwab(QObject):
         :return: response code
         :rtype: request.Response
         """
-        return requests.put(f'{self.ACCOUNT_ENDPOINT}/accounts/{accountHash}/orders/{orderId}',
-                            headers={"Accept": "application/json", 'Authorization': f'Bearer {self.accessToken}',
-                                     "Content-Type": "application/json"},
+        return self.session.put(f'{self.ACCOUNT_ENDPOINT}/accounts/{accountHash}/orders/{orderId}',
+                            headers={"Accept": "application/json", "Content-Type": "application/json"},
                             json=order)
 
     def account_orders_all(self, fromEnteredTime, toEnteredTime, maxResults=None, status=None):
@@ -423,8 +440,8 @@ class Schwab(QObject):
         :return: all orders
         :rtype: request.Response
         """
-        return requests.get(f'{self.ACCOUNT_ENDPOINT}/orders',
-                            headers={"Accept": "application/json", 'Authorization': f'Bearer {self.accessToken}'},
+        return self.session.get(f'{self.ACCOUNT_ENDPOINT}/orders',
+                            headers={"Accept": "application/json"},
                             params=self._params_parser(
                                 {'maxResults': maxResults, 'fromEnteredTime': self._time_converter(fromEnteredTime, format="iso"),
                                  'toEnteredTime': self._time_converter(toEnteredTime, format="iso"), 'status': status}))
@@ -432,9 +449,8 @@ class Schwab(QObject):
     """
     def order_preview(self, accountHash, orderObject):
         #COMING SOON (waiting on Schwab)
-        return requests.post(f'{self.ACCOUNT_ENDPOINT}/accounts/{accountHash}/previewOrder',
-                             headers={'Authorization': f'Bearer {self.access_token}',
-                                      "Content-Type": "application.json"}, data=orderObject)
+        return self.session.post(f'{self.ACCOUNT_ENDPOINT}/accounts/{accountHash}/previewOrder',
+                             headers={"Content-Type": "application.json"}, data=orderObject)
     """
 
     def transactions(self, accountHash, startDate, endDate, types, symbol=None):
@@ -452,8 +468,7 @@ class Schwab(QObject):
         :return: list of transactions for a specific account
         :rtype: request.Response
         """
-        return requests.get(f'{self.ACCOUNT_ENDPOINT}/accounts/{accountHash}/transactions',
-                            headers={'Authorization': f'Bearer {self.accessToken}'},
+        return self.session.get(f'{self.ACCOUNT_ENDPOINT}/accounts/{accountHash}/transactions',
                             params=self._params_parser(
                                 {'accountNumber': accountHash, 'startDate': self._time_converter(startDate, format="iso"),
                                  'endDate': self._time_converter(endDate, format="iso"), 'symbol': symbol, 'types': types}))
@@ -468,8 +483,7 @@ class Schwab(QObject):
         :return: transaction details of transaction id using accountHash
         :rtype: request.Response
         """
-        return requests.get(f'{self.ACCOUNT_ENDPOINT}/accounts/{accountHash}/transactions/{transactionId}',
-                            headers={'Authorization': f'Bearer {self.accessToken}'},
+        return self.session.get(f'{self.ACCOUNT_ENDPOINT}/accounts/{accountHash}/transactions/{transactionId}',
                             params={'accountNumber': accountHash, 'transactionId': transactionId})
 
     def preferences(self):
@@ -478,8 +492,7 @@ class Schwab(QObject):
         :return: User Preferences and Streaming Info
         :rtype: request.Response
         """
-        return requests.get(f'{self.ACCOUNT_ENDPOINT}/userPreference',
-                            headers={'Authorization': f'Bearer {self.accessToken}'})
+        return self.session.get(f'{self.ACCOUNT_ENDPOINT}/userPreference')
 
     # """
     # Market Data
@@ -497,8 +510,7 @@ class Schwab(QObject):
     #     :return: list of quotes
     #     :rtype: request.Response
     #     """
-    #     return requests.get(f'{self.MARKET_ENDPOINT}/quotes',
-    #                         headers={'Authorization': f'Bearer {self.accessToken}'},
+    #     return self.session.get(f'{self.MARKET_ENDPOINT}/quotes',
     #                         params=self._params_parser(
     #                             {'symbols': self._format_list(symbols), 'fields': fields, 'indicative': indicative}))
 
@@ -512,8 +524,7 @@ class Schwab(QObject):
     #     :return: quote for a single symbol
     #     :rtype: request.Response
     #     """
-    #     return requests.get(f'{self.MARKET_ENDPOINT}/{urllib.parse.quote(symbol_id)}/quotes',
-    #                         headers={'Authorization': f'Bearer {self.accessToken}'},
+    #     return self.session.get(f'{self.MARKET_ENDPOINT}/{urllib.parse.quote(symbol_id)}/quotes',
     #                         params=self._params_parser({'fields': fields}))
 
 
@@ -543,8 +554,7 @@ class Schwab(QObject):
         :return: dictionary of containing candle history
         :rtype: request.Response
         """
-        return requests.get(f'{self.MARKET_ENDPOINT}/pricehistory',
-                            headers={'Authorization': f'Bearer {self.accessToken}'},
+        return self.session.get(f'{self.MARKET_ENDPOINT}/pricehistory',
                             params=self._params_parser({'symbol': symbol, 'periodType': periodType, 'period': period,
                                                         'frequencyType': frequencyType, 'frequency': frequency,
                                                         'startDate': self._time_converter(startDate, "epoch"),
@@ -565,8 +575,7 @@ class Schwab(QObject):
         :return: movers
         :rtype: request.Response
         """
-        return requests.get(f'{self.MARKET_ENDPOINT}/movers/{symbol}',
-                            headers={'Authorization': f'Bearer {self.accessToken}'},
+        return self.session.get(f'{self.MARKET_ENDPOINT}/movers/{symbol}',
                             params=self._params_parser({'sort': sort, 'frequency': frequency}))
 
     # get market hours for a list of markets
@@ -580,8 +589,7 @@ class Schwab(QObject):
         :return: market hours
         :rtype: request.Response
         """
-        return requests.get(f'{self.MARKET_ENDPOINT}/markets',
-                            headers={'Authorization': f'Bearer {self.accessToken}'},
+        return self.session.get(f'{self.MARKET_ENDPOINT}/markets',
                             params=self._params_parser(
                                 {'markets': symbols, #self._format_list(symbols),
                                  'date': self._time_converter(date, 'YYYY-MM-DD')}))
@@ -597,8 +605,7 @@ class Schwab(QObject):
         :return: market hours
         :rtype: request.Response
         """
-        return requests.get(f'{self.MARKET_ENDPOINT}/markets/{market_id}',
-                            headers={'Authorization': f'Bearer {self.accessToken}'},
+        return self.session.get(f'{self.MARKET_ENDPOINT}/markets/{market_id}',
                             params=self._params_parser({'date': self._time_converter(date, 'YYYY-MM-DD')}))
 
     # get instruments for a list of symbols
@@ -612,8 +619,7 @@ class Schwab(QObject):
         :return: instruments
         :rtype: request.Response
         """
-        return requests.get(f'{self.MARKET_ENDPOINT}/instruments',
-                            headers={'Authorization': f'Bearer {self.accessToken}'},
+        return self.session.get(f'{self.MARKET_ENDPOINT}/instruments',
                             params={'symbol': symbol, 'projection': projection})
 
     # get instruments for a single cusip
@@ -625,5 +631,4 @@ class Schwab(QObject):
         :return: instrument
         :rtype: request.Response
         """
-        return requests.get(f'{self.MARKET_ENDPOINT}/instruments/{cusip_id}',
-                            headers={'Authorization': f'Bearer {self.accessToken}'})
\ No newline at end of file
+        return self.session.get(f'{self.MARKET_ENDPOINT}/instruments/{cusip_id}')
\ No newline at end of file
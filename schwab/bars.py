@@ -0,0 +1,154 @@
+from collections import deque
+from datetime import datetime
+from zoneinfo import ZoneInfo
+
+EASTERN = ZoneInfo("America/New_York")
+# 09:30 ET in minutes after midnight, intraday buckets are anchored to the open
+SESSION_OPEN = 9 * 60 + 30
+# Frame name: length in minutes, None for daily
+FRAMES = {
+    "1MIN": 1,
+    "5MIN": 5,
+    "15MIN": 15,
+    "30MIN": 30,
+    "1HOUR": 60,
+    "2HOUR": 120,
+    "4HOUR": 240,
+    "DAILY": None
+}
+# Positions in a bar list
+START, OPEN, HIGH, LOW, CLOSE, VOLUME = range(6)
+
+
+class BarAggregator:
+    """
+    Builds every timeframe from the single 1 minute CHART_EQUITY subscription.
+
+    Each 1 minute bar updates the forming bar of every frame in place (one
+    max/min/add per frame) or opens a new one, so the cost per tick does not
+    depend on history length. Bars are kept per symbol and frame in ring
+    buffers of capacity entries. Intraday buckets start at 09:30 ET and daily
+    bars follow the ET calendar day.
+
+    A 1 minute bar sent again for the same minute replaces its earlier values:
+    close and volume are corrected, high/low can only widen.
+    """
+    # Record attributes on_chart reads
+    FIELDS = ("open", "high", "low", "close", "volume", "chart_time")
+
+    def __init__(self, capacity=500):
+        self.capacity = capacity
+        self.bars = {}
+        self.minutes = {}
+        self.listeners = []
+        self.ticks = 0
+        # (midnight, next midnight, 09:30) of the current ET day in epoch milliseconds
+        self._day = (0, 0, 0)
+
+
+    def add_listener(self, listener):
+        """
+        Register listener(symbol, frame, bar) called when a bar closes, bar as returned by latest().
+        """
+        self.listeners.append(listener)
+
+
+    def on_chart(self, content, timestamp=None):
+        """
+        CHART_EQUITY stream handler, content is decoded CHART_EQUITY records.
+        """
+        for bar in content:
+            if bar.chart_time is None or bar.close is None:
+                continue
+            self.update(bar.key, int(bar.chart_time), bar.open, bar.high, bar.low, bar.close, bar.volume or 0.0)
+
+
+    def update(self, symbol, chart_time, open, high, low, close, volume):
+        """
+        Add one 1 minute bar.
+        :param chart_time: start of the minute in epoch milliseconds
+        :type chart_time: int
+        """
+        self.ticks += 1
+        previous = self.minutes.get(symbol)
+        volume_change = volume
+        if previous is not None and previous[START] == chart_time:
+            # Same minute again, only the difference goes into the higher frames
+            volume_change = volume - previous[VOLUME]
+        self.minutes[symbol] = [chart_time, open, high, low, close, volume]
+
+        midnight, next_midnight, session_open = self._day
+        if not midnight <= chart_time < next_midnight:
+            midnight, next_midnight, session_open = self._day = self._session(chart_time)
+        offset = (chart_time - session_open) // 60000
+
+        for frame, length in FRAMES.items():
+            if length is None:
+                start = midnight
+            else:
+                start = chart_time - (offset - offset // length * length) * 60000
+
+            ring = self.bars.get((symbol, frame))
+            if ring is None:
+                ring = self.bars[(symbol, frame)] = deque(maxlen=self.capacity)
+
+            bar = ring[-1] if ring else None
+            if bar is not None and bar[START] == start:
+                if high > bar[HIGH]:
+                    bar[HIGH] = high
+                if low < bar[LOW]:
+                    bar[LOW] = low
+                bar[CLOSE] = close
+                bar[VOLUME] += volume_change
+            elif bar is None or start > bar[START]:
+                if bar is not None:
+                    self._closed(symbol, frame, bar)
+                ring.append([start, open, high, low, close, volume])
+
+
+    @staticmethod
+    def _session(chart_time):
+        # Day boundaries are looked up once per day, DST changes happen overnight
+        day = datetime.fromtimestamp(chart_time / 1000, EASTERN).date()
+        midnight = datetime(day.year, day.month, day.day, tzinfo=EASTERN)
+        next_day = datetime.fromordinal(day.toordinal() + 1).replace(tzinfo=EASTERN)
+        session_open = midnight.replace(hour=SESSION_OPEN // 60, minute=SESSION_OPEN % 60)
+        return int(midnight.timestamp() * 1000), int(next_day.timestamp() * 1000), int(session_open.timestamp() * 1000)
+
+
+    def _closed(self, symbol, frame, bar):
+        for listener in self.listeners:
+            try:
+                listener(symbol, frame, self._as_dict(bar))
+            except Exception as e:
+                print(f"Error in bar listener: {e}")
+
+
+    @staticmethod
+    def _as_dict(bar):
+        return {"datetime": bar[START], "open": bar[OPEN], "high": bar[HIGH], "low": bar[LOW], "close": bar[CLOSE], "volume": bar[VOLUME]}
+
+
+    def latest(self, symbol, frame="1MIN"):
+        """
+        :return: the most recent (possibly still forming) bar, None before the first tick
+        :rtype: dict
+        """
+        ring = self.bars.get((symbol, frame))
+        return self._as_dict(ring[-1]) if ring else None
+
+
+    def candles(self, symbol, frame="1MIN", count=None):
+        """
+        Bars shaped like a price_history() response, so anything built on the REST candles can use them.
+        :param frame: one of FRAMES
+        :type frame: str
+        :param count: only the last count bars
+        :type count: int
+        :rtype: dict
+        """
+        if frame not in FRAMES:
+            raise ValueError(f"Unsupported frame: {frame}")
+        ring = self.bars.get((symbol, frame), ())
+        bars = list(ring)[-count:] if count else list(ring)
+        return {"symbol": symbol, "empty": not bars, "candles": [self._as_dict(bar) for bar in bars]}
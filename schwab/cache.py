@@ -0,0 +1,238 @@
+import os
+import json
+import time
+import threading
+from .stream import LEVELONE_OPTIONS_FIELDS
+
+
+class AccountCache:
+    """
+    Account numbers and hashes, loaded once and reused by every trade action.
+
+    The loader is only called on a miss (first use or after invalidate()), so the
+    hot path never goes to the network for the account hash.
+    """
+    def __init__(self, loader, account_number=None):
+        self.loader = loader
+        self.account_number = account_number
+        self.accounts = None
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+
+
+    def get(self):
+        """
+        :return: cached list of {"accountNumber", "hashValue"} pairs, or None if they could not be loaded
+        :rtype: list
+        """
+        with self._lock:
+            if self.accounts is not None:
+                self.hits += 1
+                return self.accounts
+
+        # One load at a time, without holding _lock: a 401 inside the loader calls invalidate() on this thread
+        with self._load_lock:
+            with self._lock:
+                if self.accounts is not None:
+                    self.hits += 1
+                    return self.accounts
+                self.misses += 1
+
+            accounts = self.loader()
+            with self._lock:
+                # Error payloads are not cached so the next call retries
+                if isinstance(accounts, list) and accounts:
+                    self.accounts = accounts
+                return self.accounts
+
+
+    def account_hash(self):
+        """
+        :return: hash of the configured account, or of the first linked account
+        :rtype: str
+        """
+        accounts = self.get()
+        if not accounts:
+            return None
+        for account in accounts:
+            if account.get('accountNumber') == self.account_number:
+                return account.get('hashValue')
+        return accounts[0].get('hashValue')
+
+
+    def invalidate(self, *args):
+        with self._lock:
+            self.accounts = None
+
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0
+        }
+
+
+class ChainCache:
+    """
+    Option chains for both sides kept warm in memory by a background refresh.
+
+    loader(type) requests the chain and transform(chain) turns it into the
+    contract index callers select from, so a signal only pays for a lookup.
+    Entries older than max_age seconds are treated as a miss and reloaded in
+    line. Optionally, LEVELONE_OPTIONS ticks patch bid, ask and delta between
+    refreshes through the index's update(symbol, values). With a
+    snapshot_directory set, the raw chain of each side is also saved every
+    snapshot_interval seconds as <directory>/<date>/<epoch ms>_<side>.json for
+    the backtester. Refresh errors go to log_signal when given, the last good
+    chain stays cached.
+    """
+    TYPES = ('CALL', 'PUT')
+    # Stream field id -> index column
+    PATCH_COLUMNS = {'bid': 'Bid', 'ask': 'Ask', 'delta': 'Delta'}
+
+    def __init__(self, loader, transform=None, refresh_interval=5, max_age=15, snapshot_directory=None, snapshot_interval=60, log_signal=None):
+        self.loader = loader
+        self.log_signal = log_signal
+        self.transform = transform
+        self.refresh_interval = refresh_interval
+        self.max_age = max_age
+        self.frames = {}
+        self.updated = {}
+        self.symbols = {}
+        self.hits = 0
+        self.misses = 0
+        self.stream = None
+        self.snapshot_directory = snapshot_directory
+        self.snapshot_interval = snapshot_interval
+        self.snapshots = {}
+        self._stop = threading.Event()
+        self._thread = None
+
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            if not self._stop.is_set():
+                return
+            # Stopped but still finishing a refresh, let it end before starting over
+            self._thread.join()
+        self._stop.clear()
+
+        def refresher():
+            while not self._stop.is_set():
+                for type in self.TYPES:
+                    try:
+                        self.refresh(type)
+                    except Exception as e:
+                        self._log(f"Error refreshing {type} chain, keeping the last one: {e}")
+                self._stop.wait(self.refresh_interval)
+        self._thread = threading.Thread(target=refresher, daemon=True)
+        self._thread.start()
+
+
+    def stop(self):
+        self._stop.set()
+
+
+    def _log(self, message):
+        if self.log_signal is not None:
+            self.log_signal.emit(message)
+        else:
+            print(message)
+
+
+    def refresh(self, type):
+        """
+        :raises ValueError: the chain has no expirations, e.g. an error payload, the cached one stays
+        """
+        chain = self.loader(type)
+        if not chain.get(f"{type.lower()}ExpDateMap"):
+            raise ValueError(f"No {type} expirations in the chain response: {str(chain)[:200]}")
+        frame = self.transform(chain) if self.transform is not None else chain
+        self.frames[type] = frame
+        self.updated[type] = time.monotonic()
+        if self.snapshot_directory is not None:
+            self._snapshot(type, chain)
+
+        if self.stream is not None:
+            symbols = set(frame.symbols)
+            # Only touch the subscription when the strikes in the chain moved
+            previous = self.symbols.get(type, set())
+            if symbols != previous:
+                owner = f"chain_{type}"
+                self.stream.subscribe("LEVELONE_OPTIONS", sorted(symbols), LEVELONE_OPTIONS_FIELDS, owner)
+                if previous - symbols:
+                    self.stream.unsubscribe("LEVELONE_OPTIONS", sorted(previous - symbols), owner)
+            self.symbols[type] = symbols
+        return frame
+
+
+    def _snapshot(self, type, chain):
+        now = time.time()
+        if now - self.snapshots.get(type, 0) < self.snapshot_interval:
+            return
+        self.snapshots[type] = now
+        directory = os.path.join(self.snapshot_directory, time.strftime('%Y-%m-%d', time.localtime(now)))
+
+        # Written in the background, a signal's get() never waits on the disk and a failed write never fails the refresh
+        def write():
+            try:
+                os.makedirs(directory, exist_ok=True)
+                with open(os.path.join(directory, f"{int(now * 1000)}_{type}.json"), 'w') as f:
+                    json.dump(chain, f)
+            except (OSError, TypeError, ValueError) as e:
+                self._log(f"Error saving {type} chain snapshot: {e}")
+        threading.Thread(target=write, daemon=True).start()
+
+
+    def get(self, type):
+        """
+        :return: the cached index for a side, reloaded first if it is missing or older than max_age
+        """
+        age = self.age(type)
+        if age is not None and age <= self.max_age:
+            self.hits += 1
+            return self.frames[type]
+        self.misses += 1
+        return self.refresh(type)
+
+
+    def age(self, type):
+        """
+        :return: seconds since the side was last refreshed, None if it never was
+        :rtype: float
+        """
+        updated = self.updated.get(type)
+        return time.monotonic() - updated if updated is not None else None
+
+
+    def attach_stream(self, stream):
+        """
+        Patch cached quotes from LEVELONE_OPTIONS ticks between refreshes.
+        """
+        self.stream = stream
+        stream.add_handler("LEVELONE_OPTIONS", self.patch, tuple(self.PATCH_COLUMNS))
+
+
+    def patch(self, content, timestamp=None):
+        for quote in content:
+            # Delta quotes, None means the field did not change
+            values = {column: getattr(quote, field) for field, column in self.PATCH_COLUMNS.items() if getattr(quote, field) is not None}
+            if not values:
+                continue
+            for type, symbols in self.symbols.items():
+                if quote.key in symbols:
+                    self.frames[type].update(quote.key, values)
+
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'age': {type: round(self.age(type), 2) if self.age(type) is not None else None for type in self.TYPES}
+        }
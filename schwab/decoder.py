@@ -0,0 +1,115 @@
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Streamer field ids per service, position in the tuple is the field id
+FIELDS = {
+    "CHART_EQUITY": ("key", "open", "high", "low", "close", "volume", "sequence", "chart_time", "chart_day"),
+    "LEVELONE_EQUITIES": ("key", "bid", "ask", "last", "bid_size", "ask_size", "ask_id", "bid_id", "volume", "last_size",
+                          "high", "low", "close", "exchange_id", "marginable", "description", "last_id", "open",
+                          "net_change", "high_52_week", "low_52_week", "pe_ratio", "dividend_amount", "dividend_yield",
+                          "nav", "exchange_name", "dividend_date", "regular_market_quote", "regular_market_trade",
+                          "regular_market_last", "regular_market_last_size", "regular_market_net_change",
+                          "security_status", "mark", "quote_time", "trade_time"),
+    "LEVELONE_OPTIONS": ("key", "description", "bid", "ask", "last", "high", "low", "close", "volume", "open_interest",
+                         "volatility", "intrinsic_value", "expiration_year", "multiplier", "digits", "open", "bid_size",
+                         "ask_size", "last_size", "net_change", "strike", "contract_type", "underlying",
+                         "expiration_month", "deliverables", "time_value", "expiration_day", "days_to_expiration",
+                         "delta", "gamma", "theta", "vega", "rho", "security_status", "theoretical_value",
+                         "underlying_price", "expiration_type", "mark", "quote_time", "trade_time")
+}
+
+
+class Record:
+    """
+    Base of the per service records, fields the message did not carry are None.
+
+    LEVELONE services only send the fields that changed, so None means
+    "unchanged", not "no value".
+    """
+    __slots__ = ()
+    service = None
+
+    def __repr__(self):
+        fields = ", ".join(f"{name}={getattr(self, name)!r}" for name in self.__slots__ if getattr(self, name) is not None)
+        return f"{type(self).__name__}({fields})"
+
+    def get(self, name, default=None):
+        value = getattr(self, name, None)
+        return default if value is None else value
+
+
+def record_type(service, pairs):
+    """
+    :param pairs: (json key, attribute name) for every field of the record
+    :type pairs: list
+    :return: a Record subclass with __slots__ built straight from a raw entry dict, Record(entry)
+    :rtype: type
+    """
+    # A generated __init__ (as namedtuple does) is several times faster than a setattr loop
+    source = "def __init__(self, entry):\n" + "".join(f"    self.{name} = entry.get({key!r})\n" for key, name in pairs)
+    namespace = {}
+    exec(source, namespace)
+    class_name = "".join(part.title() for part in service.split("_")) + "Record"
+    return type(class_name, (Record,), {"__slots__": tuple(name for _, name in pairs), "service": service,
+                                        "__init__": namespace["__init__"]})
+
+
+class StreamDecoder:
+    """
+    Turns streamer data items into typed records through precomputed field tables.
+
+    Only the fields registered with keep() are materialized (plus "key"), the
+    rest of each entry is never looked at. Messages are parsed with orjson
+    when it is installed.
+    """
+    def __init__(self):
+        self.keep_fields = {}
+        self.tables = {}
+
+
+    @staticmethod
+    def loads(message):
+        return orjson.loads(message) if orjson is not None else json.loads(message)
+
+
+    def keep(self, service, names=None):
+        """
+        Declare the fields a consumer of service needs, None for all of them.
+        """
+        if names is None or self.keep_fields.get(service, ()) is None:
+            self.keep_fields[service] = None
+        else:
+            self.keep_fields[service] = set(self.keep_fields.get(service, ())) | set(names)
+        self.tables.pop(service, None)
+
+
+    def _table(self, service):
+        table = self.tables.get(service)
+        if table is None:
+            names = FIELDS.get(service)
+            if names is None:
+                return None
+            keep = self.keep_fields.get(service)
+            # (json key, slot name) pairs for the fields kept, "key" always first
+            pairs = [(str(position), name) for position, name in enumerate(names)
+                     if position == 0 or keep is None or name in keep]
+            pairs[0] = ("key", "key")
+            table = self.tables[service] = record_type(service, pairs)
+        return table
+
+
+    def decode(self, service, content):
+        """
+        :param content: "content" list of one data item
+        :type content: list
+        :return: one record per entry, the raw content for services without a field table
+        :rtype: list
+        """
+        record = self._table(service)
+        if record is None:
+            return content
+        return [record(entry) for entry in content]
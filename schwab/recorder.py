@@ -0,0 +1,218 @@
+import os
+import json
+import time
+import queue
+import struct
+import threading
+from datetime import datetime
+
+MAGIC = b"SCHWREC1"
+# Per record: message timestamp in epoch milliseconds, payload length
+RECORD = struct.Struct("<qI")
+
+
+class StreamRecorder:
+    """
+    Append-only binary log of the stream, written off the websocket loop.
+
+    record() only puts the raw message on a bounded queue, a background thread
+    decodes it, splits it per service and appends each data item as a
+    fixed-width header plus compact JSON payload to
+    <directory>/<YYYY-MM-DD>/<SERVICE>.bin, one file per day and service.
+    When the queue is full messages are dropped and counted rather than
+    stalling the stream. A failed write (disk full, permissions) drops that
+    batch's records for the file, counts an error and is retried on the next
+    batch, the writer thread keeps draining the queue.
+    """
+    def __init__(self, directory='./data/stream', queue_size=10000, batch_size=500, flush_interval=0.5, report_interval=60):
+        self.directory = directory
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.report_interval = report_interval
+        self.files = {}
+        self.received = 0
+        self.dropped = 0
+        self.errors = 0
+        self.lost = 0
+        self.records = 0
+        self.bytes = 0
+        self.batches = 0
+        self.max_depth = 0
+        self.write_time = 0.0
+        self.running = False
+        self._thread = None
+
+
+    def start(self):
+        if self.running:
+            return
+        self.running = True
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+
+    def stop(self):
+        """
+        Write whatever is still queued and close the files.
+        """
+        if not self.running:
+            return
+        self.running = False
+        self._thread.join(10)
+
+
+    def record(self, message, received=None):
+        """
+        Called on the websocket loop, never blocks.
+        :param message: raw websocket message
+        :type message: str
+        """
+        self.received += 1
+        try:
+            self.queue.put_nowait((message, received or time.time()))
+        except queue.Full:
+            self.dropped += 1
+            return
+        depth = self.queue.qsize()
+        if depth > self.max_depth:
+            self.max_depth = depth
+
+
+    def _run(self):
+        last_report = time.monotonic()
+        while self.running or not self.queue.empty():
+            batch = []
+            try:
+                batch.append(self.queue.get(timeout=self.flush_interval))
+                while len(batch) < self.batch_size:
+                    batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                pass
+            if batch:
+                try:
+                    self._write(batch)
+                except Exception as e:
+                    # Never let the writer die, record() would only fill the queue and drop from then on
+                    self.errors += 1
+                    self.lost += len(batch)
+                    print(f"Recorder batch failed: {e!r}")
+
+            if self.report_interval and time.monotonic() - last_report >= self.report_interval:
+                last_report = time.monotonic()
+                print(f"Recorder: {self.stats()}")
+
+        for file in self.files.values():
+            file.close()
+        self.files = {}
+
+
+    def _write(self, batch):
+        start = time.perf_counter()
+        chunks = {}
+        for message, received in batch:
+            try:
+                data = json.loads(message)
+                items = data.get("data", [])
+                for item in items:
+                    timestamp = int(item.get("timestamp") or received * 1000)
+                    payload = json.dumps({key: value for key, value in item.items() if key not in ("service", "timestamp")},
+                                         separators=(",", ":")).encode()
+                    day = datetime.fromtimestamp(timestamp / 1000).strftime("%Y-%m-%d")
+                    chunks.setdefault((day, item.get("service", "UNKNOWN")), []).append(RECORD.pack(timestamp, len(payload)) + payload)
+            except (ValueError, TypeError, AttributeError):
+                continue
+
+        for key, records in chunks.items():
+            block = b"".join(records)
+            file = position = None
+            try:
+                file = self._file(*key)
+                position = file.tell()
+                file.write(block)
+                file.flush()
+            except OSError as e:
+                self.errors += 1
+                self.lost += len(records)
+                print(f"Recorder write to {key[0]}/{key[1]}.bin failed: {e}")
+                self._discard(key, file, position)
+                continue
+            self.records += len(records)
+            self.bytes += len(block)
+
+        self.batches += 1
+        self.write_time += time.perf_counter() - start
+
+
+    def _discard(self, key, file, position):
+        # Cut a half written block off so read() stays aligned, the file is reopened on the next write
+        self.files.pop(key, None)
+        if file is None:
+            return
+        try:
+            if position is not None:
+                file.truncate(position)
+            file.close()
+        except OSError:
+            pass
+
+
+    def _file(self, day, service):
+        key = (day, service)
+        if key not in self.files:
+            # A new day rotates every service to a new file
+            for old in [k for k in self.files if k[0] != day]:
+                self.files.pop(old).close()
+            os.makedirs(os.path.join(self.directory, day), exist_ok=True)
+            path = os.path.join(self.directory, day, f"{service}.bin")
+            file = open(path, "ab")
+            if file.tell() == 0:
+                file.write(MAGIC)
+            self.files[key] = file
+        return self.files[key]
+
+
+    def stats(self):
+        """
+        :return: counters, write throughput (records/s while writing) and queue depth
+        :rtype: dict
+        """
+        return {
+            'received': self.received,
+            'records': self.records,
+            'bytes': self.bytes,
+            'dropped': self.dropped,
+            'errors': self.errors,
+            'lost': self.lost,
+            'batches': self.batches,
+            'queue_depth': self.queue.qsize(),
+            'max_queue_depth': self.max_depth,
+            'records_per_second': round(self.records / self.write_time) if self.write_time else 0
+        }
+
+
+def read(path):
+    """
+    Iterate a recorder file in write order.
+    :param path: <directory>/<YYYY-MM-DD>/<SERVICE>.bin
+    :type path: str
+    :return: (timestamp, item) with item shaped like a stream data entry (service, timestamp, command, content)
+    :rtype: generator
+    """
+    service = os.path.splitext(os.path.basename(path))[0]
+    with open(path, "rb") as file:
+        if file.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"Not a stream recording: {path}")
+        while True:
+            header = file.read(RECORD.size)
+            if len(header) < RECORD.size:
+                return
+            timestamp, length = RECORD.unpack(header)
+            payload = file.read(length)
+            # A torn record at the end of a file still being written
+            if len(payload) < length:
+                return
+            item = json.loads(payload)
+            item["service"] = service
+            item["timestamp"] = timestamp
+            yield timestamp, item
@@ -0,0 +1,133 @@
+import os
+import json
+import glob
+import time
+import heapq
+import threading
+from . import recorder
+
+
+class StreamReplay:
+    """
+    Plays recorded stream data back through a Stream's handlers.
+
+    Recorder files (*.bin) and the old JSON-lines dumps can be mixed, they are
+    merged on message timestamp (ties keep file order, so a replay is
+    deterministic) and every data item goes through stream._dispatch() exactly
+    like a live message. Nothing is sent to Schwab, a Stream built with
+    schwab=None works.
+
+    speed is 1 for real time, 10/100 for scaled, None for as fast as possible.
+    """
+    def __init__(self, stream, paths, speed=None, services=None):
+        """
+        :param paths: recorder files, JSON-lines dumps, or directories holding them
+        :type paths: list
+        :param services: only replay these services, all by default
+        :type services: list
+        """
+        self.stream = stream
+        self.paths = self._expand(paths if type(paths) is list else [paths])
+        self.speed = speed
+        self.services = set(services) if services else None
+        self.running = False
+        self.items = 0
+        self.ticks = 0
+        self.per_service = {}
+        self.max_lag = 0.0
+        self.elapsed = 0.0
+        self._thread = None
+
+
+    @staticmethod
+    def _expand(paths):
+        files = []
+        for path in paths:
+            if os.path.isdir(path):
+                files.extend(sorted(glob.glob(os.path.join(path, "**", "*.bin"), recursive=True)))
+                files.extend(sorted(glob.glob(os.path.join(path, "**", "*.json"), recursive=True)))
+            else:
+                files.append(path)
+        return files
+
+
+    @staticmethod
+    def _read_json_lines(path):
+        # One {"data": [...]} message per line, as Stream.on_message used to append them
+        timestamp = 0
+        with open(path) as file:
+            for line in file:
+                line = line.strip()
+                if not line:
+                    continue
+                for item in json.loads(line).get("data", []):
+                    timestamp = int(item.get("timestamp") or timestamp)
+                    yield timestamp, item
+
+
+    def _records(self):
+        readers = [recorder.read(path) if path.endswith(".bin") else self._read_json_lines(path) for path in self.paths]
+        for timestamp, item in heapq.merge(*readers, key=lambda record: record[0]):
+            if self.services is None or item.get("service") in self.services:
+                yield timestamp, item
+
+
+    def run(self):
+        """
+        Replay everything in the calling thread.
+        :return: stats()
+        :rtype: dict
+        """
+        self.running = True
+        start = time.perf_counter()
+        first = None
+
+        for timestamp, item in self._records():
+            if not self.running:
+                break
+
+            if self.speed:
+                if first is None:
+                    first = timestamp
+                due = start + (timestamp - first) / 1000 / self.speed
+                delay = due - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                else:
+                    self.max_lag = max(self.max_lag, -delay)
+
+            self.stream._dispatch({"data": [item]})
+            self.items += 1
+            self.ticks += len(item.get("content", []))
+            service = item.get("service")
+            self.per_service[service] = self.per_service.get(service, 0) + 1
+
+        self.elapsed = time.perf_counter() - start
+        self.running = False
+        return self.stats()
+
+
+    def start(self):
+        self._thread = threading.Thread(target=self.run, daemon=True)
+        self._thread.start()
+        return self._thread
+
+
+    def stop(self):
+        self.running = False
+
+
+    def stats(self):
+        """
+        :return: messages and ticks replayed, ticks per second sustained by the handlers, worst lag behind schedule
+        :rtype: dict
+        """
+        elapsed = self.elapsed or 1e-9
+        return {
+            'items': self.items,
+            'ticks': self.ticks,
+            'per_service': dict(self.per_service),
+            'seconds': round(self.elapsed, 3),
+            'ticks_per_second': round(self.ticks / elapsed),
+            'max_lag_ms': round(self.max_lag * 1000, 3)
+        }
@@ -0,0 +1,49 @@
+import requests
+from requests.adapters import HTTPAdapter
+
+
+class SchwabSession(requests.Session):
+    """
+    Pooled keep-alive session shared by every Schwab REST call.
+
+    Connections to api.schwabapi.com are reused between requests instead of
+    paying a new TCP + TLS handshake per call, and the bearer token is added
+    to each request from token_provider so callers never build auth headers.
+    """
+    def __init__(self, token_provider=None, pool_connections=4, pool_maxsize=10, pool_block=True, max_retries=0):
+        super().__init__()
+        self.token_provider = token_provider
+        self.unauthorized_callbacks = []
+
+        # pool_connections is the number of host pools kept, pool_maxsize the connections per host
+        adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize,
+                              pool_block=pool_block, max_retries=max_retries)
+        self.mount('https://', adapter)
+        self.mount('http://', adapter)
+        self.headers.update({'Accept': 'application/json', 'Connection': 'keep-alive'})
+        self.hooks['response'].append(self._check_unauthorized)
+
+
+    def request(self, method, url, headers=None, **kwargs):
+        headers = dict(headers) if headers else {}
+        token = self.token_provider() if self.token_provider is not None else None
+
+        # Explicit Authorization headers (e.g. Basic auth on the token endpoint) are left alone
+        if token and 'Authorization' not in headers:
+            headers['Authorization'] = f'Bearer {token}'
+        return super().request(method, url, headers=headers, **kwargs)
+
+
+
+    def on_unauthorized(self, callback):
+        """
+        Register a callable run with the response whenever a request comes back 401.
+        """
+        self.unauthorized_callbacks.append(callback)
+
+
+    def _check_unauthorized(self, response, *args, **kwargs):
+        if response.status_code == 401:
+            for callback in self.unauthorized_callbacks:
+                callback(response)
+        return response
@@ -1,5 +1,4 @@
 import json
-import requests
 import atexit
 import websockets.exceptions
 import asyncio
@@ -7,17 +6,38 @@ import websockets
 import threading
 from time import sleep
 from datetime import datetime, time
+from .recorder import StreamRecorder
+from .bars import BarAggregator
+from .subscriptions import SubscriptionManager
+from .supervisor import StreamSupervisor
+from .decoder import StreamDecoder
+
+# Symbol, Bid, Ask, Last, Delta, Mark
+LEVELONE_OPTIONS_FIELDS = "0,2,3,4,28,37"
+# Symbol, Open, High, Low, Close, Volume, Sequence, Chart Time, Chart Day
+CHART_EQUITY_FIELDS = "0,1,2,3,4,5,6,7,8"
+
 
 class Stream:
-    def __init__(self, schwab):
-        self.streamer_info = None
+    def __init__(self, schwab, streamer_info=None, symbols=None):
+        self.streamer_info = streamer_info
         self.request_id = 1
         self.schwab = schwab
         self.websocket = None
-        self.symbols = ["SPY"]
+        self.symbols = symbols or ["SPY"]
         self.subscriptions = {}
+        self.subscription_manager = SubscriptionManager(self)
+        self.handlers = {}
+        self.decoder = StreamDecoder()
         self.active = False
+        self.supervisor = StreamSupervisor()
+        self._stopping = False
         self._thread = None
+        self._loop = None
+        self._wakeup = None
+        self.recorder = StreamRecorder()
+        self.bars = BarAggregator()
+        self.add_handler("CHART_EQUITY", self.bars.on_chart, self.bars.FIELDS)
         self.STREAM_ENDPOINT = "https://api.schwab.com/v1"
 
         atexit.register(self.stop_atexit)
@@ -30,128 +50,223 @@ class Stream:
         if self.active:
             print("Stopping stream on exit")
             self.stop()
+        self.recorder.stop()
 
 
     def get_user_preferences(self):
         """
         
         """
-        headers = {
-            "Authorization": f"Bearer {self.schwab.accessToken}"
-        }
-        response = requests.get(f"{self.STREAM_ENDPOINT}/userpreferences", headers=headers)
+        response = self.schwab.session.get(f"{self.STREAM_ENDPOINT}/userpreferences")
         if response.status_code == 200:
             return response.json()
         else:
             return None
 
 
-    async def on_message(self):
+    def add_handler(self, service, handler, fields=None):
+        """
+        Register handler(records, timestamp) to be called for every data message of a service.
+        :param fields: record attributes the handler reads (see decoder.FIELDS), None for all
+        :type fields: tuple
+        """
+        self.handlers.setdefault(service, []).append(handler)
+        self.decoder.keep(service, fields)
+
+
+    def remove_handler(self, service, handler):
+        """
+        
+        """
+        if handler in self.handlers.get(service, []):
+            self.handlers[service].remove(handler)
+
+
+    def _dispatch(self, data):
         """
         
         """
-        async for message in self.websocket:
-            data = json.loads(message)
+        for item in data.get("data", []):
+            service = item.get("service")
+            handlers = self.handlers.get(service)
+            # Nothing listens, skip decoding altogether
+            if not handlers:
+                continue
+            records = self.decoder.decode(service, item.get("content", []))
+            for handler in list(handlers):
+                try:
+                    handler(records, item.get("timestamp"))
+                except Exception as e:
+                    print(f"Error in {service} handler: {e}")
+
 
-            # Save the data to a file
-            with open('/Users/josuecastellanos/Documents/Automated_Trading_System/data/candle_history/stream_data.json', 'a') as file:
-                json.dump(data, file)
-                file.write('\n')  # Write each message as a new line in the file
+    async def on_message(self):
+        """
+        
+        """
+        while True:
+            # Not even a heartbeat within the timeout means the connection is dead
+            message = await asyncio.wait_for(self.websocket.recv(), self.supervisor.heartbeat_timeout)
+            data = self.decoder.loads(message)
+            self._dispatch(data)
 
-            print("Received and saved message:", data)
+            # Disk writes happen on the recorder thread
+            self.recorder.record(message)
 
 
     async def subscribe_services(self):
         """
         
         """
-        intervals = {
-            "1MIN": "2",
-            "5MIN": "3",
-            "15MIN": "4",
-            "30MIN": "5",
-            "1HOUR": "6",
-            "2HOUR": "7",
-            "4HOUR": "8",
-            "DAILY": "9"
-        }
+        # One 1 minute subscription, the bar aggregator derives 5MIN through DAILY from it
+        self.subscription_manager.add("CHART_EQUITY", self.symbols, CHART_EQUITY_FIELDS)
 
-        for symbol in self.symbols:
-            for interval, request_id in intervals.items():
-                subscribe_request = {
-                    "requests": [{
-                        "requestid": self.request_id,
-                        "service": "CHART_EQUITY",
-                        "command": "SUBS",
-                        "SchwabClientCustomerId": self.streamer_info.get("schwabClientCustomerId"),
-                        "SchwabClientCorrelId": self.streamer_info.get("schwabClientCorrelId"),
-                        "parameters": {
-                            "keys": symbol,
-                            "fields": "1,2,3,4,5,6,7,8,9,10",
-                            "frequency": interval
-                        }
-                    }]
-                }
-                await self.websocket.send(json.dumps(subscribe_request))
-                self._record_request(subscribe_request)
-                self.request_id += 1
+        # Everything subscribed so far, including requests made before the connection was up
+        await self.subscription_manager.replay()
 
 
+    def add_symbol(self, symbol):
+        """
+        Stream 1 minute bars for another equity symbol.
+        """
+        if symbol not in self.symbols:
+            self.symbols.append(symbol)
+            self.subscription_manager.add("CHART_EQUITY", [symbol], CHART_EQUITY_FIELDS)
+
 
     async def _start_streamer(self, *args, **kwargs):
         """
         
         """
-        response = self.schwab.preferences()
-        if response.ok:
-            self.streamer_info = response.json().get('streamerInfo', None)[0]
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self.recorder.start()
 
-        while True:
+        while not self._stopping:
             try:
-                async with websockets.connect(self.streamer_info.get('streamerSocketUrl'), ping_interval=None) as self.websocket:
+                if self.streamer_info is None:
+                    response = self.schwab.preferences()
+                    if not response.ok:
+                        raise ConnectionError(f"Error {response.status_code}: Unable to load streamer info")
+                    self.streamer_info = response.json().get('streamerInfo', None)[0]
+
+                async with websockets.connect(self.streamer_info.get('streamerSocketUrl'), ping_interval=20, ping_timeout=20) as self.websocket:
                     print("WebSocket connection opened")
 
-                    # Login to the streamer
-                    login_request = {
-                        "requests": [{
-                            "requestid": self.request_id,
-                            "service": "ADMIN",
-                            "command": "LOGIN",
-                            "SchwabClientCustomerId": self.streamer_info.get("schwabClientCustomerId"),
-                            "SchwabClientCorrelId": self.streamer_info.get("schwabClientCorrelId"),
-                            "parameters": {
-                                "Authorization": self.schwab.accessToken,
-                                "SchwabClientChannel": self.streamer_info.get("schwabClientChannel"),
-                                "SchwabClientFunctionId": self.streamer_info.get("schwabClientFunctionId")
-                            }
-                        }]
-                    }
-                    await self.websocket.send(json.dumps(login_request))
-                    self.request_id += 1
-
-                    # Subscribe to various interval chart data for the symbols
+                    # Login with the current access token, it may have been refreshed since the last connection
+                    await self._login()
+                    self.active = True
+
+                    # Bars missed while disconnected, before live bars resume
+                    if self.supervisor.connections:
+                        await self._loop.run_in_executor(None, self._backfill)
+
+                    # Subscribe to chart data for the symbols and everything else requested so far
                     await self.subscribe_services()
+                    self.supervisor.connected()
 
                     # Handle incoming messages
                     await self.on_message()
-                    
+
             except Exception as e:
                 self.active = False
-                if e is websockets.exceptions.ConnectionClosedOK or str(e) == "received 1000 (OK); then sent 1000 (OK)":  # catch logout request
-                    print("Failed")
-                    break
-                elif e is websockets.exceptions.ConnectionClosedError or str(e) == "no close frame received or sent":  # catch no subscriptions kick
-                    print("Failed")
+                if self._stopping:
                     break
+                if isinstance(e, websockets.exceptions.ConnectionClosedOK):
+                    reason = "closed by the server"
+                elif isinstance(e, websockets.exceptions.ConnectionClosedError):
+                    reason = "connection lost"
+                elif isinstance(e, asyncio.TimeoutError):
+                    reason = "no heartbeat"
                 else:
-                    print({e})
+                    reason = repr(e)
+                delay = self.supervisor.disconnected(e)
+                print(f"Stream {reason}, reconnecting in {delay:.1f} s: {self.supervisor.stats()}")
+                # stop() cuts the backoff short
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+        self.websocket = None
+
+
+    async def _login(self):
+        """
+        
+        """
+        login_request = {
+            "requests": [{
+                "requestid": self.request_id,
+                "service": "ADMIN",
+                "command": "LOGIN",
+                "SchwabClientCustomerId": self.streamer_info.get("schwabClientCustomerId"),
+                "SchwabClientCorrelId": self.streamer_info.get("schwabClientCorrelId"),
+                "parameters": {
+                    "Authorization": self.schwab.accessToken,
+                    "SchwabClientChannel": self.streamer_info.get("schwabClientChannel"),
+                    "SchwabClientFunctionId": self.streamer_info.get("schwabClientFunctionId")
+                }
+            }]
+        }
+        await self.websocket.send(json.dumps(login_request))
+        self.request_id += 1
+
+        while True:
+            data = json.loads(await asyncio.wait_for(self.websocket.recv(), self.supervisor.heartbeat_timeout))
+            for response in data.get("response", []):
+                if response.get("command") == "LOGIN":
+                    if response.get("content", {}).get("code") != 0:
+                        raise ConnectionError(f"Streamer login failed: {response.get('content')}")
+                    return
+            self._dispatch(data)
+
+
+    def _backfill(self):
+        """
+        Fetch the 1 minute bars missed while disconnected from price_history into the bar aggregator.
+        """
+        now = datetime.now()
+        for symbol in list(self.symbols):
+            latest = self.bars.latest(symbol)
+            if latest is None:
+                continue
+            # From the last bar seen, it was likely still forming when the connection dropped
+            start = latest["datetime"]
+            if now.timestamp() * 1000 - start < 120000:
+                continue
+            try:
+                response = self.schwab.price_history(symbol, periodType="day", frequencyType="minute", frequency=1,
+                                                     startDate=datetime.fromtimestamp(start / 1000), endDate=now,
+                                                     needExtendedHoursData=True)
+            except Exception as e:
+                print(f"Backfill for {symbol} failed: {e}")
+                continue
+            if not response.ok:
+                print(f"Backfill for {symbol} failed: {response.status_code}")
+                continue
+
+            for candle in response.json().get("candles", []):
+                if candle["datetime"] >= start:
+                    self.bars.update(symbol, candle["datetime"], candle["open"], candle["high"], candle["low"], candle["close"], candle["volume"])
+                    self.supervisor.backfilled += 1
 
 
     def start(self, *args, **kwargs):
         """
         
         """
-        if not self.active:
+        if self._thread is not None and self._thread.is_alive() and self._stopping:
+            # Stopped but still closing the socket or in its backoff, let it exit before starting over
+            self._thread.join(15)
+            if self._thread.is_alive():
+                # Keep the old supervisor running instead of ending up with no stream at all
+                self._stopping = False
+                print("Stream still stopping, kept running.")
+                return
+
+        if self._thread is None or not self._thread.is_alive():
+            self._stopping = False
+
             def _start_async():
                 asyncio.run(self._start_streamer(*args, **kwargs))
 
@@ -189,18 +304,65 @@ class Stream:
         
         """
         if clear_subscriptions:
-            self.subscriptions = {}
+            self.subscription_manager.clear()
+        self._stopping = True
         self.active = False
+        if self._loop is not None and self._thread is not None and self._thread.is_alive():
+            try:
+                self._loop.call_soon_threadsafe(self._wakeup.set)
+                if self.websocket is not None:
+                    asyncio.run_coroutine_threadsafe(self.websocket.close(), self._loop)
+            except RuntimeError:
+                # The loop closed in the meantime, the thread is already on its way out
+                pass
         self.request_id += 1
 
 
-    def send(self, requests):
+    def build_request(self, service, command, keys, fields):
         """
         
         """
-        async def _send(to_send):
-            await self.websocket.send(to_send)
+        self.request_id += 1
+        return {
+            "requestid": self.request_id,
+            "service": service,
+            "command": command,
+            "SchwabClientCustomerId": self.streamer_info.get("schwabClientCustomerId") if self.streamer_info else None,
+            "SchwabClientCorrelId": self.streamer_info.get("schwabClientCorrelId") if self.streamer_info else None,
+            "parameters": {
+                "keys": ",".join(keys) if type(keys) is list else keys,
+                "fields": ",".join(fields) if type(fields) is list else fields
+            }
+        }
+
 
+    def subscribe(self, service, keys, fields, owner=None):
+        """
+        Thread-safe, changes made close together are sent as one batched request.
+        """
+        self.subscription_manager.add(service, keys, fields, owner)
+
+
+    def unsubscribe(self, service, keys, owner=None):
+        """
+        Thread-safe, changes made close together are sent as one batched request. A key stays
+        subscribed while another owner still wants it.
+        """
+        self.subscription_manager.remove(service, keys, owner)
+
+
+    def _send_now(self, payload):
+        """
+        
+        """
+        # The websocket belongs to the streamer loop, so sends from other threads are scheduled onto it
+        asyncio.run_coroutine_threadsafe(self.websocket.send(json.dumps(payload)), self._loop)
+
+
+    def send(self, requests):
+        """
+        
+        """
         if type(requests) is not list:
             requests = [requests]
 
@@ -208,5 +370,4 @@ class Stream:
             self._record_request(request)
 
         if self.active:
-            to_send = json.dumps({"requests": requests})
-            asyncio.run(_send(to_send))
+            self._send_now({"requests": [r for request in requests for r in request["requests"]]})
@@ -0,0 +1,170 @@
+import json
+import asyncio
+import threading
+
+
+class SubscriptionManager:
+    """
+    Owns Stream.subscriptions and keeps the streamer in sync with it.
+
+    add()/remove() may be called from any thread. They update the desired
+    state right away and queue the difference. A flush scheduled on the streamer
+    loop with run_coroutine_threadsafe waits flush_interval so changes that
+    arrive together (e.g. a few hundred option contracts) go out as one
+    websocket message with one ADD per service and fields and one UNSUBS per
+    service. After a reconnect replay() sends the whole state with SUBS.
+
+    Keys are counted per owner (e.g. the position monitor and the chain cache
+    both want the same contract), a key is only unsubscribed once its last
+    owner removed it.
+    """
+    def __init__(self, stream, flush_interval=0.05):
+        self.stream = stream
+        self.flush_interval = flush_interval
+        self.pending = {}
+        self.owners = {}
+        self.batches = 0
+        self.requests = 0
+        self._lock = threading.Lock()
+        self._scheduled = False
+
+
+    @staticmethod
+    def _as_list(values):
+        if type(values) is str:
+            return [value for value in values.split(",") if value]
+        return list(values)
+
+
+    def _changes(self, service):
+        # "new" holds the pending adds of keys the streamer does not have yet
+        return self.pending.setdefault(service, {"add": {}, "remove": set(), "new": set()})
+
+
+    def add(self, service, keys, fields, owner=None):
+        """
+        :param keys: symbols, list or comma separated
+        :param fields: field numbers, list or comma separated
+        :param owner: who wants the keys, any hashable
+        """
+        fields = self._as_list(fields)
+        with self._lock:
+            subscribed = self.stream.subscriptions.setdefault(service, {})
+            owners = self.owners.setdefault(service, {})
+            changes = self._changes(service)
+            for key in self._as_list(keys):
+                owners.setdefault(key, set()).add(owner)
+                if key not in subscribed and key not in changes["remove"]:
+                    changes["new"].add(key)
+                changes["remove"].discard(key)
+                if subscribed.get(key) != fields:
+                    changes["add"][key] = fields
+                subscribed[key] = fields
+        self._schedule()
+
+
+    def remove(self, service, keys, owner=None):
+        """
+        Drop owner's interest in keys, the keys no one else wants are unsubscribed.
+        """
+        with self._lock:
+            subscribed = self.stream.subscriptions.get(service, {})
+            owners = self.owners.get(service, {})
+            changes = self._changes(service)
+            for key in self._as_list(keys):
+                if key in owners:
+                    owners[key].discard(owner)
+                    if owners[key]:
+                        continue
+                    del owners[key]
+                if key not in subscribed:
+                    continue
+                del subscribed[key]
+                changes["add"].pop(key, None)
+                # Never sent, nothing to undo on the streamer
+                if key in changes["new"]:
+                    changes["new"].discard(key)
+                else:
+                    changes["remove"].add(key)
+        self._schedule()
+
+
+    def clear(self):
+        """
+        Forget every subscription and owner, e.g. when the stream is stopped.
+        """
+        with self._lock:
+            self.stream.subscriptions.clear()
+            self.owners.clear()
+            self.pending = {}
+
+
+    def _schedule(self):
+        # While disconnected the state is only recorded, replay() sends it on login
+        if not self.stream.active or self.stream._loop is None:
+            return
+        with self._lock:
+            if self._scheduled:
+                return
+            self._scheduled = True
+        asyncio.run_coroutine_threadsafe(self._flush(), self.stream._loop)
+
+
+    def _group(self, keys):
+        # {key: fields} -> [(fields, [keys])], Schwab applies one field list per request
+        groups = {}
+        for key, fields in keys.items():
+            groups.setdefault(tuple(fields), []).append(key)
+        return list(groups.items())
+
+
+    async def _flush(self):
+        await asyncio.sleep(self.flush_interval)
+        with self._lock:
+            pending, self.pending = self.pending, {}
+            self._scheduled = False
+
+        requests = []
+        for service, changes in pending.items():
+            for fields, keys in self._group(changes["add"]):
+                requests.append(self.stream.build_request(service, "ADD", keys, list(fields)))
+            if changes["remove"]:
+                requests.append(self.stream.build_request(service, "UNSUBS", sorted(changes["remove"]), ""))
+        await self._send(requests)
+
+
+    async def replay(self):
+        """
+        Resubscribe everything after a (re)connect, called on the streamer loop right after login.
+        """
+        with self._lock:
+            self.pending = {}
+            self._scheduled = False
+            state = {service: dict(keys) for service, keys in self.stream.subscriptions.items() if keys}
+
+        requests = []
+        for service, keys in state.items():
+            for position, (fields, group) in enumerate(self._group(keys)):
+                # SUBS replaces the service's keys, so further field groups are added to it
+                requests.append(self.stream.build_request(service, "SUBS" if position == 0 else "ADD", group, list(fields)))
+        await self._send(requests)
+
+
+    async def _send(self, requests):
+        if not requests or self.stream.websocket is None:
+            return
+        await self.stream.websocket.send(json.dumps({"requests": requests}))
+        self.batches += 1
+        self.requests += len(requests)
+
+
+    def stats(self):
+        """
+        :return: websocket messages and requests sent, subscribed keys per service
+        :rtype: dict
+        """
+        return {
+            'batches': self.batches,
+            'requests': self.requests,
+            'keys': {service: len(keys) for service, keys in self.stream.subscriptions.items()}
+        }
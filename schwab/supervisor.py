@@ -0,0 +1,77 @@
+import time
+import random
+from collections import deque
+
+
+class StreamSupervisor:
+    """
+    Reconnect policy and connection health metrics for the Stream.
+
+    Failed connections are retried after a jittered exponential delay
+    (base_delay doubling up to max_delay, each wait drawn from 50-100% of it),
+    the attempt count resets once a connection stayed up healthy_after
+    seconds. Silence longer than heartbeat_timeout (Schwab sends a heartbeat
+    notify every ~10 s) counts as a dead connection.
+    """
+    def __init__(self, base_delay=1.0, max_delay=60.0, heartbeat_timeout=30.0, healthy_after=60.0):
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.heartbeat_timeout = heartbeat_timeout
+        self.healthy_after = healthy_after
+        self.attempt = 0
+        self.connections = 0
+        self.disconnects = 0
+        self.backfilled = 0
+        self.connected_at = None
+        self.disconnected_at = None
+        self.last_error = None
+        self.recovery_times = deque(maxlen=100)
+
+
+    def connected(self):
+        """
+        Logged in and resubscribed.
+        """
+        now = time.monotonic()
+        self.connections += 1
+        self.connected_at = now
+        if self.disconnected_at is not None:
+            self.recovery_times.append(now - self.disconnected_at)
+            print(f"Stream recovered in {now - self.disconnected_at:.1f} s after {self.disconnects} disconnects")
+            self.disconnected_at = None
+
+
+    def disconnected(self, error):
+        """
+        :return: seconds to wait before the next attempt
+        :rtype: float
+        """
+        now = time.monotonic()
+        if self.connected_at is not None:
+            self.disconnects += 1
+            if now - self.connected_at >= self.healthy_after:
+                self.attempt = 0
+            self.connected_at = None
+        if self.disconnected_at is None:
+            self.disconnected_at = now
+        self.last_error = repr(error)
+
+        delay = min(self.max_delay, self.base_delay * 2 ** self.attempt) * random.uniform(0.5, 1.0)
+        self.attempt += 1
+        return delay
+
+
+    def stats(self):
+        """
+        :rtype: dict
+        """
+        return {
+            'connections': self.connections,
+            'disconnects': self.disconnects,
+            'attempt': self.attempt,
+            'connected': self.connected_at is not None,
+            'backfilled_bars': self.backfilled,
+            'last_error': self.last_error,
+            'max_recovery_seconds': round(max(self.recovery_times), 3) if self.recovery_times else None,
+            'last_recovery_seconds': round(self.recovery_times[-1], 3) if self.recovery_times else None
+        }
@@ -0,0 +1,347 @@
+"""
+Offline replay of the alert -> contract -> exit logic of Client.
+
+    python -m strategy.backtest --alerts database/ledger.db --chains database/option_chains/snapshots \\
+        --symbol SPY --start 2024-01-02 --end 2024-12-31
+
+Alerts come from the ledger (or a CSV with timestamp,side[,code]), contracts
+are picked with ContractIndex from the chain snapshots ChainCache saves, and
+the option price between snapshots is the entry price moved by the
+contract's delta times the underlying's move in the stored 1 minute candles.
+"""
+import os
+import json
+import sqlite3
+import argparse
+import numpy as np
+import pandas as pd
+from database.candle_store import CandleStore, EASTERN
+from database.data_manager import DataManager
+from strategy.contract_index import ContractIndex
+
+SETTINGS_PATH = './setting/settings.txt'
+CONTRACT_MULTIPLIER = 100
+ALERT_DTYPE = np.dtype([('time', '<i8'), ('side', 'U4'), ('code', 'U16')])
+CONTRACT_DTYPE = np.dtype([('time', '<i8'), ('side', 'U4'), ('symbol', 'U32'), ('bid', '<f8'), ('ask', '<f8'),
+                           ('delta', '<f8'), ('oi', '<i8'), ('strike', '<f8'), ('expiration', '<M8[D]')])
+TRADE_DTYPE = np.dtype([('entry_time', '<i8'), ('exit_time', '<i8'), ('side', 'U4'), ('symbol', 'U32'), ('code', 'U16'),
+                        ('entry', '<f8'), ('exit', '<f8'), ('delta', '<f8'), ('quantity', '<i8'), ('pnl', '<f8'),
+                        ('reason', 'U8')])
+
+
+def load_settings(path=SETTINGS_PATH):
+    with open(path) as f:
+        return json.load(f)
+
+
+def loss_limit(max_loss_percentage):
+    """
+    The P&L percentage that stops a position out, converted the way Client.set_max_loss_percentage does.
+    """
+    return -abs(100 - max_loss_percentage)
+
+
+def load_alerts(path):
+    """
+    :param path: ledger database (signals table), .npy of ALERT_DTYPE, or CSV with timestamp,side[,code]
+    :return: alerts sorted by time, epoch milliseconds
+    :rtype: numpy.ndarray
+    """
+    if path.endswith('.db'):
+        connection = sqlite3.connect(path)
+        try:
+            rows = connection.execute("SELECT COALESCE(alert_time, received_at), side, COALESCE(code, '') FROM signals "
+                                      "WHERE side IS NOT NULL").fetchall()
+        finally:
+            connection.close()
+        alerts = np.array([(int(time * 1000), side, code) for time, side, code in rows], dtype=ALERT_DTYPE)
+    elif path.endswith('.npy'):
+        alerts = np.load(path)
+    else:
+        frame = pd.read_csv(path)
+        alerts = np.empty(len(frame), dtype=ALERT_DTYPE)
+        if pd.api.types.is_numeric_dtype(frame['timestamp']):
+            alerts['time'] = (frame['timestamp'].to_numpy(dtype=np.float64) * 1000).astype(np.int64)
+        else:
+            # Formatted timestamps are exchange time
+            stamps = pd.to_datetime(frame['timestamp'])
+            if stamps.dt.tz is None:
+                stamps = stamps.dt.tz_localize(EASTERN)
+            alerts['time'] = (stamps - pd.Timestamp(0, tz='UTC')) // pd.Timedelta(milliseconds=1)
+        alerts['side'] = frame['side'].str.upper()
+        alerts['code'] = frame['code'].fillna('') if 'code' in frame else ''
+    return alerts[np.argsort(alerts['time'], kind='stable')]
+
+
+class ChainSnapshots:
+    """
+    Option chain snapshots flattened into one CONTRACT_DTYPE table sorted by time and side.
+
+    at(side, time) is a binary search for the newest snapshot of that side no
+    older than max_age seconds, its ContractIndex is built on first use. The
+    table can be saved as .npy and memory-mapped back.
+    """
+    def __init__(self, table, max_age=300):
+        self.table = table
+        self.max_age = max_age
+        self.indexes = {}
+        self.sides = {}
+        for side in ('CALL', 'PUT'):
+            rows = np.flatnonzero(table['side'] == side)
+            times = table['time'][rows]
+            starts = np.flatnonzero(np.concatenate(([True], times[1:] != times[:-1]))) if len(rows) else np.empty(0, dtype=np.int64)
+            self.sides[side] = (rows, times[starts], np.append(starts, len(rows)))
+
+
+    @staticmethod
+    def to_table(chain, time):
+        """
+        :param chain: get_chains() json
+        :param time: snapshot time, epoch milliseconds
+        :rtype: numpy.ndarray
+        """
+        columns = DataManager.normalize_chain(chain, ContractIndex.COLUMNS)
+        table = np.empty(len(columns['Symbol']), dtype=CONTRACT_DTYPE)
+        table['time'] = time
+        for field, column in (('side', 'Put/Call'), ('symbol', 'Symbol'), ('bid', 'Bid'), ('ask', 'Ask'), ('delta', 'Delta'),
+                              ('oi', 'OI'), ('strike', 'Strike'), ('expiration', 'Expiration')):
+            table[field] = columns[column]
+        return table
+
+
+    @classmethod
+    def from_directory(cls, directory, max_age=300):
+        """
+        Load the <epoch ms>_<side>.json files ChainCache writes, any depth below directory.
+        """
+        tables = []
+        for root, _, names in os.walk(directory):
+            for name in names:
+                if not name.endswith('.json'):
+                    continue
+                with open(os.path.join(root, name)) as f:
+                    tables.append(cls.to_table(json.load(f), int(name.split('_')[0])))
+        table = np.concatenate(tables) if tables else np.empty(0, dtype=CONTRACT_DTYPE)
+        return cls(table[np.lexsort((table['side'], table['time']))], max_age)
+
+
+    def save(self, path):
+        np.save(path, self.table)
+
+
+    @classmethod
+    def load(cls, path, max_age=300, mmap_mode=None):
+        return cls(np.load(path, mmap_mode=mmap_mode), max_age)
+
+
+    def at(self, side, time):
+        """
+        :return: ContractIndex of the newest snapshot at or before time, None if there is none recent enough
+        :rtype: ContractIndex
+        """
+        rows, times, bounds = self.sides[side]
+        position = np.searchsorted(times, time, side='right') - 1
+        if position < 0 or time - times[position] > self.max_age * 1000:
+            return None
+        key = (side, position)
+        index = self.indexes.get(key)
+        if index is None:
+            snapshot = self.table[rows[bounds[position]:bounds[position + 1]]]
+            index = self.indexes[key] = ContractIndex({'Put/Call': snapshot['side'], 'Symbol': snapshot['symbol'],
+                                                       'Bid': snapshot['bid'], 'Ask': snapshot['ask'],
+                                                       'Delta': snapshot['delta'], 'OI': snapshot['oi'],
+                                                       'Expiration': snapshot['expiration'], 'Strike': snapshot['strike']})
+        return index
+
+
+class Backtester:
+    """
+    Replays alerts through the Client flip: an alert on the side already held is
+    ignored, any other alert closes the open position at market and buys the
+    contract best_contract would pick, and an open position exits at the first
+    candle whose range crosses the profit target or loss limit.
+
+    Each holding period is one vectorized scan of the candles between entry
+    and the next alert (or expiration), so the Python loop only runs once per
+    alert. Both thresholds inside one candle count as the loss, a candle that
+    opens past a threshold exits at its open, and 0DTE contracts still held at
+    the 16:00 ET close settle at intrinsic value.
+    """
+    def __init__(self, candles, snapshots, bar_ms=60000):
+        """
+        :param candles: underlying candles as a CANDLE_DTYPE array, e.g. CandleStore.query()
+        :type candles: numpy.ndarray
+        :type snapshots: ChainSnapshots
+        """
+        self.candles = candles
+        self.times = np.asarray(candles['datetime'])
+        self.snapshots = snapshots
+        self.bar_ms = bar_ms
+        self.expirations = {}
+
+
+    def _bars_before(self, time):
+        # Candles that closed by time
+        return int(np.searchsorted(self.times, time - self.bar_ms, side='right'))
+
+
+    def _open(self, alert, contract, quantity):
+        end = self._bars_before(alert['time'])
+        if end == 0:
+            return None
+        expiration = self.expirations.get(contract['Expiration'])
+        if expiration is None:
+            # 16:00 ET on the expiration date
+            stamp = pd.Timestamp(contract['Expiration'], tz=EASTERN) + pd.Timedelta(hours=16)
+            expiration = self.expirations[contract['Expiration']] = int(stamp.timestamp() * 1000)
+        return {'entry_time': alert['time'], 'side': alert['side'], 'symbol': contract['Symbol'], 'code': alert['code'],
+                'entry': contract['Ask'], 'delta': contract['Delta'], 'strike': contract['Strike'], 'quantity': quantity,
+                'underlying': self.candles['close'][end - 1], 'next': end,
+                'expiration': expiration}
+
+
+    def _value(self, position, price):
+        return max(0.0, position['entry'] + position['delta'] * (price - position['underlying']))
+
+
+    def _scan(self, position, until, profit, loss):
+        """
+        Run an open position forward to until (epoch ms).
+        :return: (exit time, exit price, reason), None if it is still open at until
+        :rtype: tuple
+        """
+        stop = min(until, position['expiration'])
+        end = max(self._bars_before(stop), position['next'])
+        segment = self.candles[position['next']:end]
+        position['next'] = end
+
+        if len(segment) and position['entry'] > 0:
+            scale = position['delta'] / position['entry'] * 100
+            best, worst = (segment['high'], segment['low']) if scale > 0 else (segment['low'], segment['high'])
+            # Option value floors at zero, so the percentage never drops below -100
+            best_pct = (best - position['underlying']) * scale
+            worst_pct = np.maximum((worst - position['underlying']) * scale, -100.0)
+            hits = (best_pct >= profit) | (worst_pct <= loss)
+            if hits.any():
+                bar = int(np.argmax(hits))
+                open_pct = max((segment['open'][bar] - position['underlying']) * scale, -100.0)
+                if worst_pct[bar] <= loss:
+                    pct, reason = (open_pct if open_pct <= loss else loss), 'loss'
+                else:
+                    pct, reason = (open_pct if open_pct >= profit else profit), 'profit'
+                return int(segment['datetime'][bar]), position['entry'] * (1 + pct / 100), reason
+
+        if until >= position['expiration'] and end:
+            underlying = self.candles['close'][end - 1]
+            intrinsic = underlying - position['strike'] if position['side'] == 'CALL' else position['strike'] - underlying
+            return position['expiration'], max(0.0, intrinsic), 'expired'
+        return None
+
+
+    @staticmethod
+    def _trade(position, exit_time, exit_price, reason):
+        pnl = (exit_price - position['entry']) * position['quantity'] * CONTRACT_MULTIPLIER
+        return (position['entry_time'], exit_time, position['side'], position['symbol'], position['code'], position['entry'],
+                round(exit_price, 4), position['delta'], position['quantity'], pnl, reason)
+
+
+    def run(self, alerts, settings):
+        """
+        :param alerts: ALERT_DTYPE array sorted by time, see load_alerts()
+        :param settings: settings.txt values, max_profit_percentage, max_loss_percentage, max_contract_price,
+                         least_delta, max_position_size and optionally contract_rank_mode
+        :type settings: dict
+        :return: TRADE_DTYPE array and counters of the alerts that did not trade
+        :rtype: tuple
+        """
+        profit = float(settings['max_profit_percentage'])
+        loss = loss_limit(float(settings['max_loss_percentage']))
+        least_delta = float(settings['least_delta'])
+        max_price = float(settings['max_contract_price'])
+        quantity = int(settings.get('max_position_size', 1))
+        mode = settings.get('contract_rank_mode', 'closest_delta')
+
+        trades = []
+        counters = {'ignored': 0, 'no_chain': 0, 'no_contract': 0}
+        position = None
+        for alert in alerts:
+            if position is not None:
+                exit = self._scan(position, alert['time'], profit, loss)
+                if exit is not None:
+                    trades.append(self._trade(position, *exit))
+                    position = None
+
+            # The held side is ignored, every other alert flips
+            if position is not None and position['side'] == alert['side']:
+                counters['ignored'] += 1
+                continue
+            if position is not None:
+                end = position['next']
+                trades.append(self._trade(position, alert['time'], self._value(position, self.candles['close'][end - 1]), 'flip'))
+                position = None
+
+            index = self.snapshots.at(alert['side'], alert['time'])
+            if index is None:
+                counters['no_chain'] += 1
+                continue
+            contract = index.first(alert['side'], least_delta, max_price, mode=mode)
+            if contract is None:
+                counters['no_contract'] += 1
+                continue
+            position = self._open(alert, contract, quantity)
+
+        if position is not None:
+            exit = self._scan(position, int(self.times[-1]) + self.bar_ms, profit, loss)
+            if exit is None:
+                exit = (int(self.times[-1]) + self.bar_ms, self._value(position, self.candles['close'][-1]), 'end')
+            trades.append(self._trade(position, *exit))
+        return np.array(trades, dtype=TRADE_DTYPE), counters
+
+
+    @staticmethod
+    def summary(trades, counters=None):
+        """
+        :rtype: dict
+        """
+        pnl = trades['pnl']
+        equity = np.cumsum(pnl)
+        gains, losses = pnl[pnl > 0].sum(), -pnl[pnl < 0].sum()
+        summary = {
+            'trades': len(trades),
+            'wins': int((pnl > 0).sum()),
+            'win_rate': round(float((pnl > 0).mean()), 4) if len(trades) else 0.0,
+            'pnl': round(float(pnl.sum()), 2),
+            'average_pnl': round(float(pnl.mean()), 2) if len(trades) else 0.0,
+            'max_drawdown': round(float((np.maximum.accumulate(np.append(0, equity)) - np.append(0, equity)).max()), 2),
+            'profit_factor': round(float(gains / losses), 3) if losses else None,
+            'exits': {str(reason): int(count) for reason, count in zip(*np.unique(trades['reason'], return_counts=True))}
+        }
+        summary.update(counters or {})
+        return summary
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--alerts', required=True, help='ledger .db, alerts .npy or CSV')
+    parser.add_argument('--chains', required=True, help='ChainCache snapshot directory or a saved snapshot table (.npy)')
+    parser.add_argument('--symbol', default='SPY')
+    parser.add_argument('--start')
+    parser.add_argument('--end')
+    parser.add_argument('--settings', default=SETTINGS_PATH)
+    parser.add_argument('--max-age', type=float, default=300, help='oldest usable chain snapshot, seconds')
+    parser.add_argument('--output', help='write the trades to this CSV')
+    args = parser.parse_args()
+
+    if args.chains.endswith('.npy'):
+        snapshots = ChainSnapshots.load(args.chains, args.max_age)
+    else:
+        snapshots = ChainSnapshots.from_directory(args.chains, args.max_age)
+    candles = CandleStore(DataManager.CANDLE_STORE_PATH).query(args.symbol, '1m', args.start, args.end)
+    alerts = load_alerts(args.alerts)
+    if len(candles):
+        alerts = alerts[(alerts['time'] >= candles['datetime'][0]) & (alerts['time'] <= candles['datetime'][-1])]
+
+    trades, counters = Backtester(candles, snapshots).run(alerts, load_settings(args.settings))
+    print(json.dumps(Backtester.summary(trades, counters), indent=4))
+    if args.output:
+        pd.DataFrame(trades).to_csv(args.output, index=False)
@@ -0,0 +1,137 @@
+import threading
+import numpy as np
+
+
+class ContractIndex:
+    """
+    Option contracts grouped by side and expiration, each group sorted by |delta| then ask.
+
+    "First contract with |delta| >= X and ask <= Y" is a binary search for X followed
+    by one vectorized scan of the asks past that point, so scanning several
+    expirations or symbols on a signal stays cheap. Quote updates are written in
+    place and the affected group is re-sorted lazily on its next query. One lock
+    covers updates (stream thread) and queries with their re-sort (trade threads),
+    so a quote never lands on a row that is being moved.
+    """
+    COLUMNS = ['Put/Call', 'Symbol', 'Bid', 'Ask', 'Delta', 'OI', 'Expiration', 'Strike']
+    RANK_MODES = ('closest_delta', 'tightest_spread', 'highest_oi')
+    ARRAYS = ('Symbol', 'Bid', 'Ask', 'Delta', 'OI', 'Strike')
+
+    def __init__(self, columns):
+        """
+        :param columns: normalized chain from DataManager.normalize_chain() with at least COLUMNS
+        :type columns: dict
+        """
+        self.groups = {}
+        self.positions = {}
+        self._dirty = set()
+        self._lock = threading.Lock()
+
+        sides = np.asarray(columns['Put/Call'])
+        expirations = np.asarray(columns['Expiration'])
+        for side in np.unique(sides):
+            for expiration in np.unique(expirations[sides == side]):
+                selected = (sides == side) & (expirations == expiration)
+                key = (side, expiration)
+                self.groups[key] = {name: np.asarray(columns[name])[selected] for name in self.ARRAYS}
+                self._sort(key)
+
+        # Nearest expiration first so ties go to the front month
+        self.groups = dict(sorted(self.groups.items(), key=lambda item: (item[0][0], item[0][1])))
+
+
+    @property
+    def symbols(self):
+        return list(self.positions)
+
+
+    def _sort(self, key):
+        group = self.groups[key]
+        delta = group['Delta']
+        # Schwab reports unknown greeks as -999, those contracts sort last and never match
+        abs_delta = np.where(np.isfinite(delta) & (np.abs(delta) <= 1), np.abs(delta), np.nan)
+        order = np.lexsort((group['Ask'], abs_delta))
+        for name in self.ARRAYS:
+            group[name] = group[name][order]
+        group['AbsDelta'] = abs_delta[order]
+        for position, symbol in enumerate(group['Symbol']):
+            self.positions[symbol] = (key, position)
+        self._dirty.discard(key)
+
+
+    def update(self, symbol, values):
+        """
+        Write new quote values for one contract, e.g. {"Bid": 0.5, "Ask": 0.55, "Delta": 0.21}.
+        """
+        with self._lock:
+            located = self.positions.get(symbol)
+            if located is None:
+                return
+            key, position = located
+            group = self.groups[key]
+            for name, value in values.items():
+                if name in group:
+                    group[name][position] = value
+            if 'Delta' in values or 'Ask' in values:
+                self._dirty.add(key)
+
+
+    def first(self, side, min_delta, max_ask, expiration=None, mode='closest_delta'):
+        """
+        Best contract with |delta| >= min_delta and ask <= max_ask.
+        :param side: "CALL"|"PUT"
+        :type side: str
+        :param expiration: only search this expiration ("YYYY-MM-DD"), all of them by default
+        :type expiration: str
+        :param mode: ranking among matches ("closest_delta"|"tightest_spread"|"highest_oi")
+        :type mode: str
+        :return: contract as {"Symbol", "Bid", "Ask", "Delta", "OI", "Strike", "Expiration"}, None if nothing matches
+        :rtype: dict
+        """
+        if mode not in self.RANK_MODES:
+            raise ValueError(f"Unsupported rank mode: {mode}")
+        if expiration is not None:
+            expiration = np.datetime64(expiration, 'D')
+        with self._lock:
+            return self._first(side, min_delta, max_ask, expiration, mode)
+
+
+    def _first(self, side, min_delta, max_ask, expiration, mode):
+        best = None
+        best_score = None
+        for key in self.groups:
+            if key[0] != side or (expiration is not None and key[1] != expiration):
+                continue
+            if key in self._dirty:
+                self._sort(key)
+            group = self.groups[key]
+
+            start = np.searchsorted(group['AbsDelta'], abs(min_delta), side='left')
+            ask = group['Ask'][start:]
+            matches = (ask <= max_ask) & np.isfinite(group['AbsDelta'][start:])
+            if not matches.any():
+                continue
+
+            if mode == 'closest_delta':
+                position = int(np.argmax(matches))
+                score = (group['AbsDelta'][start + position], ask[position])
+            elif mode == 'tightest_spread':
+                spread = np.where(matches, ask - group['Bid'][start:], np.inf)
+                position = int(np.argmin(spread))
+                score = (spread[position],)
+            else:
+                open_interest = np.where(matches, group['OI'][start:], -1)
+                position = int(np.argmax(open_interest))
+                score = (-open_interest[position],)
+
+            if best_score is None or score < best_score:
+                best = (key, start + position)
+                best_score = score
+
+        if best is None:
+            return None
+        key, position = best
+        contract = {name: self.groups[key][name][position].item() if name != 'Symbol' else self.groups[key][name][position]
+                    for name in self.ARRAYS}
+        contract['Expiration'] = str(key[1])
+        return contract
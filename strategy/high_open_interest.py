@@ -1,10 +1,175 @@
-import yfinance as yf
-import matplotlib.pyplot as plt
+import time
+import threading
+import numpy as np
+import pandas as pd
 from setting.dates import dates
 from datetime import datetime
+from database.data_manager import DataManager
+
+SYMBOL = 'SPY'
+# After this (local) time the levels of the next expiration matter more than today's
+CUTOFF_HOUR, CUTOFF_MINUTE = 13, 15
+
+
+def expiration(now=None):
+    """
+    :return: the expiration the levels are tracked for, "YYYY-MM-DD"
+    :rtype: str
+    """
+    now = now or datetime.now()
+    today_exp, tomorrow_exp = dates()
+    cutoff_time = now.replace(hour=CUTOFF_HOUR, minute=CUTOFF_MINUTE, second=0, microsecond=0)
+    return tomorrow_exp if now >= cutoff_time else today_exp
+
+
+def top_levels(strikes, open_interest, count=5):
+    """
+    :return: the count strikes with the most open interest as (strike, open interest), highest first,
+             open interest of a strike listed under several expirations is summed
+    :rtype: list
+    """
+    if not len(strikes):
+        return []
+    unique, inverse = np.unique(strikes, return_inverse=True)
+    totals = np.bincount(inverse, weights=open_interest)
+    count = min(count, len(unique))
+    # argpartition finds the top count in linear time, only those few get sorted
+    top = np.argpartition(totals, -count)[-count:]
+    top = top[np.lexsort((unique[top], -totals[top]))]
+    return [(float(unique[i]), int(totals[i])) for i in top]
+
+
+def flatten(levels):
+    """
+    [(strike, oi), ...] -> [strike1, oi1, strike2, oi2, ...] as the high_oi files store them.
+    """
+    return [value for level in levels for value in level]
+
+
+class OpenInterestLevels:
+    """
+    Highest open interest strikes per side, kept current by a background refresh.
+
+    loader() returns a get_chains() json (both sides) for the tracked
+    expiration, refresh(chain) also accepts a chain fetched elsewhere, e.g. a
+    ChainCache snapshot. OCC only publishes open interest once a day, so most
+    refreshes find the same levels; only a change is appended to the high_oi
+    history files and passed to on_update(calls, puts). A chain without any
+    open interest (e.g. an error payload) leaves the levels as they are,
+    refresh errors go to log_signal when given.
+    """
+    COLUMNS = ['Put/Call', 'Strike', 'OI']
+
+    def __init__(self, loader, count=5, refresh_interval=300, on_update=None, persist=True, log_signal=None):
+        self.loader = loader
+        self.log_signal = log_signal
+        self.count = count
+        self.refresh_interval = refresh_interval
+        self.on_update = on_update
+        self.persist = persist
+        self.calls = []
+        self.puts = []
+        self.updated = None
+        self.refreshes = 0
+        self.changes = 0
+        self.ready = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+
+    @property
+    def call_strikes(self):
+        return flatten(self.calls)
+
+
+    @property
+    def put_strikes(self):
+        return flatten(self.puts)
+
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            if not self._stop.is_set():
+                return
+            # Stopped but still finishing a refresh, let it end before starting over
+            self._thread.join()
+        self._stop.clear()
+
+        def refresher():
+            while not self._stop.is_set():
+                try:
+                    self.refresh()
+                except Exception as e:
+                    message = f"Error refreshing open interest levels, keeping the last ones: {e}"
+                    if self.log_signal is not None:
+                        self.log_signal.emit(message)
+                    else:
+                        print(message)
+                self._stop.wait(self.refresh_interval)
+        self._thread = threading.Thread(target=refresher, daemon=True)
+        self._thread.start()
+
+
+    def stop(self):
+        self._stop.set()
+
+
+    def refresh(self, chain=None):
+        """
+        :param chain: get_chains() json, loaded with loader() if None
+        :type chain: dict
+        :return: True if the levels changed
+        :rtype: bool
+        :raises ValueError: no open interest on either side
+        """
+        chain = chain if chain is not None else self.loader()
+        columns = DataManager.normalize_chain(chain, self.COLUMNS)
+        sides = columns['Put/Call']
+        calls = top_levels(columns['Strike'][sides == 'CALL'], columns['OI'][sides == 'CALL'], self.count)
+        puts = top_levels(columns['Strike'][sides == 'PUT'], columns['OI'][sides == 'PUT'], self.count)
+        if not calls and not puts:
+            raise ValueError(f"No open interest in the chain response: {str(chain)[:200]}")
+
+        self.refreshes += 1
+        self.updated = time.time()
+        changed = calls != self.calls or puts != self.puts
+        if changed:
+            self.calls, self.puts = calls, puts
+            self.changes += 1
+            if self.persist:
+                DataManager.store_data('high_oi_calls', DataManager.create_dataframe('high_oi', self.call_strikes), None)
+                DataManager.store_data('high_oi_puts', DataManager.create_dataframe('high_oi', self.put_strikes), None)
+            if self.on_update is not None:
+                self.on_update(calls, puts)
+        self.ready.set()
+        return changed
+
+
+    @staticmethod
+    def history(type):
+        """
+        :param type: "CALL"|"PUT"
+        :return: every stored change of the levels, Datetime parsed
+        :rtype: pandas.DataFrame
+        """
+        df = DataManager.load_data('high_oi_calls' if type == 'CALL' else 'high_oi_puts')
+        if len(df):
+            df['Datetime'] = pd.to_datetime(df['Datetime'], format='mixed')
+        return df
+
+
+    def stats(self):
+        return {
+            'refreshes': self.refreshes,
+            'changes': self.changes,
+            'age': round(time.time() - self.updated, 1) if self.updated is not None else None
+        }
+
 
 def retrieveData():
-    SYMBOL = 'SPY'
+    """
+    One-shot yfinance levels, kept for running without a Schwab session.
+    """
     call_data, put_data = _GetOptionsData(SYMBOL)
     # _PlotHighestOILevels(call_data, put_data, SYMBOL)
     return _SortedData(call_data, put_data)
@@ -12,40 +177,23 @@ def retrieveData():
 
 # Retrieve options data for a given symbol
 def _GetOptionsData(symbol):
-    today_exp, tomorrow_exp = dates()
-
-    current_time = datetime.now()
-    cutoff_time = current_time.replace(hour=13, minute=15, second=0, microsecond=0)
+    import yfinance as yf
 
-    if current_time >= cutoff_time:
-        options = yf.Ticker(symbol).option_chain(tomorrow_exp)
-    
-    else: 
-        options = yf.Ticker(symbol).option_chain(today_exp)
-    
+    options = yf.Ticker(symbol).option_chain(expiration())
     return options.calls, options.puts
 
 
-# Sort the strikes levels and return the 5 highest volumes
-# TPossibly turn this into a dataframe instead
+# Top 5 strike levels by open interest
 def _SortedData(call_data, put_data):
-    call_data_sorted = call_data.sort_values(by='openInterest', ascending=False)
-    put_data_sorted = put_data.sort_values(by='openInterest', ascending=False)
-
-    call_strikes = []
-    put_strikes = []
-
-    for i in range(5):
-        call_strikes.append(call_data_sorted.iloc[i]['strike'])
-        call_strikes.append(call_data_sorted.iloc[i]['openInterest'])
-        put_strikes.append(put_data_sorted.iloc[i]['strike'])
-        put_strikes.append(put_data_sorted.iloc[i]['openInterest'])
-
-    return call_strikes, put_strikes
+    calls = call_data.nlargest(5, 'openInterest')
+    puts = put_data.nlargest(5, 'openInterest')
+    return flatten(zip(calls['strike'], calls['openInterest'])), flatten(zip(puts['strike'], puts['openInterest']))
 
 
 # Plothighest OI levels
 def _PlotHighestOILevels(call_data, put_data, symbol):
+    import matplotlib.pyplot as plt
+
     fig, ax = plt.subplots()
     call_data_sorted = call_data.sort_values(by='openInterest', ascending=False)
     put_data_sorted = put_data.sort_values(by='openInterest', ascending=False)
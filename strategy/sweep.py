@@ -0,0 +1,239 @@
+"""
+Grid or random search of the exit and contract settings over the backtester.
+
+    python -m strategy.sweep --alerts database/ledger.db --chains database/option_chains/snapshots \\
+        --grid max_profit_percentage=20,30,40,50 --grid max_loss_percentage=20,30,50 --random 200
+    python -m strategy.sweep ... --apply 1
+
+Candles, alerts and the chain snapshot table are saved once as .npy files
+and memory-mapped by every worker process, so nothing large is pickled per
+task. Each result is cached under the parameter hash (per data set), a rerun
+only evaluates the points it has not seen.
+"""
+import os
+import json
+import random
+import hashlib
+import argparse
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from database.candle_store import CandleStore
+from database.data_manager import DataManager
+from strategy.backtest import Backtester, ChainSnapshots, load_alerts, load_settings, SETTINGS_PATH
+
+# Swept settings -> (low, high) for random search, the bounds set_settings accepts
+PARAMETERS = {
+    'max_profit_percentage': (5.0, 200.0),
+    'max_loss_percentage': (0.0, 100.0),
+    'max_contract_price': (0.05, 5.0),
+    'least_delta': (0.05, 0.8)
+}
+
+_backtester = None
+_alerts = None
+
+
+def _initialize(directory, max_age):
+    # Worker process setup, the arrays stay memory-mapped for the life of the pool
+    global _backtester, _alerts
+    candles = np.load(os.path.join(directory, 'candles.npy'), mmap_mode='r')
+    snapshots = ChainSnapshots.load(os.path.join(directory, 'chains.npy'), max_age, mmap_mode='r')
+    _alerts = np.load(os.path.join(directory, 'alerts.npy'), mmap_mode='r')
+    _backtester = Backtester(candles, snapshots)
+
+
+def _evaluate(settings):
+    trades, counters = _backtester.run(_alerts, settings)
+    return Backtester.summary(trades, counters)
+
+
+class SweepRunner:
+    """
+    Evaluates settings combinations on a process pool, caching every result by parameter hash.
+    """
+    def __init__(self, candles, alerts, snapshots, base_settings=None, directory='./database/sweeps', max_workers=None):
+        """
+        :param candles: CANDLE_DTYPE array of the underlying
+        :param alerts: ALERT_DTYPE array
+        :type snapshots: ChainSnapshots
+        :param base_settings: settings.txt values for everything that is not swept
+        :type base_settings: dict
+        """
+        self.base_settings = base_settings if base_settings is not None else load_settings()
+        self.max_workers = max_workers
+        self.max_age = snapshots.max_age
+
+        # One data directory per data set, so cached results never mix between data sets
+        digest = hashlib.sha1()
+        for array in (candles, alerts, snapshots.table):
+            digest.update(np.ascontiguousarray(array).tobytes())
+        digest.update(str(self.max_age).encode())
+        self.directory = os.path.join(directory, digest.hexdigest()[:16])
+        os.makedirs(self.directory, exist_ok=True)
+        for name, array in (('candles', candles), ('alerts', alerts), ('chains', snapshots.table)):
+            path = os.path.join(self.directory, f"{name}.npy")
+            if not os.path.exists(path):
+                np.save(path, array)
+
+        self.cache_path = os.path.join(self.directory, 'results.jsonl')
+        self.cache = {}
+        if os.path.exists(self.cache_path):
+            with open(self.cache_path) as f:
+                for line in f:
+                    entry = json.loads(line)
+                    self.cache[entry['key']] = entry
+
+
+    @staticmethod
+    def grid(values):
+        """
+        :param values: setting name -> list of values
+        :type values: dict
+        :return: every combination
+        :rtype: list
+        """
+        points = [{}]
+        for name, options in values.items():
+            points = [dict(point, **{name: option}) for point in points for option in options]
+        return points
+
+
+    @staticmethod
+    def sample(count, bounds=None, seed=None):
+        """
+        :param bounds: setting name -> (low, high), PARAMETERS by default
+        :return: count random points, prices and deltas rounded to cents, percentages to whole numbers
+        :rtype: list
+        """
+        bounds = bounds or PARAMETERS
+        rng = random.Random(seed)
+        return [{name: round(rng.uniform(low, high), 0 if name.endswith('percentage') else 2) for name, (low, high) in bounds.items()}
+                for _ in range(count)]
+
+
+    def settings_for(self, point):
+        settings = dict(self.base_settings)
+        settings.update(point)
+        return settings
+
+
+    def key(self, point):
+        settings = self.settings_for(point)
+        relevant = {name: settings.get(name) for name in sorted(set(PARAMETERS) | {'max_position_size', 'contract_rank_mode'})}
+        # 30 and 30.0 are the same setting, hash one numeric type per parameter
+        for name in PARAMETERS:
+            if relevant[name] is not None:
+                relevant[name] = float(relevant[name])
+        if relevant['max_position_size'] is not None:
+            relevant['max_position_size'] = int(relevant['max_position_size'])
+        return hashlib.sha1(json.dumps(relevant, sort_keys=True).encode()).hexdigest()
+
+
+    def run(self, points, progress=None, rank='pnl'):
+        """
+        :param points: list of {setting: value}, see grid() and sample()
+        :param progress: callable(completed, total) after every point
+        :param rank: summary column the table is sorted by, best first
+        :return: one row per point
+        :rtype: pandas.DataFrame
+        """
+        keys = {}
+        pending = {}
+        for point in points:
+            key = self.key(point)
+            keys[key] = point
+            if key not in self.cache:
+                pending[key] = point
+
+        completed = len(keys) - len(pending)
+        if pending:
+            with ProcessPoolExecutor(max_workers=self.max_workers, initializer=_initialize,
+                                     initargs=(self.directory, self.max_age)) as executor, open(self.cache_path, 'a') as cache:
+                futures = {executor.submit(_evaluate, self.settings_for(point)): key for key, point in pending.items()}
+                for future in as_completed(futures):
+                    key = futures[future]
+                    settings = self.settings_for(pending[key])
+                    entry = {'key': key, 'parameters': {name: settings.get(name) for name in PARAMETERS}, 'summary': future.result()}
+                    self.cache[key] = entry
+                    cache.write(json.dumps(entry) + '\n')
+                    cache.flush()
+                    completed += 1
+                    if progress is not None:
+                        progress(completed, len(keys))
+        return self.table([self.cache[key] for key in keys], rank)
+
+
+    @staticmethod
+    def table(entries, rank='pnl'):
+        rows = []
+        for entry in entries:
+            row = dict(entry['parameters'])
+            row.update({name: value for name, value in entry['summary'].items() if not isinstance(value, dict)})
+            rows.append(row)
+        frame = pd.DataFrame(rows)
+        if len(frame):
+            frame = frame.sort_values(rank, ascending=False, kind='stable').reset_index(drop=True)
+            frame.index += 1
+            frame.index.name = 'rank'
+        return frame
+
+
+    @staticmethod
+    def apply(row, path=SETTINGS_PATH):
+        """
+        Write the swept parameters of one result row into settings.txt, everything else is kept.
+        :param row: a row of run() / table(), e.g. table.loc[1]
+        """
+        settings = load_settings(path)
+        for name in PARAMETERS:
+            if name in row and pd.notna(row[name]):
+                settings[name] = float(row[name])
+        with open(path, 'w') as f:
+            json.dump(settings, f, indent=4)
+        return settings
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--alerts', required=True, help='ledger .db, alerts .npy or CSV')
+    parser.add_argument('--chains', required=True, help='ChainCache snapshot directory or a saved snapshot table (.npy)')
+    parser.add_argument('--symbol', default='SPY')
+    parser.add_argument('--start')
+    parser.add_argument('--end')
+    parser.add_argument('--settings', default=SETTINGS_PATH)
+    parser.add_argument('--max-age', type=float, default=300, help='oldest usable chain snapshot, seconds')
+    parser.add_argument('--grid', action='append', default=[], help='name=v1,v2,... repeatable, unswept names keep their setting')
+    parser.add_argument('--random', type=int, default=0, help='random points within PARAMETERS')
+    parser.add_argument('--seed', type=int)
+    parser.add_argument('--workers', type=int)
+    parser.add_argument('--rank', default='pnl')
+    parser.add_argument('--top', type=int, default=20)
+    parser.add_argument('--output', help='write the ranked table to this CSV')
+    parser.add_argument('--apply', type=int, help='write the parameters of this rank into --settings')
+    args = parser.parse_args()
+
+    if args.chains.endswith('.npy'):
+        snapshots = ChainSnapshots.load(args.chains, args.max_age)
+    else:
+        snapshots = ChainSnapshots.from_directory(args.chains, args.max_age)
+    candles = np.asarray(CandleStore(DataManager.CANDLE_STORE_PATH).query(args.symbol, '1m', args.start, args.end))
+    alerts = load_alerts(args.alerts)
+    if len(candles):
+        alerts = alerts[(alerts['time'] >= candles['datetime'][0]) & (alerts['time'] <= candles['datetime'][-1])]
+
+    points = SweepRunner.grid({name: [float(value) for value in values.split(',')]
+                               for name, values in (spec.split('=', 1) for spec in args.grid)}) if args.grid else []
+    points += SweepRunner.sample(args.random, seed=args.seed)
+    runner = SweepRunner(candles, alerts, snapshots, load_settings(args.settings), max_workers=args.workers)
+
+    def progress(completed, total):
+        print(f"\r{completed}/{total} points", end='' if completed < total else '\n', flush=True)
+
+    table = runner.run(points, progress, args.rank)
+    with pd.option_context('display.width', 200, 'display.max_columns', 20):
+        print(table.head(args.top))
+    if args.output:
+        table.to_csv(args.output)
+    if args.apply:
+        print(f"Applied rank {args.apply}: {SweepRunner.apply(table.loc[args.apply], args.settings)}")